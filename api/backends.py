@@ -0,0 +1,268 @@
+import math
+
+from django_elasticsearch_dsl_drf.filter_backends import FacetedSearchFilterBackend
+from elasticsearch_dsl import Q
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+from apps.catalogue.attribute_schema import get_schema_for_slug
+from apps.catalogue.documents import ATTRIBUTE_VALUE_FIELDS
+
+FACETS_QUERY_PARAM = 'facets'
+FACETS_ACTION = 'facets'
+COMPACT_VIEW = 'compact'
+# Upper bound of ?radius= (km)
+MAX_RADIUS_KM = 500
+
+
+def _split(value):
+    return [item for item in value.split(',') if item]
+
+
+def facets_enabled(request, view):
+    """
+    Aggregations are computed unless the hits request opts out with
+    ?facets=false; the facets-only action always computes them.
+    """
+    if getattr(view, 'action', None) == FACETS_ACTION:
+        return True
+    return request.query_params.get(FACETS_QUERY_PARAM, '').lower() not in ('0', 'false', 'no', 'off')
+
+
+def _parse_number(params, name, minimum, maximum, include_minimum=True):
+    """Finite float query param within [minimum, maximum] (or (minimum, maximum]); None if not given."""
+    value = params.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        number = float(value)
+    except ValueError:
+        number = math.nan
+    in_range = (minimum <= number if include_minimum else minimum < number) and number <= maximum
+    if not (math.isfinite(number) and in_range):
+        low = '[' if include_minimum else '('
+        raise ValidationError({name: f"Must be a number in {low}{minimum}, {maximum}]."})
+    return number
+
+
+def get_geo_params(request):
+    """
+    Returns (point, radius_km) from the `lat`, `lon` and `radius` query
+    params. point is None when lat/lon are not given; radius_km is None
+    when no radius limit was requested. Invalid values (out of range, NaN,
+    infinite, 0 < radius <= MAX_RADIUS_KM) raise ValidationError (400)
+    instead of reaching Elasticsearch.
+    """
+    params = request.query_params
+    lat = _parse_number(params, 'lat', -90, 90)
+    lon = _parse_number(params, 'lon', -180, 180)
+    radius = _parse_number(params, 'radius', 0, MAX_RADIUS_KM, include_minimum=False)
+    if (lat is None) != (lon is None):
+        raise ValidationError({'lat' if lat is None else 'lon': "Both 'lat' and 'lon' are required."})
+    point = {'lat': lat, 'lon': lon} if lat is not None else None
+    return point, radius
+
+
+def get_source_fields(request, view):
+    """
+    Document fields the hits are limited to: view.compact_source_fields for
+    ?view=compact, the allowed subset of ?fields=a,b (view.source_fields),
+    or None for full documents.
+    """
+    params = request.query_params
+    if params.get('fields'):
+        return [field for field in _split(params['fields']) if field in view.source_fields] or None
+    if params.get('view') == COMPACT_VIEW:
+        return list(view.compact_source_fields)
+    return None
+
+
+class SourceFilterBackend(BaseFilterBackend):
+    """Applies get_source_fields() as `_source` includes, so ES only returns those fields."""
+
+    def filter_queryset(self, request, queryset, view):
+        fields = get_source_fields(request, view)
+        if fields is None:
+            return queryset
+        return queryset.source(includes=fields)
+
+
+class OfferFilterBackend(BaseFilterBackend):
+    """
+    Filters products by their nested `offers` (one per vendor stock record)
+    so that all conditions must hold for the same offer. Matching offers are
+    returned as the `matching_offers` inner hits.
+
+    Query params: offer_price__gte, offer_price__lte, offer_partner (ids,
+    comma separated), offer_city, offer_in_stock=true, and lat/lon with an
+    optional radius (km). With lat/lon only offers that have a location
+    match, inner hits are sorted nearest first (their sort value is the
+    distance), `ordering=distance` sorts products by their nearest matching
+    offer and a `distance` facet with product counts per range is added.
+
+    Must run after OrderingFilterBackend, since distance ordering replaces
+    its sort.
+    """
+    inner_hits_name = 'matching_offers'
+    inner_hits_size = 5
+    distance_ranges_km = (5, 10, 25, 50, 100)
+
+    def get_offer_filters(self, request, view, point=None, radius=None):
+        params = request.query_params
+        filters = []
+        price_range = {}
+        for lookup in ('gte', 'lte'):
+            value = params.get(f'offer_price__{lookup}')
+            if value not in (None, ''):
+                try:
+                    price = float(value)
+                except ValueError:
+                    continue
+                if math.isfinite(price):
+                    price_range[lookup] = price
+        if price_range:
+            filters.append(Q('range', **{'offers.price': price_range}))
+        if params.get('offer_partner'):
+            filters.append(Q('terms', **{'offers.partner_id': _split(params['offer_partner'])}))
+        if params.get('offer_city'):
+            filters.append(Q('terms', **{'offers.city': _split(params['offer_city'])}))
+        if params.get('offer_in_stock') in ('1', 'true', 'True'):
+            filters.append(Q('range', **{'offers.num_in_stock': {'gt': 0}}))
+        if point and radius:
+            filters.append(Q('geo_distance', distance=f'{radius}km', **{'offers.location': point}))
+        elif point:
+            filters.append(Q('exists', field='offers.location'))
+        return filters
+
+    def get_distance_sort(self, point, nested_filters=None):
+        """Nearest-offer distance sort (km); nested_filters restricts it to matching offers."""
+        sort = {
+            'offers.location': point,
+            'order': 'asc',
+            'unit': 'km',
+            'mode': 'min',
+            'distance_type': 'arc',
+        }
+        if nested_filters is not None:
+            sort['nested'] = {'path': 'offers', 'filter': Q('bool', filter=nested_filters).to_dict()}
+        return {'_geo_distance': sort}
+
+    def aggregate_distance(self, queryset, point, filters):
+        ranges = []
+        previous = None
+        for limit in self.distance_ranges_km:
+            ranges.append({'from': previous, 'to': limit} if previous else {'to': limit})
+            previous = limit
+        ranges.append({'from': previous})
+        queryset.aggs.bucket('distance', 'nested', path='offers') \
+            .bucket('matching', 'filter', Q('bool', filter=filters)) \
+            .bucket('ranges', 'geo_distance', field='offers.location', origin=point, unit='km', ranges=ranges) \
+            .bucket('products', 'reverse_nested')
+        return queryset
+
+    def filter_queryset(self, request, queryset, view):
+        point, radius = get_geo_params(request)
+        filters = self.get_offer_filters(request, view, point=point, radius=radius)
+        if not filters:
+            return queryset
+
+        if point:
+            inner_sort = [self.get_distance_sort(point)]
+        else:
+            inner_sort = [{'offers.price': {'order': 'asc'}}]
+        queryset = queryset.filter(
+            'nested',
+            path='offers',
+            query=Q('bool', filter=filters),
+            inner_hits={
+                'name': self.inner_hits_name,
+                'size': self.inner_hits_size,
+                'sort': inner_sort,
+            },
+        )
+        if point:
+            if request.query_params.get('ordering') == 'distance':
+                queryset = queryset.sort(self.get_distance_sort(point, nested_filters=filters))
+            if facets_enabled(request, view):
+                queryset = self.aggregate_distance(queryset, point, filters)
+        return queryset
+
+
+class OptionalFacetedSearchFilterBackend(FacetedSearchFilterBackend):
+    """FacetedSearchFilterBackend that can be switched off per request with ?facets=false."""
+
+    def filter_queryset(self, request, queryset, view):
+        if not facets_enabled(request, view):
+            return queryset
+        return super().filter_queryset(request, queryset, view)
+
+
+class AttributeFilterBackend(BaseFilterBackend):
+    """
+    Filters and facets on the nested `attributes`, generated from the
+    cached attribute schema of the ?product_class=<slug> being browsed.
+
+    Query params: attr_<code>=a,b for text/option/multi-option/boolean
+    attributes, attr_<code>__gte / attr_<code>__lte for integer/float ones.
+    Each attribute gets an `attr_<code>` facet: value buckets with product
+    counts for keywords, min/max stats for numbers.
+    """
+    param_prefix = 'attr_'
+    product_class_param = 'product_class'
+    terms_size = 20
+
+    def get_attributes(self, request):
+        """(code, type, document field) of the browsed product class's indexed attributes."""
+        slug = request.query_params.get(self.product_class_param)
+        schema = get_schema_for_slug(slug) if slug else None
+        if schema is None:
+            return []
+        return [
+            (spec.code, spec.type, ATTRIBUTE_VALUE_FIELDS[spec.type])
+            for spec in schema if spec.type in ATTRIBUTE_VALUE_FIELDS
+        ]
+
+    def get_value_filter(self, request, code, field):
+        params = request.query_params
+        name = f'{self.param_prefix}{code}'
+        if field == 'value_keyword':
+            values = _split(params.get(name, ''))
+            return Q('terms', **{f'attributes.{field}': values}) if values else None
+        value_range = {}
+        for lookup in ('gte', 'lte'):
+            value = params.get(f'{name}__{lookup}')
+            if value not in (None, ''):
+                try:
+                    value_range[lookup] = float(value)
+                except ValueError:
+                    pass
+        return Q('range', **{f'attributes.{field}': value_range}) if value_range else None
+
+    def aggregate_attribute(self, queryset, code, field):
+        bucket = queryset.aggs.bucket(f'{self.param_prefix}{code}', 'nested', path='attributes') \
+            .bucket('attribute', 'filter', Q('term', **{'attributes.code': code}))
+        if field == 'value_keyword':
+            bucket.bucket('values', 'terms', field=f'attributes.{field}', size=self.terms_size) \
+                .bucket('products', 'reverse_nested')
+        else:
+            bucket.metric('values', 'stats', field=f'attributes.{field}')
+        return queryset
+
+    def filter_queryset(self, request, queryset, view):
+        attributes = self.get_attributes(request)
+        if not attributes:
+            return queryset
+        queryset = queryset.filter('term', **{'product_class.slug': request.query_params[self.product_class_param]})
+        for code, _, field in attributes:
+            value_filter = self.get_value_filter(request, code, field)
+            if value_filter is not None:
+                # Code and value must match on the same nested entry
+                queryset = queryset.filter(
+                    'nested',
+                    path='attributes',
+                    query=Q('bool', filter=[Q('term', **{'attributes.code': code}), value_filter]),
+                )
+        if facets_enabled(request, view):
+            for code, _, field in attributes:
+                queryset = self.aggregate_attribute(queryset, code, field)
+        return queryset
@@ -0,0 +1,264 @@
+import logging
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.translation import gettext as _
+from oscar.core.loading import get_model
+from oscar.core.utils import slugify
+
+from apps.catalogue.attributes import write_attribute_values
+from apps.catalogue.search_sync import enqueue_products
+from apps.partner.summaries import refresh_offer_summaries
+
+from .serializers import ProductImportRowSerializer
+
+logger = logging.getLogger(__name__)
+
+Product = get_model('catalogue', 'Product')
+ProductClass = get_model('catalogue', 'ProductClass')
+ProductCategory = get_model('catalogue', 'ProductCategory')
+Category = get_model('catalogue', 'Category')
+StockRecord = get_model('partner', 'StockRecord')
+Warehouse = get_model('locations', 'Warehouse')
+
+CREATED = 'created'
+UPDATED = 'updated'
+LINKED = 'linked'
+FAILED = 'failed'
+
+# Produkto laukai, kuriuos eilutė gali atnaujinti (product_class ir upc po sukūrimo nekeičiami)
+PRODUCT_UPDATE_FIELDS = ('title', 'description', 'condition', 'is_public')
+
+
+class RowResult:
+    """ Vienos importo eilutės rezultatas ataskaitai. """
+
+    def __init__(self, row, data):
+        self.row = row
+        self.data = data
+        self.partner_sku = data.get('partner_sku') if isinstance(data, dict) else None
+        self.status = None
+        self.product = None
+        self.errors = {}
+
+    def fail(self, errors):
+        self.status = FAILED
+        self.errors = errors
+
+    def as_dict(self):
+        return {
+            'row': self.row,
+            'partner_sku': self.partner_sku,
+            'status': self.status,
+            'id': self.product.pk if self.product is not None and self.status != FAILED else None,
+            'errors': self.errors or None,
+        }
+
+
+class ProductImporter:
+    """
+    Masinis partnerio produktų importas (JSON Lines / CSV eilutės).
+
+    Eilutės apdorojamos partijomis: kiekviena partija validuojama su iš anksto
+    užkrautais produktų klasių / sandėlių / kategorijų duomenimis, esami
+    StockRecord'ai randami pagal (partner, partner_sku), esami produktai pagal
+    UPC, o produktai, pasiūlymai, kategorijos ir atributai įrašomi
+    bulk_create/bulk_update per vieną transakciją partijai. Bulk operacijos
+    nesiunčia signalų, todėl pasiūlymų suvestinės perskaičiuojamos, o
+    paieškos indeksavimas užsakomas tos pačios partijos transakcijoje (jau
+    įrašytos partijos lieka eilėje, net jei vėlesnė nepavyksta).
+
+    Eilutės būsena: 'created' - naujas produktas, 'updated' - atnaujintas
+    partnerio pasiūlymas (ir produktas), 'linked' - pasiūlymas pridėtas prie
+    esamo kito partnerio produkto (rastas pagal UPC), 'failed' - klaidos.
+    """
+
+    def __init__(self, partner, batch_size=500):
+        self.partner = partner
+        self.batch_size = batch_size
+
+    def run(self, rows):
+        results = [RowResult(index, data) for index, data in enumerate(rows, 1)]
+        seen_skus = set()
+        for start in range(0, len(results), self.batch_size):
+            batch = results[start:start + self.batch_size]
+            valid = self._validate(batch, seen_skus)
+            if valid:
+                self._import_batch(valid)
+
+        report = {status: 0 for status in (CREATED, UPDATED, LINKED, FAILED)}
+        for result in results:
+            report[result.status] += 1
+        report['rows'] = [result.as_dict() for result in results]
+        return report
+
+    def _get_context(self, batch):
+        category_ids = set()
+        for result in batch:
+            categories = result.data.get('categories') if isinstance(result.data, dict) else None
+            if isinstance(categories, str):
+                categories = categories.split(',')
+            for category_id in categories if isinstance(categories, list) else []:
+                try:
+                    category_ids.add(int(category_id))
+                except (TypeError, ValueError):
+                    pass
+        return {
+            'product_classes': {product_class.slug: product_class for product_class in ProductClass.objects.all()},
+            'warehouse_ids': set(
+                Warehouse.objects.filter(partner=self.partner, is_active=True).values_list('pk', flat=True)
+            ),
+            'category_ids': set(Category.objects.filter(pk__in=category_ids).values_list('pk', flat=True)),
+        }
+
+    def _validate(self, batch, seen_skus):
+        context = self._get_context(batch)
+        valid = []
+        for result in batch:
+            if not isinstance(result.data, dict):
+                result.fail({'non_field_errors': [_("Expected an object.")]})
+                continue
+            serializer = ProductImportRowSerializer(data=result.data, context=context)
+            if not serializer.is_valid():
+                result.fail(serializer.errors)
+                continue
+            sku = serializer.validated_data['partner_sku']
+            if sku in seen_skus:
+                result.fail({'partner_sku': [_("Duplicate partner_sku in this file.")]})
+                continue
+            seen_skus.add(sku)
+            result.data = serializer.validated_data
+            valid.append(result)
+        return valid
+
+    def _import_batch(self, batch):
+        stockrecords = {
+            stockrecord.partner_sku: stockrecord
+            for stockrecord in StockRecord.objects.filter(
+                partner=self.partner, partner_sku__in=[result.data['partner_sku'] for result in batch]
+            ).select_related('product')
+        }
+        upcs = {result.data['upc'] for result in batch if result.data.get('upc')}
+        products_by_upc = {product.upc: product for product in Product.objects.filter(upc__in=upcs)}
+
+        now = timezone.now()
+        new_upcs = set()
+        to_create, to_update = [], []
+        for result in batch:
+            data = result.data
+            stockrecord = stockrecords.get(data['partner_sku'])
+            if stockrecord is not None:
+                result.status, result.product = UPDATED, stockrecord.product
+                for field in PRODUCT_UPDATE_FIELDS:
+                    # Tuščia reikšmė palieka esamą, kaip ir praleistas CSV stulpelis
+                    if data.get(field, '') != '':
+                        setattr(result.product, field, data[field])
+                result.product.date_updated = now
+                to_update.append(result.product)
+            elif data.get('upc') in products_by_upc:
+                result.status, result.product = LINKED, products_by_upc[data['upc']]
+            else:
+                errors = {}
+                if not data.get('title'):
+                    errors['title'] = [_("Required for new products.")]
+                if not data.get('product_class'):
+                    errors['product_class'] = [_("Required for new products.")]
+                if data.get('upc') and data['upc'] in new_upcs:
+                    errors['upc'] = [_("Duplicate UPC in this file.")]
+                if errors:
+                    result.fail(errors)
+                    continue
+                if data.get('upc'):
+                    new_upcs.add(data['upc'])
+                result.status = CREATED
+                result.product = Product(
+                    product_class=data['product_class'],
+                    title=data['title'],
+                    slug=slugify(data['title']),
+                    upc=data.get('upc'),
+                    description=data.get('description', ''),
+                    condition=data.get('condition', Product.CONDITION_NEW),
+                    is_public=data.get('is_public', True),
+                )
+                to_create.append(result.product)
+
+        imported = [result for result in batch if result.status != FAILED]
+        try:
+            with transaction.atomic():
+                Product.objects.bulk_create(to_create)
+                if to_update:
+                    Product.objects.bulk_update(to_update, PRODUCT_UPDATE_FIELDS + ('date_updated',))
+                self._save_stockrecords(imported, stockrecords, now)
+                self._save_categories(imported)
+                self._save_attributes(imported)
+                product_ids = {result.product.pk for result in imported}
+                refresh_offer_summaries(product_ids)
+                # Bulk įrašai nesiunčia post_save: partija užsakoma indeksuoti kartu su savo duomenimis
+                enqueue_products(product_ids)
+        except IntegrityError as error:
+            logger.warning(f"Bulk import batch of partner {self.partner.pk} failed: {error}")
+            for result in imported:
+                result.fail({'non_field_errors': [_("Batch could not be saved, please retry: %(error)s") % {
+                    'error': error,
+                }]})
+            return set()
+        return product_ids
+
+    def _save_stockrecords(self, batch, stockrecords, now):
+        to_create, to_update = [], []
+        for result in batch:
+            data = result.data
+            stockrecord = stockrecords.get(data['partner_sku'])
+            if stockrecord is None:
+                stockrecord = StockRecord(
+                    product=result.product, partner=self.partner, partner_sku=data['partner_sku'],
+                    price_currency=settings.OSCAR_DEFAULT_CURRENCY,
+                )
+                to_create.append(stockrecord)
+            else:
+                stockrecord.date_updated = now
+                to_update.append(stockrecord)
+            stockrecord.price = data['price']
+            stockrecord.num_in_stock = data['num_in_stock']
+            if 'warehouse' in data:
+                stockrecord.warehouse_id = data['warehouse']
+        StockRecord.objects.bulk_create(to_create)
+        if to_update:
+            StockRecord.objects.bulk_update(to_update, ['price', 'num_in_stock', 'warehouse', 'date_updated'])
+
+    def _save_categories(self, batch):
+        # Naujiems/atnaujintiems produktams kategorijos pakeičiamos, prie susietų tik pridedamos
+        wanted = {}
+        replaced = set()
+        for result in batch:
+            if 'categories' not in result.data:
+                continue
+            wanted.setdefault(result.product.pk, set()).update(result.data['categories'])
+            if result.status != LINKED:
+                replaced.add(result.product.pk)
+        if not wanted:
+            return
+        existing = ProductCategory.objects.filter(product_id__in=wanted).values_list('pk', 'product_id', 'category_id')
+        stale = [pk for pk, product_id, category_id in existing
+                 if product_id in replaced and category_id not in wanted[product_id]]
+        if stale:
+            ProductCategory.objects.filter(pk__in=stale).delete()
+        ProductCategory.objects.bulk_create(
+            [
+                ProductCategory(product_id=product_id, category_id=category_id)
+                for product_id, category_ids in wanted.items()
+                for category_id in category_ids
+            ],
+            ignore_conflicts=True,
+        )
+
+    def _save_attributes(self, batch):
+        # Susieti (kito partnerio) produktai atributų nekeičia, kaip ir ProductWriteSerializer.create
+        rows = [result for result in batch if result.status != LINKED and 'attributes' in result.data]
+        if not rows:
+            return
+        errors = write_attribute_values([(result.product, result.data['attributes']) for result in rows])
+        for result in rows:
+            if result.product.pk in errors:
+                result.errors = {'attributes': errors[result.product.pk]}
@@ -0,0 +1,137 @@
+import hashlib
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from apps.catalogue.indexing import get_index_generation
+
+CACHE_STATS_KEYS = ('search:stats:hits', 'search:stats:misses')
+CACHE_HEADER = 'X-Search-Cache'
+# Hit/miss counts are kept per process and added to the shared cache at most this often (seconds):
+# incr on the file cache is a get + set, and every set lists the whole cache directory
+STATS_FLUSH_INTERVAL = 30
+
+_stats_lock = threading.Lock()
+_pending_stats = [0, 0]
+_stats_flushed_at = time.monotonic()
+
+
+def normalize_query_params(query_params):
+    """
+    Query params as a stable string: keys and repeated values sorted, empty
+    values and the default first page dropped, so equivalent requests share
+    one cache entry.
+    """
+    items = []
+    for key in sorted(query_params):
+        values = sorted(value for value in query_params.getlist(key) if value != '')
+        if key == 'page' and values == ['1']:
+            continue
+        items.extend((key, value) for value in values)
+    return json.dumps(items, separators=(',', ':'))
+
+
+def _incr(cache, key, delta):
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        if not cache.add(key, delta, timeout=None):
+            cache.incr(key, delta)
+
+
+def flush_search_cache_stats():
+    """Adds this process's pending hit/miss counts to the shared counters."""
+    global _stats_flushed_at
+    with _stats_lock:
+        pending = list(_pending_stats)
+        _pending_stats[:] = [0, 0]
+        _stats_flushed_at = time.monotonic()
+    cache = caches['search']
+    for key, delta in zip(CACHE_STATS_KEYS, pending):
+        if delta:
+            _incr(cache, key, delta)
+
+
+def _count(index):
+    with _stats_lock:
+        _pending_stats[index] += 1
+        due = time.monotonic() - _stats_flushed_at >= STATS_FLUSH_INTERVAL
+    if due:
+        flush_search_cache_stats()
+
+
+def get_search_cache_stats():
+    """Shared hit/miss counters; other processes' counts lag by up to STATS_FLUSH_INTERVAL."""
+    flush_search_cache_stats()
+    cache = caches['search']
+    hits, misses = (cache.get(key, 0) for key in CACHE_STATS_KEYS)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / total, 4) if total else None,
+        'generation': get_index_generation(),
+    }
+
+
+class SearchCacheMixin:
+    """
+    Caches anonymous GET responses of Elasticsearch viewset actions for
+    SEARCH_CACHE_TIMEOUT seconds. Keys include the product index generation,
+    which the sync worker bumps after every batch, so cached results are
+    dropped as soon as the index changes rather than when the TTL runs out.
+    """
+    cached_actions = ('list',)
+
+    def get_search_cache_key(self, request):
+        params = normalize_query_params(request.query_params)
+        # Pagination links are absolute, so the host is part of the key
+        raw = f"{request.get_host()}{request.path}?{params}"
+        digest = hashlib.sha1(raw.encode()).hexdigest()
+        return f"search:{get_index_generation()}:{self.basename}:{self.action}:{digest}"
+
+    def should_cache(self, request):
+        return (
+            self.action in self.cached_actions
+            and request.method == 'GET'
+            and not request.user.is_authenticated
+        )
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        key = getattr(request, '_search_cache_key', None)
+        if key and response.status_code == 200 and not getattr(response, '_from_search_cache', False):
+            # Plain JSON types only: DRF's ReturnList/ReturnDict keep a serializer reference
+            data = json.loads(JSONRenderer().render(response.data))
+            caches['search'].set(key, data, timeout=settings.SEARCH_CACHE_TIMEOUT)
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if key:
+            response[CACHE_HEADER] = 'HIT' if getattr(response, '_from_search_cache', False) else 'MISS'
+        return response
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if self.should_cache(request):
+            request._search_cache_key = self.get_search_cache_key(request)
+
+    def handle_cached(self, request, handler, *args, **kwargs):
+        """Returns the cached response for this request, or calls `handler` and lets finalize_response store it."""
+        key = getattr(request, '_search_cache_key', None)
+        if not key:
+            return handler(request, *args, **kwargs)
+        cache = caches['search']
+        data = cache.get(key)
+        if data is not None:
+            _count(0)
+            response = Response(data)
+            response._from_search_cache = True
+            return response
+        _count(1)
+        return handler(request, *args, **kwargs)
+
+    def list(self, request, *args, **kwargs):
+        return self.handle_cached(request, super().list, *args, **kwargs)
@@ -7,9 +7,12 @@ from django.utils.translation import gettext_lazy as _
 # from django.contrib.gis.geos import Point
 # from django.contrib.gis.db.models.functions import Distance
 
+from django.db.models import Exists, OuterRef
+
 Product = get_model('catalogue', 'Product')
 Category = get_model('catalogue', 'Category')
 Partner = get_model('partner', 'Partner')
+StockRecord = get_model('partner', 'StockRecord')
 
 class ProductFilter(django_filters.FilterSet):
     # --- Filtravimas pagal Kategoriją ---
@@ -23,23 +26,27 @@ class ProductFilter(django_filters.FilterSet):
     # category_in = django_filters.BaseInFilter(field_name='categories__id', lookup_expr='in')
 
     # --- Filtravimas pagal Kainą ---
-    # Leidžia nurodyti minimalią kainą (pvz., ?min_price=10.50)
+    # Filtruojam per ProductOfferSummary (indeksuoti min_price/max_price), be JOIN į stockrecords,
+    # todėl produktai su keliais pasiūlymais nesidubliuoja ir count() nereikia DISTINCT.
+    # Leidžia nurodyti minimalią kainą (pvz., ?min_price=10.50) - bent vienas pasiūlymas >= 10.50
     min_price = django_filters.NumberFilter(
-        field_name="stockrecords__price", # Naudojam modelio lauką 'price'
+        field_name="offer_summary__max_price",
         lookup_expr='gte', # Greater than or equal (>=)
         label=_('Minimum Price')
     )
-    # Leidžia nurodyti maksimalią kainą (pvz., ?max_price=50)
+    # Leidžia nurodyti maksimalią kainą (pvz., ?max_price=50) - bent vienas pasiūlymas <= 50
     max_price = django_filters.NumberFilter(
-        field_name="stockrecords__price",
+        field_name="offer_summary__min_price",
         lookup_expr='lte', # Less than or equal (<=)
         label=_('Maximum Price')
     )
 
     # --- Filtravimas pagal Tiekėją ---
-    # Leidžia filtruoti pagal tiekėjo ID (pvz., ?partner=5)
-    partner = django_filters.ModelChoiceFilter(field_name='stockrecords__partner',
-                                               queryset=Partner.objects.filter(verification_status=Partner.STATUS_VERIFIED))
+    # Leidžia filtruoti pagal tiekėjo ID (pvz., ?partner=5); EXISTS vietoj JOIN - be dublikatų
+    partner = django_filters.ModelChoiceFilter(
+        method='filter_partner',
+        queryset=Partner.objects.filter(verification_status=Partner.STATUS_VERIFIED)
+    )
 
     # --- Filtravimas pagal Būklę (Jūsų pridėtas laukas) ---
     condition = django_filters.ChoiceFilter(
@@ -63,6 +70,13 @@ class ProductFilter(django_filters.FilterSet):
     #         attribute_values__value_text__iexact=value # Arba value_option, value_integer...
     #     ).distinct()
 
+    def filter_partner(self, queryset, name, value):
+        if not value:
+            return queryset
+        return queryset.filter(
+            Exists(StockRecord.objects.filter(product=OuterRef('pk'), partner=value))
+        )
+
     class Meta:
         model = Product
         # Laukai, pagal kuriuos leidžiamas TIKSLUS filtravimas (jei reikia)
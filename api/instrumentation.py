@@ -0,0 +1,153 @@
+import contextvars
+import logging
+import time
+from contextlib import ExitStack
+from functools import wraps
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('api.metrics')
+
+_current_metrics = contextvars.ContextVar('api_request_metrics', default=None)
+
+
+class RequestMetrics:
+    """SQL, Elasticsearch and serialization cost of one request."""
+
+    def __init__(self):
+        self.view = None
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.es_count = 0
+        self.es_time = 0.0
+        self.serialize_time = 0.0
+        self.started = time.perf_counter()
+        self.total_time = None
+
+    def as_dict(self):
+        return {
+            'view': self.view,
+            'sql_count': self.sql_count,
+            'sql_ms': round(self.sql_time * 1000, 2),
+            'es_count': self.es_count,
+            'es_ms': round(self.es_time * 1000, 2),
+            'serialize_ms': round(self.serialize_time * 1000, 2),
+            'total_ms': round((self.total_time or 0) * 1000, 2),
+        }
+
+    def server_timing(self):
+        """Server-Timing header value (durations in ms)."""
+        data = self.as_dict()
+        return ', '.join([
+            f'sql;dur={data["sql_ms"]};desc="{self.sql_count} queries"',
+            f'es;dur={data["es_ms"]};desc="{self.es_count} requests"',
+            f'serialize;dur={data["serialize_ms"]}',
+            f'total;dur={data["total_ms"]}',
+        ])
+
+
+def get_current_metrics():
+    """Metrics of the request being handled in this context, or None outside a request."""
+    return _current_metrics.get()
+
+
+class ElasticsearchTimingHandler(logging.Handler):
+    """
+    Attached to the 'elasticsearch' logger: elasticsearch-py logs every
+    request as "%s %s [status:%s request:%.3fs]" with the duration as the
+    last argument, which is counted into the current request's metrics.
+    """
+
+    def emit(self, record):
+        metrics = _current_metrics.get()
+        args = record.args
+        if metrics is None or not isinstance(args, tuple) or len(args) != 4 or not isinstance(args[3], float):
+            return
+        metrics.es_count += 1
+        metrics.es_time += args[3]
+
+
+def _sql_wrapper(metrics):
+    def wrapper(execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            metrics.sql_count += 1
+            metrics.sql_time += time.perf_counter() - started
+    return wrapper
+
+
+class RequestMetricsMiddleware:
+    """
+    Records per request SQL query count/time (connection.execute_wrapper),
+    Elasticsearch request count/time (ElasticsearchTimingHandler) and
+    serialization time (InstrumentedViewMixin). In DEBUG they are returned
+    as a Server-Timing header, otherwise logged to 'api.metrics' with the
+    values in the record's `metrics` extra. Tests can read `response.metrics`.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        token = _current_metrics.set(metrics)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(_sql_wrapper(metrics)))
+                response = self.get_response(request)
+        finally:
+            _current_metrics.reset(token)
+        metrics.total_time = time.perf_counter() - metrics.started
+        if metrics.view is None and request.resolver_match:
+            metrics.view = request.resolver_match.view_name
+
+        response.metrics = metrics
+        if settings.DEBUG:
+            response['Server-Timing'] = metrics.server_timing()
+        else:
+            data = metrics.as_dict()
+            logger.info(
+                f"{request.method} {request.path} {response.status_code} "
+                + ' '.join(f'{key}={value}' for key, value in data.items()),
+                extra={'metrics': data},
+            )
+        return response
+
+
+class InstrumentedViewMixin:
+    """
+    DRF view mixin: names the request's metrics after the view and action,
+    and times the top-level serializer's to_representation().
+    """
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        metrics = get_current_metrics()
+        if metrics is not None:
+            action = getattr(self, 'action', None) or request.method.lower()
+            metrics.view = f'{self.__class__.__name__}.{action}'
+
+    def instrument_serializer(self, serializer):
+        metrics = get_current_metrics()
+        if metrics is None:
+            return serializer
+        to_representation = serializer.to_representation
+
+        @wraps(to_representation)
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return to_representation(*args, **kwargs)
+            finally:
+                metrics.serialize_time += time.perf_counter() - started
+
+        # Instance attribute shadows the method for this serializer only; nested ones are not double counted
+        serializer.to_representation = timed
+        return serializer
+
+    def get_serializer(self, *args, **kwargs):
+        return self.instrument_serializer(super().get_serializer(*args, **kwargs))
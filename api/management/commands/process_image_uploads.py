@@ -0,0 +1,53 @@
+import time
+import logging
+
+from django.core.management.base import BaseCommand
+
+from api.uploads import delete_expired_uploads, process_pending_uploads
+from apps.catalogue.blobs import collect_unreferenced_blobs
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        "Decode, validate and strip EXIF from completed product image uploads, "
+        "delete abandoned ones and unreferenced image files. Runs forever unless --once is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=20,
+            help="Maximum number of uploads processed per transaction.",
+        )
+        parser.add_argument(
+            '--interval', type=float, default=2,
+            help="Seconds to wait when there is nothing to process.",
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help="Process the pending uploads once and exit.",
+        )
+
+    def handle(self, *args, **options):
+        last_cleanup = None
+        while True:
+            processed = 0
+            while True:
+                count = process_pending_uploads(batch_size=options['batch_size'])
+                processed += count
+                if count == 0:
+                    break
+            if processed:
+                self.stdout.write(f"Processed {processed} image uploads.")
+            if last_cleanup is None or time.monotonic() - last_cleanup > 3600:
+                deleted = delete_expired_uploads()
+                if deleted:
+                    logger.info(f"Deleted {deleted} expired image uploads.")
+                collected = collect_unreferenced_blobs()
+                if collected:
+                    logger.info(f"Deleted {collected} unreferenced image blobs.")
+                last_cleanup = time.monotonic()
+            if options['once']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.20 on 2026-10-18 15:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('partner', '0011_productoffersummary_max_price'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageUpload',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('filename', models.CharField(max_length=255, verbose_name='Original file name')),
+                ('content_type', models.CharField(blank=True, max_length=100, verbose_name='Declared content type')),
+                ('size', models.PositiveBigIntegerField(verbose_name='Size in bytes')),
+                ('offset', models.PositiveBigIntegerField(default=0, verbose_name='Bytes received')),
+                ('status', models.CharField(choices=[('uploading', 'Uploading'), ('uploaded', 'Waiting for processing'), ('ready', 'Ready'), ('failed', 'Failed'), ('attached', 'Attached to a product')], db_index=True, default='uploading', max_length=20, verbose_name='Status')),
+                ('image', models.ImageField(blank=True, height_field='height', max_length=255, upload_to='images/products/%Y/%m/', verbose_name='Image', width_field='width')),
+                ('width', models.PositiveIntegerField(blank=True, null=True, verbose_name='Width')),
+                ('height', models.PositiveIntegerField(blank=True, null=True, verbose_name='Height')),
+                ('error', models.TextField(blank=True, verbose_name='Processing error')),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+                ('date_updated', models.DateTimeField(auto_now=True)),
+                ('partner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='image_uploads', to='partner.partner', verbose_name='Partner')),
+            ],
+            options={
+                'verbose_name': 'Image upload',
+                'verbose_name_plural': 'Image uploads',
+                'ordering': ['date_created'],
+            },
+        ),
+    ]
@@ -1,3 +1,70 @@
+import uuid
+
+from django.conf import settings
 from django.db import models
+from django.utils.translation import gettext_lazy as _
+
+
+class ImageUpload(models.Model):
+    """
+    Chunked, resumable product image upload. The id is the upload token:
+    chunks are appended to a temporary file (IMAGE_UPLOAD_TEMP_DIR), the
+    `process_image_uploads` worker decodes, validates and re-encodes the
+    complete file without EXIF into a shared ImageBlob referenced by
+    `image`, and a product write attaches it to the product by token
+    (ProductImageWriteSerializer.upload_token).
+    """
+    STATUS_UPLOADING = 'uploading'
+    STATUS_UPLOADED = 'uploaded'
+    STATUS_READY = 'ready'
+    STATUS_FAILED = 'failed'
+    STATUS_ATTACHED = 'attached'
+
+    STATUS_CHOICES = [
+        (STATUS_UPLOADING, _('Uploading')),
+        (STATUS_UPLOADED, _('Waiting for processing')),
+        (STATUS_READY, _('Ready')),
+        (STATUS_FAILED, _('Failed')),
+        (STATUS_ATTACHED, _('Attached to a product')),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    partner = models.ForeignKey(
+        'partner.Partner',
+        on_delete=models.CASCADE,
+        related_name='image_uploads',
+        verbose_name=_('Partner')
+    )
+    filename = models.CharField(_('Original file name'), max_length=255)
+    content_type = models.CharField(_('Declared content type'), max_length=100, blank=True)
+    size = models.PositiveBigIntegerField(_('Size in bytes'))
+    offset = models.PositiveBigIntegerField(_('Bytes received'), default=0)
+    status = models.CharField(
+        _('Status'),
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default=STATUS_UPLOADING,
+        db_index=True
+    )
+    # Processed (decoded, EXIF-stripped, re-encoded) image
+    image = models.ImageField(
+        _('Image'), upload_to=settings.OSCAR_IMAGE_FOLDER, max_length=255, blank=True,
+        width_field='width', height_field='height'
+    )
+    width = models.PositiveIntegerField(_('Width'), null=True, blank=True)
+    height = models.PositiveIntegerField(_('Height'), null=True, blank=True)
+    error = models.TextField(_('Processing error'), blank=True)
+    date_created = models.DateTimeField(auto_now_add=True)
+    date_updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = _('Image upload')
+        verbose_name_plural = _('Image uploads')
+        ordering = ['date_created']
+
+    def __str__(self):
+        return f"{self.filename} ({self.offset}/{self.size}, {self.status})"
 
-# Create your models here.
+    @property
+    def is_complete(self):
+        return self.offset >= self.size
@@ -0,0 +1,164 @@
+import base64
+import hashlib
+import json
+from collections import OrderedDict
+
+from django.core.paginator import Paginator as DjangoPaginator
+from django.db import connections
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+from django_elasticsearch_dsl_drf.pagination import PageNumberPagination as DocumentPageNumberPagination
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class DocumentResultsSetPagination(DocumentPageNumberPagination):
+    """
+    Page number pagination for Elasticsearch document viewsets. Unlike DRF's
+    PageNumberPagination it returns the search aggregations as `facets`.
+    """
+    page_size = 24
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class DocumentCursorPagination(BasePagination):
+    """
+    Keyset pagination for Elasticsearch document viewsets: pages are fetched
+    with `search_after` on the request's sort plus the document `id` as a
+    tie-breaker, so every page costs the same regardless of depth and the
+    10k `from`/`size` window does not apply. Forward-only; the cursor is
+    opaque and bound to the sort it was issued for.
+    """
+    page_size = 24
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    tie_breaker = 'id'
+    invalid_cursor_message = _('Invalid cursor')
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def get_sort(self, queryset):
+        """The search's sort (relevance if none) with the id tie-breaker appended."""
+        sort = list(queryset.to_dict().get('sort', [])) or [{'_score': {'order': 'desc'}}]
+        fields = [next(iter(item)) if isinstance(item, dict) else item.lstrip('-') for item in sort]
+        if self.tie_breaker not in fields:
+            sort.append({self.tie_breaker: {'order': 'asc'}})
+        return sort
+
+    def _fingerprint(self, sort):
+        return hashlib.sha1(json.dumps(sort, sort_keys=True).encode()).hexdigest()[:12]
+
+    def encode_cursor(self, sort_values):
+        payload = json.dumps({'s': self.sort_fingerprint, 'a': sort_values}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+            sort_values = payload['a']
+            fingerprint = payload['s']
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        # A cursor issued for another ordering/geo point would skip or repeat hits
+        if fingerprint != self.sort_fingerprint or not isinstance(sort_values, list):
+            raise NotFound(self.invalid_cursor_message)
+        return sort_values
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        sort = self.get_sort(queryset)
+        self.sort_fingerprint = self._fingerprint(sort)
+
+        # One extra hit tells whether there is a next page, without counting
+        search = queryset.sort(*sort).extra(size=page_size + 1, track_total_hits=False)
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            search = search.extra(search_after=self.decode_cursor(cursor))
+
+        response = search.execute()
+        hits = list(response)
+        self.has_next = len(hits) > page_size
+        hits = hits[:page_size]
+        self.next_cursor = self.encode_cursor(list(hits[-1].meta.sort)) if self.has_next else None
+        self.facets = response.aggregations.to_dict() or None
+        return hits
+
+    def get_next_link(self):
+        if not self.next_cursor:
+            return None
+        url = remove_query_param(self.request.build_absolute_uri(), 'page')
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        content = [('next', self.get_next_link())]
+        if self.facets:
+            content.append(('facets', self.facets))
+        content.append(('results', data))
+        return Response(OrderedDict(content))
+
+
+def estimate_count(queryset):
+    """Row count estimated by the PostgreSQL planner (EXPLAIN), without running the query."""
+    sql, params = queryset.query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class ApproximateCountPaginator(DjangoPaginator):
+    """
+    Uses the planner's estimate instead of COUNT(*) when it is above
+    `exact_count_threshold`; small results are still counted exactly.
+    """
+    exact_count_threshold = 1000
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.is_approximate = False
+
+    @cached_property
+    def count(self):
+        estimate = estimate_count(self.object_list)
+        if estimate > self.exact_count_threshold:
+            self.is_approximate = True
+            return estimate
+        return super().count
+
+
+class ApproximateCountPagination(PageNumberPagination):
+    """
+    Page number pagination for DB querysets. ?count=approx replaces the exact
+    COUNT(*) with the planner's estimate for large results. The total is also
+    sent as X-Total-Count, with X-Total-Count-Approximate when estimated.
+    """
+    page_size = 24
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    count_query_param = 'count'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if request.query_params.get(self.count_query_param) == 'approx':
+            self.django_paginator_class = ApproximateCountPaginator
+        else:
+            self.django_paginator_class = DjangoPaginator
+        return super().paginate_queryset(queryset, request, view=view)
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        response['X-Total-Count'] = self.page.paginator.count
+        if getattr(self.page.paginator, 'is_approximate', False):
+            response['X-Total-Count-Approximate'] = 'true'
+        return response
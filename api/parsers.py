@@ -0,0 +1,52 @@
+import csv
+import io
+import json
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+
+def _read_text(stream, parser_context):
+    encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+    if stream is None:
+        return ''
+    try:
+        # utf-8-sig: Excel'io CSV dažnai prasideda BOM
+        return stream.read().decode('utf-8-sig' if encoding.lower() == 'utf-8' else encoding)
+    except UnicodeDecodeError as exc:
+        raise ParseError(f'Body is not valid {encoding}: {exc}')
+
+
+class JSONLinesParser(BaseParser):
+    """ JSON Lines (vienas JSON objektas eilutėje) -> sąrašas dict'ų. Tuščios eilutės praleidžiamos. """
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        rows = []
+        for number, line in enumerate(_read_text(stream, parser_context).splitlines(), 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as exc:
+                raise ParseError(f'Line {number}: invalid JSON ({exc})')
+            if not isinstance(row, dict):
+                raise ParseError(f'Line {number}: expected a JSON object')
+            rows.append(row)
+        return rows
+
+
+class CSVParser(BaseParser):
+    """ CSV su antraštės eilute -> sąrašas dict'ų (tuščios reikšmės praleidžiamos). """
+    media_type = 'text/csv'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        reader = csv.DictReader(io.StringIO(_read_text(stream, parser_context)))
+        try:
+            return [
+                {key.strip(): value for key, value in row.items() if key and value not in (None, '')}
+                for row in reader
+            ]
+        except csv.Error as exc:
+            raise ParseError(f'Line {reader.line_num}: {exc}')
@@ -10,7 +10,14 @@ from django.core.exceptions import ValidationError
 from django.contrib.auth import get_user_model
 from profiles.models import CompanyProfile
 from django_elasticsearch_dsl_drf.serializers import DocumentSerializer
+from PIL import Image
 from apps.catalogue.documents import ProductDocument
+from apps.catalogue.attributes import write_attribute_values
+from apps.catalogue.attribute_schema import get_schema
+from apps.catalogue.blobs import acquire, release
+from apps.catalogue.renditions import get_srcset, get_thumbnail
+from .models import ImageUpload
+from .uploads import ALLOWED_CONTENT_TYPES, store_image
 
 
 
@@ -26,6 +33,7 @@ ProductAttributeValue = get_model('catalogue', 'ProductAttributeValue')
 ProductImage = get_model('catalogue', 'ProductImage')
 Category = get_model('catalogue', 'Category')
 StockRecord = get_model('partner', 'StockRecord')
+ProductOfferSummary = get_model('partner', 'ProductOfferSummary')
 Product = get_model('catalogue', 'Product')
 ProductClass = get_model('catalogue', 'ProductClass')
 CustomUser = get_user_model()
@@ -79,20 +87,31 @@ class ProductAttributeSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'code', 'type', 'option_group'] # Pataisyta 'options' į 'option_group'
 
 class ProductAttributeValueReadOnlySerializer(serializers.ModelSerializer):
-    attribute = ProductAttributeSerializer(read_only=True)
+    # Atributo aprašas iš klasės schemos cache (apps.catalogue.attribute_schema), be option group užklausų
+    attribute = serializers.SerializerMethodField(method_name='get_attribute_definition')
     value = serializers.CharField(source='value_as_text', read_only=True) # Naudojam value_as_text
     class Meta:
         model = ProductAttributeValue
         fields = ['attribute', 'value'] # Pataisyta 'attributes' į 'attribute'
 
+    def get_attribute_definition(self, obj):
+        # obj.product jau užpildytas prefetch'o metu (attribute_values atvirkštinis ryšys)
+        schema = get_schema(obj.product.product_class_id)
+        spec = schema.by_id.get(obj.attribute_id) if schema else None
+        if spec is None:
+            return ProductAttributeSerializer(obj.attribute).data
+        return spec.as_dict()
+
 class ProductImageReadOnlySerializer(serializers.ModelSerializer):
     thumbnail_url = serializers.SerializerMethodField()
     original_url = serializers.SerializerMethodField()
+    # {'webp': {160: url, 320: url, ...}, 'jpeg': {...}} iš prefetch'intų renditions (failai neatidaromi)
+    srcset = serializers.SerializerMethodField()
 
     class Meta:
         model = ProductImage
-        fields = ['id', 'original_url', 'caption', 'display_order', 'thumbnail_url']
-        read_only_fields = ['thumbnail_url', 'original_url']
+        fields = ['id', 'original_url', 'caption', 'display_order', 'thumbnail_url', 'srcset']
+        read_only_fields = ['thumbnail_url', 'original_url', 'srcset']
 
     def _get_absolute_url(self, image_field):
         request = self.context.get('request')
@@ -108,8 +127,19 @@ class ProductImageReadOnlySerializer(serializers.ModelSerializer):
         return self._get_absolute_url(obj.original)
 
     def get_thumbnail_url(self, obj):
-        # TODO: Implement thumbnail generation (e.g., sorl-thumbnail)
-        return self.get_original_url(obj)
+        # Kol workeris nesugeneravo renditions - originalas
+        thumbnail = get_thumbnail(obj)
+        return self._get_absolute_url(thumbnail.file) if thumbnail else self.get_original_url(obj)
+
+    def get_srcset(self, obj):
+        return {
+            format_: {width: self._get_absolute_url_from_path(url) for width, url in widths.items()}
+            for format_, widths in get_srcset(obj).items()
+        }
+
+    def _get_absolute_url_from_path(self, url):
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
 
 class CategoryReadOnlySerializer(serializers.ModelSerializer):
     class Meta:
@@ -120,24 +150,43 @@ class StockRecordReadOnlySerializer(serializers.ModelSerializer): # Pataisytas p
     partner = PartnerReadOnlySerializer(read_only=True)
     warehouse = WarehouseReadOnlySerializer(read_only=True)
     # Pridedam kainą be PVM skaitymui
-    price = serializers.FloatField(source='price_excl_tax', read_only=True)
+    price = serializers.FloatField(read_only=True)
 
     class Meta:
         model = StockRecord
         fields = [
             'id', 'partner', 'warehouse', 'partner_sku',
-            'price_currency', 'price', # Naudojam 'price' (iš source='price_excl_tax')
+            'price_currency', 'price', # Oscar 3.x StockRecord turi tik 'price'
             'num_in_stock', 'num_allocated', 'low_stock_threshold'
         ]
 
+class ProductOfferSummarySerializer(serializers.ModelSerializer):
+    """
+    Geriausias pasiūlymas iš ProductOfferSummary (be stock record'ų agregavimo).
+    price/price_currency - to paties pasiūlymo kaip partner/warehouse,
+    min_price/max_price - visų pasiūlymų kainų intervalas.
+    """
+    price = serializers.FloatField(source='best_price', read_only=True)
+    min_price = serializers.FloatField(read_only=True)
+    max_price = serializers.FloatField(read_only=True)
+    partner = PartnerReadOnlySerializer(source='cheapest_partner', read_only=True)
+    warehouse = WarehouseReadOnlySerializer(source='cheapest_warehouse', read_only=True)
+
+    class Meta:
+        model = ProductOfferSummary
+        fields = [
+            'price', 'price_currency', 'min_price', 'max_price', 'total_stock', 'offer_count', 'partner', 'warehouse',
+        ]
+
 class ProductReadOnlySerializer(serializers.ModelSerializer):
-    url = serializers.HyperlinkedIdentityField(view_name='product-detail', read_only=True)
+    url = serializers.HyperlinkedIdentityField(view_name='partner-product-detail', read_only=True)
     product_class = serializers.StringRelatedField()
     attributes = ProductAttributeValueReadOnlySerializer(many=True, read_only=True, source='attribute_values') # Pataisyta į Value serializerį
     categories = CategoryReadOnlySerializer(many=True, read_only=True)
     images = ProductImageReadOnlySerializer(many=True, read_only=True) # Pataisytas serializerio pavadinimas, pataisita source
     stockrecords = StockRecordReadOnlySerializer(many=True, read_only=True) # Pataisytas serializerio pavadinimas
     min_distance = serializers.FloatField(read_only=True, required=False)
+    best_offer = ProductOfferSummarySerializer(source='offer_summary', read_only=True, allow_null=True)
 
     class Meta:
         model = Product
@@ -151,8 +200,22 @@ class ProductReadOnlySerializer(serializers.ModelSerializer):
             'is_public', 'date_created',
             'condition',
             'min_distance', # Pridėtas min_distance
+            'best_offer',
         ]
 
+class ProductListSerializer(ProductReadOnlySerializer):
+    """ Sąrašui: be gilaus atributų medžio (jis lieka retrieve atsakyme). """
+
+    class Meta(ProductReadOnlySerializer.Meta):
+        fields = [field for field in ProductReadOnlySerializer.Meta.fields if field != 'attributes']
+
+class NearbyProductSerializer(ProductReadOnlySerializer):
+    """ Viešas (DB) nearby rezultatas: be nuorodos į partnerio API, su min_distance (km). """
+    url = None
+
+    class Meta(ProductReadOnlySerializer.Meta):
+        fields = [field for field in ProductReadOnlySerializer.Meta.fields if field != 'url']
+
 # =======================================================
 # --- Serializers for Writing Data (POST, PUT, PATCH) ---
 # =======================================================
@@ -322,15 +385,43 @@ class AttributeValueWriteSerializer(serializers.Serializer):
     code = serializers.SlugField(max_length=128, required=True)
     value = serializers.JSONField(required=True) # Naudoja JSONField
 
+class ImageUploadSerializer(serializers.ModelSerializer):
+    """ Dalinio (resumable) paveikslėlio įkėlimo sukūrimas ir būsena. id = upload token. """
+    token = serializers.UUIDField(source='id', read_only=True)
+    image_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ImageUpload
+        fields = ['token', 'filename', 'content_type', 'size', 'offset', 'status', 'error', 'width', 'height', 'image_url']
+        read_only_fields = ['offset', 'status', 'error', 'width', 'height']
+
+    def validate_size(self, value):
+        if not 0 < value <= settings.IMAGE_UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(
+                _("Size must be between 1 and %(max)s bytes.") % {'max': settings.IMAGE_UPLOAD_MAX_SIZE}
+            )
+        return value
+
+    def validate_content_type(self, value):
+        if value and value not in ALLOWED_CONTENT_TYPES:
+            raise serializers.ValidationError(_("Only JPEG, PNG and WebP images are accepted."))
+        return value
+
+    def get_image_url(self, obj):
+        return obj.image.url if obj.image else None
+
+
 class ProductImageWriteSerializer(serializers.ModelSerializer):
     id = serializers.IntegerField(required=False, help_text=_("ID of existing image to update (optional)."))
     original = serializers.ImageField(required=False, allow_null=True, use_url=False)
+    # Paveikslėlis, įkeltas per /partner/uploads/images/ ir apdorotas workerio (vietoj multipart 'original')
+    upload_token = serializers.UUIDField(required=False, write_only=True)
     display_order = serializers.IntegerField(required=False, default=0)
     caption = serializers.CharField(max_length=200, required=False, allow_blank=True)
 
     class Meta:
         model = ProductImage
-        fields = ['id', 'original', 'caption', 'display_order']
+        fields = ['id', 'original', 'upload_token', 'caption', 'display_order']
 
 
 class ProductWriteSerializer(WritableNestedModelSerializer):
@@ -365,6 +456,24 @@ class ProductWriteSerializer(WritableNestedModelSerializer):
         ]
         read_only_fields = ['id']
 
+    def validate_images(self, images_data):
+        """ upload_token -> paruoštas (READY) šio partnerio ImageUpload, viena užklausa visiems. """
+        tokens = {img_data['upload_token'] for img_data in images_data if img_data.get('upload_token')}
+        if not tokens:
+            return images_data
+        uploads = ImageUpload.objects.filter(
+            pk__in=tokens, partner=self.context.get('partner'), status=ImageUpload.STATUS_READY
+        ).in_bulk()
+        missing = tokens - set(uploads)
+        if missing:
+            raise serializers.ValidationError(
+                _("Uploads not found or not processed yet: %(tokens)s.") % {'tokens': ', '.join(sorted(map(str, missing)))}
+            )
+        for img_data in images_data:
+            if img_data.get('upload_token'):
+                img_data['upload'] = uploads[img_data['upload_token']]
+        return images_data
+
     @transaction.atomic
     def create(self, validated_data):
         logger.debug(f"--- ProductWriteSerializer CREATE ---")
@@ -478,53 +587,61 @@ class ProductWriteSerializer(WritableNestedModelSerializer):
         logger.info(f"Product {product.pk} update finished.")
         return product
 
-    # --- _save_attributes ir _save_images metodai lieka tokie patys ---
     def _save_attributes(self, product, attributes_data):
-        # ... (metodo kodas) ...
+        """
+        Įrašo atributus pastoviu užklausų skaičiumi (apps.catalogue.attributes):
+        klasės atributai užkraunami vieną kartą, skirtumai skaičiuojami atmintyje,
+        o pakeitimai įrašomi bulk operacijomis. Neperduoti kodai ir tuščios
+        reikšmės ištrinamos.
+        """
         logger.debug(f"Saving attributes for product {product.pk}: {attributes_data}")
-        valid_attribute_codes = ProductAttribute.objects.filter(
-            product_class=product.product_class
-        ).values_list('code', flat=True)
-        current_attributes = {val.attribute.code: val for val in product.attribute_values.all()}
-        received_codes = {attr_data.get('code') for attr_data in attributes_data if attr_data.get('code')}
-
-        for code_to_delete in current_attributes.keys() - received_codes:
-            current_attributes[code_to_delete].delete()
-            logger.debug(f"Deleted attribute '{code_to_delete}' for product {product.pk}")
-
-        for attr_data in attributes_data:
-            code = attr_data.get('code')
-            value = attr_data.get('value')
-            if not code or value is None: continue
-            if code not in valid_attribute_codes:
-                logger.warning(f"Attribute code '{code}' not valid for class '{product.product_class}'. Skipping.")
-                continue
-            try:
-                attribute = ProductAttribute.objects.get(code=code, product_class=product.product_class)
-                defaults={'value': attribute.validate_value(value)}
-                _, created = ProductAttributeValue.objects.update_or_create(
-                    product=product, attribute=attribute, defaults=defaults
-                )
-                logger.debug(f"{'Created' if created else 'Updated'} attribute '{code}' for product {product.pk}")
-            except ProductAttribute.DoesNotExist: logger.error(f"Attribute code '{code}' should exist but not found.")
-            except (ValidationError, TypeError) as e: logger.error(f"Invalid value '{value}' for attribute '{code}': {e}")
-            except Exception as e: logger.error(f"Error saving attribute '{code}' for product {product.pk}: {e}", exc_info=True)
+        values = {
+            attr_data['code']: attr_data.get('value')
+            for attr_data in attributes_data if attr_data.get('code')
+        }
+        errors = write_attribute_values([(product, values)], replace=True).get(product.pk, {})
+        for code, messages in errors.items():
+            logger.warning(f"Attribute '{code}' not saved for product {product.pk}: {'; '.join(messages)}")
 
     def _save_images(self, product, images_data):
         # ... (metodo kodas) ...
         logger.debug(f"Saving images for product {product.pk}: {images_data}")
+        uploads = {img_data['upload'].pk: img_data['upload'] for img_data in images_data if img_data.get('upload')}
+        if uploads:
+            # Įkėlimas prisegamas tik vieną kartą: lygiagretus įrašas ar pasenusių valymas jo nebeperims
+            attached = ImageUpload.objects.filter(pk__in=uploads, status=ImageUpload.STATUS_READY) \
+                .update(status=ImageUpload.STATUS_ATTACHED)
+            if attached != len(uploads):
+                raise serializers.ValidationError(
+                    {'images': [_("Uploads are already attached or expired, upload the images again.")]}
+                )
         ids_to_keep = set()
+        uploaded_images = []
         for img_data in images_data:
             image_id = img_data.get('id')
             original_file = img_data.get('original')
+            upload = img_data.get('upload')
             caption = img_data.get('caption', '')
             display_order = img_data.get('display_order', 0)
 
-            if image_id:
+            if original_file:
+                # Kaip ir dalinis įkėlimas: dekoduojama, be EXIF perkoduojama, saugoma turinio adresu
+                try:
+                    original_file = store_image(original_file).file.name
+                except (OSError, ValueError, SyntaxError, Image.DecompressionBombError) as exc:
+                    raise serializers.ValidationError({'images': [f"Invalid image '{original_file.name}': {exc}"]})
+
+            if upload and not image_id:
+                # Failas jau apdorotas ir išsaugotas workerio - tik susiejam (be failo kopijavimo)
+                uploaded_images.append(ProductImage(
+                    product=product, original=upload.image.name, caption=caption, display_order=display_order
+                ))
+            elif image_id:
                 ids_to_keep.add(image_id)
                 try:
                     img_obj = ProductImage.objects.get(pk=image_id, product=product)
-                    if original_file: img_obj.original = original_file
+                    if upload: img_obj.original = upload.image.name
+                    elif original_file: img_obj.original = original_file
                     img_obj.caption = caption
                     img_obj.display_order = display_order
                     img_obj.save()
@@ -535,6 +652,16 @@ class ProductWriteSerializer(WritableNestedModelSerializer):
                  ids_to_keep.add(new_image.pk)
                  logger.debug(f"Created new image for product {product.pk}")
 
+        if uploaded_images:
+            # bulk_create nesiunčia signalų - nuorodas į failus skaičiuojam patys
+            ProductImage.objects.bulk_create(uploaded_images)
+            acquire([image.original.name for image in uploaded_images])
+            ids_to_keep.update(image.pk for image in uploaded_images)
+        if uploads:
+            # Failą dabar laiko produkto paveikslėlis, ne įkėlimas
+            release([upload.image.name for upload in uploads.values()])
+            logger.debug(f"Attached {len(uploads)} uploaded images to product {product.pk}")
+
         if product.pk:
             images_to_delete = product.images.exclude(pk__in=ids_to_keep)
             if images_to_delete.exists():
@@ -542,6 +669,61 @@ class ProductWriteSerializer(WritableNestedModelSerializer):
                 images_to_delete.delete()
 
 
+class ProductImportRowSerializer(serializers.Serializer):
+    """
+    Viena masinio importo (api.bulk_import) eilutė. Produktų klasės, sandėliai
+    ir kategorijos tikrinami pagal importuotojo iš anksto užkrautus duomenis
+    (context: product_classes, warehouse_ids, category_ids), be užklausų eilutei.
+    """
+    partner_sku = serializers.CharField(max_length=128)
+    title = serializers.CharField(max_length=255, required=False, allow_blank=True)
+    upc = serializers.CharField(max_length=64, required=False, allow_blank=True)
+    description = serializers.CharField(required=False, allow_blank=True)
+    product_class = serializers.CharField(required=False, allow_blank=True)
+    condition = serializers.ChoiceField(choices=Product.CONDITION_CHOICES, required=False)
+    is_public = serializers.BooleanField(required=False)
+    price = serializers.DecimalField(max_digits=12, decimal_places=2, min_value=0)
+    num_in_stock = serializers.IntegerField(min_value=0)
+    warehouse = serializers.IntegerField(required=False, allow_null=True)
+    categories = serializers.ListField(child=serializers.IntegerField(), required=False)
+    attributes = serializers.DictField(required=False)
+
+    def to_internal_value(self, data):
+        # CSV: kategorijos kaip "1,2,3", atributai kaip attr_<kodas> stulpeliai
+        if isinstance(data, dict):
+            data = dict(data)
+            if isinstance(data.get('categories'), str):
+                data['categories'] = [item.strip() for item in data['categories'].split(',') if item.strip()]
+            attr_columns = {key[len('attr_'):]: data.pop(key) for key in list(data) if key.startswith('attr_')}
+            if attr_columns:
+                data['attributes'] = {**attr_columns, **(data.get('attributes') or {})}
+        return super().to_internal_value(data)
+
+    def validate_product_class(self, value):
+        if not value:
+            return None
+        try:
+            return self.context['product_classes'][value]
+        except KeyError:
+            raise serializers.ValidationError(_("Unknown product class '%(slug)s'.") % {'slug': value})
+
+    def validate_warehouse(self, value):
+        if value is not None and value not in self.context['warehouse_ids']:
+            raise serializers.ValidationError(_("Warehouse not found or does not belong to this partner."))
+        return value
+
+    def validate_categories(self, value):
+        unknown = set(value) - self.context['category_ids']
+        if unknown:
+            raise serializers.ValidationError(
+                _("Unknown categories: %(ids)s.") % {'ids': ', '.join(map(str, sorted(unknown)))}
+            )
+        return list(dict.fromkeys(value))
+
+    def validate_upc(self, value):
+        return value.strip() or None
+
+
 class ProductDocumentSerializer(DocumentSerializer):
     """
     Serializer for the ProductDocument to be used with DRF.
@@ -553,6 +735,10 @@ class ProductDocumentSerializer(DocumentSerializer):
     score = serializers.FloatField(read_only=True, required=False)
     # Jei norite rodyti paryškintus fragmentus (highlighting)
     highlight = serializers.JSONField(read_only=True, required=False) # Arba CharField
+    # Pasiūlymai, atitikę nested offers filtrus (OfferFilterBackend inner_hits)
+    matching_offers = serializers.SerializerMethodField()
+    # Atstumas (km) iki artimiausio atitikusio pasiūlymo, kai nurodyti lat/lon
+    distance = serializers.SerializerMethodField()
 
 
     class Meta:
@@ -568,6 +754,8 @@ class ProductDocumentSerializer(DocumentSerializer):
             'condition',
             'product_class', # Tai bus objektas {'name': ..., 'slug': ...}
             'categories',    # Tai bus sąrašas objektų [{'id': ..., 'name': ..., 'slug': ...}]
+            'category_paths', # ['tevas', 'tevas/vaikas'] - kategorijų keliai su protėviais
+            'attributes',    # [{'code': ..., 'type': ..., 'value_keyword'/'value_integer'/'value_float': ...}]
             'price',
             'num_in_stock', # Jei pridėjote prie ProductDocument
             'partner_name',
@@ -576,10 +764,12 @@ class ProductDocumentSerializer(DocumentSerializer):
             'location_point', # Grąžins {'lat': ..., 'lon': ...}
             'date_created',
             'is_public',
-            'attributes_text', # Jei pridėjote
+            'thumbnail',
             # 'manufacturer', # Jei pridėjote kaip atskirą lauką dokumente
             'score',       # Paieškos įvertis
             'highlight',   # Paryškinti fragmentai
+            'matching_offers',
+            'distance',
             # "categories_data", # Jei naudojate SerializerMethodField ar source='object...'
             # "images_data",
         )
@@ -590,6 +780,38 @@ class ProductDocumentSerializer(DocumentSerializer):
         # Funkciniai siūlymai (jei naudojate)
         # functional_suggester_fields = ('title_suggest',)
 
+    def _get_matching_offers(self, obj):
+        inner_hits = getattr(obj.meta, 'inner_hits', None)
+        if not inner_hits or 'matching_offers' not in inner_hits:
+            return None
+        return list(inner_hits['matching_offers'])
+
+    def get_matching_offers(self, obj):
+        offers = self._get_matching_offers(obj)
+        return [offer.to_dict() for offer in offers] if offers is not None else None
+
+    def get_distance(self, obj):
+        request = self.context.get('request')
+        if not request or 'lat' not in request.query_params:
+            return None
+        offers = self._get_matching_offers(obj)
+        # Su lat/lon inner hits rikiuojami pagal atstumą, sort reikšmė = atstumas km
+        if offers and getattr(offers[0].meta, 'sort', None):
+            return round(offers[0].meta.sort[0], 3)
+        return None
+
+
+class ProductHitSerializer(serializers.BaseSerializer):
+    """
+    Lengvas paieškos rezultatas (?view=compact / ?fields=): grąžina tik ES
+    atrinktą _source be DocumentSerializer laukų introspekcijos.
+    """
+
+    def to_representation(self, hit):
+        data = hit.to_dict()
+        data['id'] = int(hit.meta.id)
+        return data
+
 
 # --- Serializeris Facetams (jei reikia pasirinktinio) 
 
@@ -1,3 +1,1056 @@
-from django.test import TestCase
+import base64
+import fcntl
+import hashlib
+import io
+import json
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.contrib.gis.geos import Point
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.http import QueryDict
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from oscar.core.loading import get_model
+from PIL import Image
+from rest_framework import viewsets
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.test import APIClient, APIRequestFactory
+
+from apps.catalogue import attribute_schema
+from apps.catalogue.attribute_schema import get_schema, get_schema_for_slug
+from apps.catalogue.blobs import collect_unreferenced_blobs, get_blob
+from apps.catalogue.documents import ProductDocument
+from apps.catalogue.indexing import (
+    INDEX_GENERATION_KEY, IndexingStats, bump_index_generation, get_index_generation, iter_index_actions,
+)
+from apps.catalogue.management.commands.rebuild_product_index import Command as RebuildProductIndexCommand
+from apps.catalogue.renditions import generate_pending_renditions, pending_images
+from apps.catalogue.search_sync import (
+    get_queue_high_water, purge_synced_entries, queued_product_ids_since, sync_queued_products,
+)
+from apps.partner.summaries import refresh_offer_summaries
+
+from .backends import MAX_RADIUS_KM, get_geo_params
+from .bulk_import import ProductImporter
+from .cache import SearchCacheMixin, flush_search_cache_stats, get_search_cache_stats, normalize_query_params
+from .models import ImageUpload
+from .pagination import ApproximateCountPaginator, DocumentCursorPagination, estimate_count
+from .serializers import ProductImageReadOnlySerializer, ProductOfferSummarySerializer, ProductWriteSerializer
+from .uploads import delete_expired_uploads, get_temp_path, process_pending_uploads, store_image
+
+Product = get_model('catalogue', 'Product')
+ProductClass = get_model('catalogue', 'ProductClass')
+ProductAttribute = get_model('catalogue', 'ProductAttribute')
+AttributeOption = get_model('catalogue', 'AttributeOption')
+AttributeOptionGroup = get_model('catalogue', 'AttributeOptionGroup')
+ProductAttributeValue = get_model('catalogue', 'ProductAttributeValue')
+ProductImage = get_model('catalogue', 'ProductImage')
+ImageBlob = get_model('catalogue', 'ImageBlob')
+ProductIndexQueue = get_model('catalogue', 'ProductIndexQueue')
+ProductCategory = get_model('catalogue', 'ProductCategory')
+Category = get_model('catalogue', 'Category')
+Partner = get_model('partner', 'Partner')
+ProductOfferSummary = get_model('partner', 'ProductOfferSummary')
+StockRecord = get_model('partner', 'StockRecord')
+Warehouse = get_model('locations', 'Warehouse')
+CustomUser = get_user_model()
+
+
+class PartnerProductListQueryCountTest(TestCase):
+    """ Partnerio produktų sąrašo užklausų skaičius nepriklauso nuo puslapio turinio. """
+
+    # partner_profile (leidimas) + count + produktai (su product_class, offer_summary)
+    # + stockrecords (su partner, warehouse) + images + renditions + categories
+    LIST_QUERY_BUDGET = 7
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(email='tiekejas@example.com', password='slaptas-123')
+        cls.partner = Partner.objects.create(
+            name='Tiekėjas', user=cls.user, verification_status=Partner.STATUS_VERIFIED
+        )
+        cls.warehouses = [
+            Warehouse.objects.create(
+                partner=cls.partner, name=f'Sandėlis {i}', address_line='Gatvė 1', city='Kaunas',
+                country='Lietuva', location=Point(23.9 + i / 100, 54.9, srid=4326),
+            )
+            for i in range(3)
+        ]
+        cls.categories = [Category.add_root(name=f'Kategorija {i}') for i in range(2)]
+        cls.product_class = ProductClass.objects.create(name='Statybinės medžiagos')
+        cls.url = reverse('partner-product-list')
+
+    def create_product(self, index, offers=1, images=0, categories=0):
+        product = Product.objects.create(product_class=self.product_class, title=f'Produktas {index}')
+        for offer in range(offers):
+            StockRecord.objects.create(
+                product=product, partner=self.partner, partner_sku=f'sku-{index}-{offer}',
+                warehouse=self.warehouses[offer % len(self.warehouses)],
+                price=Decimal('9.99') + offer, num_in_stock=offer,
+            )
+        for image in range(images):
+            ProductImage.objects.create(
+                product=product, original=f'images/products/{index}-{image}.jpg', display_order=image
+            )
+        for category in self.categories[:categories]:
+            ProductCategory.objects.create(product=product, category=category)
+        return product
+
+    def get_client(self):
+        client = APIClient()
+        # Naujas vartotojo objektas, kad partner_profile nebūtų cache'intas iš ankstesnės užklausos
+        client.force_authenticate(user=CustomUser.objects.get(pk=self.user.pk))
+        return client
+
+    def get_list(self, client=None):
+        response = (client or self.get_client()).get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def count_list_queries(self):
+        client = self.get_client()
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.get_list(client)
+        return len(ctx.captured_queries), response.data
+
+    def test_list_query_count_is_constant(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_product(0)
+        single_page_queries, data = self.count_list_queries()
+        self.assertEqual(data['count'], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            for index in range(1, 30):
+                self.create_product(index, offers=3, images=2, categories=2)
+        full_page_queries, data = self.count_list_queries()
+        self.assertEqual(len(data['results']), 24)
+
+        self.assertEqual(full_page_queries, single_page_queries)
+        self.assertLessEqual(full_page_queries, self.LIST_QUERY_BUDGET)
+
+    def test_list_has_no_attribute_tree(self):
+        self.create_product(0)
+        _, data = self.count_list_queries()
+        self.assertNotIn('attributes', data['results'][0])
+
+    def test_list_metrics_within_budget(self):
+        self.create_product(0, offers=2, images=1, categories=1)
+        metrics = self.get_list().metrics
+        self.assertEqual(metrics.view, 'PartnerProductViewSet.list')
+        self.assertLessEqual(metrics.sql_count, self.LIST_QUERY_BUDGET)
+        self.assertEqual(metrics.es_count, 0)
+        self.assertGreater(metrics.serialize_time, 0)
+
+    @override_settings(DEBUG=True)
+    def test_server_timing_header_in_debug(self):
+        self.create_product(0)
+        response = self.get_list()
+        self.assertIn('sql;dur=', response['Server-Timing'])
+        self.assertIn(f'desc="{response.metrics.sql_count} queries"', response['Server-Timing'])
+
+
+class PartnerProductBulkImportTest(TestCase):
+    """ Masinis importas: būsenos eilutėms ir vienas indeksavimo užsakymas. """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(email='importas@example.com', password='slaptas-123')
+        cls.partner = Partner.objects.create(
+            name='Importuotojas', user=cls.user, verification_status=Partner.STATUS_VERIFIED
+        )
+        cls.warehouse = Warehouse.objects.create(
+            partner=cls.partner, name='Sandėlis', address_line='Gatvė 1', city='Vilnius',
+            country='Lietuva', location=Point(25.28, 54.69, srid=4326),
+        )
+        cls.product_class = ProductClass.objects.create(name='Plytos')
+        cls.existing = Product.objects.create(product_class=cls.product_class, title='Esama plyta', upc='4770001')
+        cls.url = reverse('partner-product-bulk-import')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_csv_import_reports_each_row(self):
+        body = (
+            'partner_sku,title,upc,product_class,price,num_in_stock,warehouse\n'
+            f'a-1,Nauja plyta,,{self.product_class.slug},1.50,10,{self.warehouse.pk}\n'
+            f'a-2,,4770001,,2.00,5,{self.warehouse.pk}\n'
+            'a-3,Be klasės,,,1.00,1,\n'
+            'a-1,Dublikatas,,,1.00,1,\n'
+        )
+        response = self.client.post(self.url, body, content_type='text/csv')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['status'] for row in response.data['rows']], ['created', 'linked', 'failed', 'failed'])
+        self.assertIn('product_class', response.data['rows'][2]['errors'])
+        self.assertEqual(response.data['rows'][1]['id'], self.existing.pk)
+        self.assertEqual(self.existing.offer_summary.min_price, Decimal('2.00'))
+
+        # Pakartotinis importas atnaujina pasiūlymą, o ne kuria naują
+        response = self.client.post(
+            self.url, '{"partner_sku": "a-1", "price": "1.20", "num_in_stock": 3}\n',
+            content_type='application/x-ndjson',
+        )
+        self.assertEqual(response.data['updated'], 1)
+        stockrecord = StockRecord.objects.get(partner=self.partner, partner_sku='a-1')
+        self.assertEqual((stockrecord.price, stockrecord.num_in_stock), (Decimal('1.20'), 3))
+        self.assertEqual(StockRecord.objects.filter(partner=self.partner).count(), 2)
+
+    def test_rejects_non_list_body(self):
+        response = self.client.post(self.url, {'partner_sku': 'x'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_blank_title_keeps_existing_one(self):
+        self.client.post(
+            self.url, f'{{"partner_sku": "t-1", "title": "Senas", "product_class": "{self.product_class.slug}", '
+            '"price": "1.00", "num_in_stock": 1}\n', content_type='application/x-ndjson',
+        )
+        response = self.client.post(
+            self.url, '{"partner_sku": "t-1", "title": "", "price": "1.10", "num_in_stock": 1}\n',
+            content_type='application/x-ndjson',
+        )
+        self.assertEqual(response.data['updated'], 1)
+        self.assertEqual(Product.objects.get(pk=response.data['rows'][0]['id']).title, 'Senas')
+
+    def test_committed_batches_are_queued_when_a_later_one_crashes(self):
+        rows = [
+            {'partner_sku': sku, 'title': sku, 'product_class': self.product_class.slug,
+             'price': '1.00', 'num_in_stock': 1}
+            for sku in ('p-1', 'p-2')
+        ]
+        with mock.patch('api.bulk_import.refresh_offer_summaries', side_effect=[None, RuntimeError]):
+            with self.assertRaises(RuntimeError):
+                ProductImporter(self.partner, batch_size=1).run(rows)
+
+        first = StockRecord.objects.get(partner=self.partner, partner_sku='p-1').product_id
+        self.assertTrue(ProductIndexQueue.objects.filter(product_id=first).exists())
+        self.assertFalse(StockRecord.objects.filter(partner=self.partner, partner_sku='p-2').exists())
+
+
+class ProductAttributeWriteQueryCountTest(TestCase):
+    """ Atributų įrašymas: užklausų skaičius nepriklauso nuo atributų skaičiaus. """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.product_class = ProductClass.objects.create(name='Dažai')
+        cls.attributes = [
+            ProductAttribute.objects.create(
+                product_class=cls.product_class, name=f'Atributas {i}', code=f'attr{i}',
+                type=ProductAttribute.INTEGER,
+            )
+            for i in range(30)
+        ]
+
+    def save_attributes(self, product, values):
+        data = [{'code': code, 'value': value} for code, value in values.items()]
+        with CaptureQueriesContext(connection) as ctx:
+            ProductWriteSerializer()._save_attributes(product, data)
+        return len(ctx.captured_queries)
+
+    def stored(self, product):
+        return dict(product.attribute_values.values_list('attribute__code', 'value_integer'))
+
+    def test_query_count_is_constant(self):
+        small = Product.objects.create(product_class=self.product_class, title='Mažas')
+        large = Product.objects.create(product_class=self.product_class, title='Didelis')
+        self.assertEqual(
+            self.save_attributes(small, {'attr0': 1}),
+            self.save_attributes(large, {f'attr{i}': i for i in range(30)}),
+        )
+        self.assertEqual(self.stored(large), {f'attr{i}': i for i in range(30)})
+
+        # Pakeista, nepakeista, ištrinta (neperduota) ir neteisinga reikšmė
+        values = {f'attr{i}': i for i in range(1, 29)}
+        values.update(attr1=100, attr2='ne skaičius')
+        self.save_attributes(large, values)
+        expected = {f'attr{i}': i for i in range(2, 29)}
+        expected['attr1'] = 100
+        self.assertEqual(self.stored(large), expected)
+
+
+class AttributeSchemaCacheTest(TestCase):
+    """ Atributų schema imama iš cache ir invaliduojama pakeitus atributus/opcijas. """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.product_class = ProductClass.objects.create(name='Grindys')
+        cls.group = AttributeOptionGroup.objects.create(name='Spalvos')
+        AttributeOption.objects.create(group=cls.group, option='Balta')
+        cls.attribute = ProductAttribute.objects.create(
+            product_class=cls.product_class, name='Spalva', code='spalva',
+            type=ProductAttribute.OPTION, option_group=cls.group,
+        )
+
+    def test_cached_and_invalidated(self):
+        get_schema(self.product_class.pk)
+        with self.assertNumQueries(0):
+            schema = get_schema(self.product_class.pk)
+        self.assertEqual(list(schema.get('spalva').options), ['Balta'])
+
+        AttributeOption.objects.create(group=self.group, option='Juoda')
+        self.assertEqual(list(get_schema(self.product_class.pk).get('spalva').options), ['Balta', 'Juoda'])
+
+        ProductAttribute.objects.create(
+            product_class=self.product_class, name='Plotis', code='plotis', type=ProductAttribute.INTEGER,
+        )
+        self.assertEqual(get_schema_for_slug(self.product_class.slug).get('plotis').type, ProductAttribute.INTEGER)
+
+    def test_shared_cache_read_once_per_ttl(self):
+        get_schema(self.product_class.pk)
+        # Kiekvienai atributo reikšmei prašoma schemos - bendras (failų) cache neskaitomas
+        with mock.patch.object(attribute_schema, 'caches') as shared, self.assertNumQueries(0):
+            for _ in range(300):
+                get_schema(self.product_class.pk)
+        shared.__getitem__.assert_not_called()
+
+
+@override_settings(IMAGE_UPLOAD_TEMP_DIR=tempfile.mkdtemp(), MEDIA_ROOT=tempfile.mkdtemp())
+class ImageUploadTest(TestCase):
+    """ Dalinis įkėlimas: tęsiamas nuo offset'o, apdorojamas workerio be EXIF. """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(email='nuotraukos@example.com', password='slaptas-123')
+        cls.partner = Partner.objects.create(
+            name='Fotografas', user=cls.user, verification_status=Partner.STATUS_VERIFIED
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def make_jpeg(self):
+        exif = Image.Exif()
+        exif[0x010F] = 'Gamintojas'  # Make
+        buffer = io.BytesIO()
+        Image.new('RGB', (64, 32), 'red').save(buffer, format='JPEG', exif=exif.tobytes())
+        return buffer.getvalue()
+
+    def send_chunk(self, url, offset, data):
+        return self.client.generic(
+            'PATCH', url, data, content_type='application/offset+octet-stream', HTTP_UPLOAD_OFFSET=str(offset)
+        )
+
+    def test_chunked_upload_is_processed(self):
+        content = self.make_jpeg()
+        response = self.client.post(
+            reverse('image-upload-list'),
+            {'filename': 'plyta.jpg', 'size': len(content), 'content_type': 'image/jpeg'}, format='json',
+        )
+        self.assertEqual(response.status_code, 201)
+        url = reverse('image-upload-detail', args=[response.data['token']])
+
+        half = len(content) // 2
+        self.assertEqual(self.send_chunk(url, 0, content[:half])['Upload-Offset'], str(half))
+        # Pakartota (jau gauta) dalis atmetama, klientas tęsia nuo serverio offset'o
+        response = self.send_chunk(url, 0, content[:half])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.client.head(url)['Upload-Offset'], str(half))
+
+        response = self.send_chunk(url, half, content[half:])
+        self.assertEqual(response.data['status'], ImageUpload.STATUS_UPLOADED)
+
+        self.assertEqual(process_pending_uploads(), 1)
+        upload = ImageUpload.objects.get(pk=response.data['token'])
+        self.assertEqual((upload.status, upload.width, upload.height), (ImageUpload.STATUS_READY, 64, 32))
+        with Image.open(upload.image.path) as image:
+            self.assertEqual(len(image.getexif()), 0)
+
+    def test_concurrent_chunk_is_rejected(self):
+        upload = ImageUpload.objects.create(partner=self.partner, filename='x.jpg', size=8)
+        url = reverse('image-upload-detail', args=[upload.pk])
+        path = get_temp_path(upload)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Kitas request'as dar rašo tą pačią dalį
+        with open(path, 'ab') as other:
+            fcntl.flock(other, fcntl.LOCK_EX)
+            response = self.send_chunk(url, 0, b'abcd')
+        self.assertEqual((response.status_code, response['Upload-Offset']), (409, '0'))
+        self.assertEqual(self.send_chunk(url, 0, b'abcd')['Upload-Offset'], '4')
+
+    def test_invalid_image_fails(self):
+        upload = ImageUpload.objects.create(partner=self.partner, filename='x.jpg', size=4)
+        self.send_chunk(reverse('image-upload-detail', args=[upload.pk]), 0, b'nope')
+        process_pending_uploads()
+        upload.refresh_from_db()
+        self.assertEqual(upload.status, ImageUpload.STATUS_FAILED)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ProductImageRenditionTest(TestCase):
+    """ Renditions generuojamos workerio, serializeris jas grąžina be failų skaitymo. """
+
+    def test_srcset_from_renditions(self):
+        product = Product.objects.create(product_class=ProductClass.objects.create(name='Vamzdžiai'), title='Vamzdis')
+        buffer = io.BytesIO()
+        Image.new('RGB', (800, 400), 'blue').save(buffer, format='PNG')
+        image = ProductImage(product=product, display_order=0)
+        image.original.save('vamzdis.png', ContentFile(buffer.getvalue()))
+
+        self.assertEqual(ProductImageReadOnlySerializer(image).data['srcset'], {})
+        processed, failed = generate_pending_renditions()
+        self.assertEqual(([img.pk for img in processed], failed), ([image.pk], []))
+        self.assertFalse(pending_images().exists())
+
+        image = ProductImage.objects.prefetch_related('renditions').get(pk=image.pk)
+        with self.assertNumQueries(0):
+            data = ProductImageReadOnlySerializer(image).data
+        # 1280 > 800: didžiausia rendition - originalo pločio
+        self.assertEqual(sorted(data['srcset']['webp']), [160, 320, 640, 800])
+        self.assertEqual(sorted(data['srcset']['jpeg']), [160, 320, 640, 800])
+        self.assertTrue(data['thumbnail_url'].endswith('-320.jpg'))
+
+    def test_transparent_original_keeps_alpha(self):
+        product = Product.objects.create(product_class=ProductClass.objects.create(name='Lipdukai'), title='Lipdukas')
+        buffer = io.BytesIO()
+        Image.new('RGBA', (400, 200), (255, 0, 0, 0)).save(buffer, format='PNG')
+        image = ProductImage(product=product, display_order=0)
+        image.original.save('lipdukas.png', ContentFile(buffer.getvalue()))
+
+        generate_pending_renditions()
+        image = ProductImage.objects.prefetch_related('renditions').get(pk=image.pk)
+        data = ProductImageReadOnlySerializer(image).data
+        # Permatomam originalui JPEG (baltas fonas) keičiamas PNG
+        self.assertEqual(sorted(data['srcset']), ['png', 'webp'])
+        self.assertTrue(data['thumbnail_url'].endswith('-320.png'))
+        thumbnail = image.renditions.get(format='png', width=320)
+        with thumbnail.file.open('rb') as file, Image.open(file) as rendered:
+            self.assertEqual(rendered.mode, 'RGBA')
+            self.assertEqual(rendered.getpixel((0, 0))[3], 0)
+
+
+@override_settings(IMAGE_UPLOAD_TEMP_DIR=tempfile.mkdtemp(), MEDIA_ROOT=tempfile.mkdtemp(), IMAGE_UPLOAD_EXPIRY_HOURS=0)
+class ImageBlobTest(TestCase):
+    """ Vienodi failai saugomi vieną kartą, failas trinamas kai nebelieka nuorodų. """
+
+    def make_upload(self, partner, content):
+        upload = ImageUpload.objects.create(
+            partner=partner, filename='plyta.png', size=len(content), offset=len(content),
+            status=ImageUpload.STATUS_UPLOADED,
+        )
+        path = get_temp_path(upload)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(content)
+        return upload
+
+    def test_identical_uploads_share_blob(self):
+        user = CustomUser.objects.create_user(email='blob@example.com', password='slaptas-123')
+        partner = Partner.objects.create(name='Dublikatai', user=user, verification_status=Partner.STATUS_VERIFIED)
+        buffer = io.BytesIO()
+        Image.new('RGB', (40, 20), 'green').save(buffer, format='PNG')
+        first = self.make_upload(partner, buffer.getvalue())
+        second = self.make_upload(partner, buffer.getvalue())
+
+        self.assertEqual(process_pending_uploads(), 2)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.image.name, second.image.name)
+        blob = ImageBlob.objects.get()
+        self.assertEqual((blob.ref_count, blob.width, blob.height), (2, 40, 20))
+
+        product = Product.objects.create(product_class=ProductClass.objects.create(name='Plytos'), title='Plyta')
+        image = ProductImage.objects.create(product=product, original=first.image.name, display_order=0)
+        blob.refresh_from_db()
+        self.assertEqual(blob.ref_count, 3)
+
+        # Nepriskirti įkėlimai ir paveikslėlis atlaisvina nuorodas, failas surenkamas
+        self.assertEqual(delete_expired_uploads(), 2)
+        image.delete()
+        blob.refresh_from_db()
+        self.assertEqual(blob.ref_count, 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(collect_unreferenced_blobs(grace_hours=0), 1)
+        self.assertFalse(ImageBlob.objects.exists())
+        self.assertFalse(default_storage.exists(blob.file.name))
+
+    def test_multipart_original_is_sanitized_before_reuse(self):
+        exif = Image.Exif()
+        exif[0x8825] = {1: 'N', 2: (54.0, 41.0, 0.0)}  # GPSInfo
+        buffer = io.BytesIO()
+        Image.new('RGB', (30, 30), 'red').save(buffer, format='JPEG', exif=exif.tobytes())
+        raw = buffer.getvalue()
+
+        # Multipart ProductImage.original kelias
+        blob = store_image(ContentFile(raw, name='plyta.jpg'))
+        with blob.file.open('rb') as file:
+            stored = file.read()
+        self.assertEqual(len(Image.open(io.BytesIO(stored)).getexif()), 0)
+        self.assertEqual(blob.sha256, hashlib.sha256(stored).hexdigest())
+        self.assertEqual(blob.source_sha256, hashlib.sha256(raw).hexdigest())
+
+        # Tas pats failas daliniu įkėlimu gauna jau išvalytą blob'ą
+        user = CustomUser.objects.create_user(email='gps@example.com', password='slaptas-123')
+        partner = Partner.objects.create(name='GPS', user=user, verification_status=Partner.STATUS_VERIFIED)
+        upload = self.make_upload(partner, raw)
+        process_pending_uploads()
+        upload.refresh_from_db()
+        self.assertEqual(upload.image.name, blob.file.name)
+        self.assertEqual(ImageBlob.objects.count(), 1)
+
+    def test_reused_blob_survives_collection(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (10, 10), 'white').save(buffer, format='PNG')
+        blob = store_image(ContentFile(buffer.getvalue(), name='balta.png'))
+        ImageBlob.objects.filter(pk=blob.pk).update(date_updated=timezone.now() - timedelta(days=2))
+
+        # Pakartotinis įkėlimas paliečia blob'ą - surinkėjas jo nebetrina, kol nuoroda įrašoma
+        self.assertEqual(get_blob(blob.pk), blob)
+        self.assertEqual(collect_unreferenced_blobs(grace_hours=24), 0)
+        self.assertTrue(ImageBlob.objects.filter(pk=blob.pk).exists())
+
+    def test_upload_is_attached_once(self):
+        user = CustomUser.objects.create_user(email='prisegimas@example.com', password='slaptas-123')
+        partner = Partner.objects.create(name='Prisegimas', user=user, verification_status=Partner.STATUS_VERIFIED)
+        buffer = io.BytesIO()
+        Image.new('RGB', (12, 12), 'black').save(buffer, format='PNG')
+        upload = self.make_upload(partner, buffer.getvalue())
+        process_pending_uploads()
+        upload.refresh_from_db()
+        product = Product.objects.create(product_class=ProductClass.objects.create(name='Durys'), title='Durys')
+
+        ProductWriteSerializer()._save_images(product, [{'upload': upload}])
+        # Tas pats žetonas antrą kartą (lygiagretus įrašas) nebeatlaisvina blob'o
+        with self.assertRaises(ValidationError):
+            ProductWriteSerializer()._save_images(product, [{'upload': upload}])
+        self.assertEqual(ImageBlob.objects.get().ref_count, 1)
+
+        # Prisegtas įkėlimas nebevalomas kaip pasenęs
+        self.assertEqual(delete_expired_uploads(), 0)
+        self.assertEqual(ImageBlob.objects.get().ref_count, 1)
+        self.assertEqual(product.images.count(), 1)
+
+
+class SearchIndexQueueTest(TestCase):
+    """ Pakeitimai įrašo paveiktus produktus į eilę, workeris ištrina tik sėkmingai sinchronizuotus. """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(email='eile@example.com', password='slaptas-123')
+        cls.partner = Partner.objects.create(name='Eilė', user=cls.user, verification_status=Partner.STATUS_VERIFIED)
+        cls.warehouse = Warehouse.objects.create(
+            partner=cls.partner, name='Sandėlis', address_line='Gatvė 1', city='Vilnius',
+            country='Lietuva', location=Point(25.28, 54.69, srid=4326),
+        )
+        product_class = ProductClass.objects.create(name='Dažai')
+        cls.products = [Product.objects.create(product_class=product_class, title=f'Dažai {i}') for i in range(3)]
+        cls.stockrecords = [
+            StockRecord.objects.create(
+                product=product, partner=cls.partner, partner_sku=f'dazai-{i}', warehouse=cls.warehouse,
+                price=Decimal('5.00'), num_in_stock=1,
+            )
+            for i, product in enumerate(cls.products[:2])
+        ]
+
+    def queued_after(self, change):
+        ProductIndexQueue.objects.all().delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+        return set(ProductIndexQueue.objects.values_list('product_id', flat=True))
+
+    def test_changes_enqueue_affected_products(self):
+        first, second, unstocked = self.products
+        self.assertEqual(self.queued_after(first.save), {first.pk})
+        self.assertEqual(self.queued_after(self.stockrecords[0].save), {first.pk})
+        self.assertEqual(self.queued_after(self.warehouse.save), {first.pk, second.pk})
+        self.assertEqual(self.queued_after(self.partner.save), {first.pk, second.pk})
+        self.assertEqual(self.queued_after(self.stockrecords[1].delete), {second.pk})
+        self.assertEqual(self.queued_after(self.warehouse.delete), {first.pk})
+        self.assertEqual(self.queued_after(unstocked.delete), {unstocked.pk})
+
+    def run_worker(self, failing_ids=(), status=400):
+        sent = []
+        error = 'es_rejected_execution_exception' if status == 429 else 'mapper_parsing_exception'
+
+        def fake_bulk(client, actions, **kwargs):
+            actions = list(actions)
+            sent.extend(action['_id'] for action in actions)
+            errors = [
+                {action['_op_type']: {'_id': str(action['_id']), 'status': status, 'error': error}}
+                for action in actions if action['_id'] in failing_ids
+            ]
+            return len(actions) - len(errors), errors
+
+        with mock.patch('apps.catalogue.search_sync.bulk', side_effect=fake_bulk):
+            synced = sync_queued_products()
+        return synced, sent
+
+    def test_worker_syncs_each_product_once(self):
+        first, second, _ = self.products
+        ProductIndexQueue.objects.all().delete()
+        ProductIndexQueue.objects.bulk_create([ProductIndexQueue(product_id=pk) for pk in (first.pk, first.pk, second.pk)])
+
+        synced, sent = self.run_worker()
+        self.assertEqual((synced, sorted(sent)), (2, sorted([first.pk, second.pk])))
+        self.assertFalse(ProductIndexQueue.objects.filter(date_synced__isnull=True).exists())
+        # Sinchronizuotos eilutės lieka rebuild_product_index pakartojimui
+        self.assertEqual(queued_product_ids_since(0, timezone.now()), {first.pk, second.pk})
+
+    def test_rebuild_replays_entries_queued_since_high_water(self):
+        first, second, _ = self.products
+        ProductIndexQueue.objects.all().delete()
+        ProductIndexQueue.objects.create(product_id=first.pk)
+        high_water, started = get_queue_high_water(), timezone.now()
+        ProductIndexQueue.objects.create(product_id=second.pk)
+        self.run_worker()
+        self.assertEqual(queued_product_ids_since(high_water, started), {second.pk})
+
+        with override_settings(SEARCH_SYNC_RETENTION_HOURS=0):
+            self.assertEqual(purge_synced_entries(), 2)
+
+    def test_rebuild_allows_documents_of_products_deleted_during_build(self):
+        first, _, unstocked = self.products
+        ProductIndexQueue.objects.all().delete()
+        high_water, started = get_queue_high_water(), timezone.now()
+        max_pk = unstocked.pk
+        ProductIndexQueue.objects.create(product_id=first.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            unstocked.delete()
+
+        command = RebuildProductIndexCommand()
+        self.assertEqual(command._deleted_since(high_water, started, max_pk), 1)
+        # Vėliau sukurti (id > max_pk) produktai lieka eilės pakartojimui
+        self.assertEqual(command._deleted_since(high_water, started, max_pk - 1), 0)
+
+    @override_settings(SEARCH_SYNC_MAX_ATTEMPTS=2)
+    def test_failed_products_stay_queued(self):
+        first, second, _ = self.products
+        ProductIndexQueue.objects.all().delete()
+        ProductIndexQueue.objects.bulk_create([ProductIndexQueue(product_id=pk) for pk in (first.pk, second.pk)])
+
+        self.run_worker(failing_ids={second.pk})
+        row = ProductIndexQueue.objects.get(date_synced__isnull=True)
+        self.assertEqual((row.product_id, row.attempts), (second.pk, 1))
+        self.assertIn('mapper_parsing_exception', row.last_error)
+        # Kartojama tik po atidėjimo, ne tame pačiame eilės išvalyme
+        self.assertGreater(row.next_attempt_at, timezone.now())
+        self.assertEqual(self.run_worker(), (0, []))
+
+        # Paskutinis bandymas: eilutė lieka, bet workeris jos nebeima
+        ProductIndexQueue.objects.update(next_attempt_at=timezone.now())
+        self.run_worker(failing_ids={second.pk})
+        ProductIndexQueue.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(ProductIndexQueue.objects.get(date_synced__isnull=True).attempts, 2)
+        self.assertEqual(self.run_worker(), (0, []))
+
+    @override_settings(SEARCH_SYNC_MAX_ATTEMPTS=1)
+    def test_rejected_items_do_not_count_as_attempts(self):
+        first = self.products[0]
+        ProductIndexQueue.objects.all().delete()
+        ProductIndexQueue.objects.create(product_id=first.pk)
+
+        # 429 (es_rejected_execution) - klasteris perkrautas, dokumentas geras
+        self.run_worker(failing_ids={first.pk}, status=429)
+        row = ProductIndexQueue.objects.get(date_synced__isnull=True)
+        self.assertEqual(row.attempts, 0)
+        ProductIndexQueue.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(self.run_worker(), (1, [first.pk]))
+
+
+class ProductOfferSummaryTest(TestCase):
+    """ Pasiūlymų suvestinė perskaičiuojama keičiant ir trinant sandėlio įrašus. """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.partners, cls.warehouses = [], []
+        for i in range(2):
+            user = CustomUser.objects.create_user(email=f'suvestine{i}@example.com', password='slaptas-123')
+            partner = Partner.objects.create(name=f'Pardavėjas {i}', user=user, verification_status=Partner.STATUS_VERIFIED)
+            cls.partners.append(partner)
+            cls.warehouses.append(Warehouse.objects.create(
+                partner=partner, name=f'Sandėlis {i}', address_line='Gatvė 1', city='Kaunas',
+                country='Lietuva', location=Point(23.9 + i / 10, 54.9, srid=4326),
+            ))
+        cls.product = Product.objects.create(product_class=ProductClass.objects.create(name='Klijai'), title='Klijai')
+
+    def add_offer(self, index, price, stock):
+        with self.captureOnCommitCallbacks(execute=True):
+            return StockRecord.objects.create(
+                product=self.product, partner=self.partners[index], partner_sku=f'klijai-{index}',
+                warehouse=self.warehouses[index], price=Decimal(price), num_in_stock=stock,
+            )
+
+    def summary(self):
+        summary = ProductOfferSummary.objects.get(product=self.product)
+        return {
+            'min_price': summary.min_price, 'max_price': summary.max_price, 'price': summary.best_price,
+            'total_stock': summary.total_stock, 'offer_count': summary.offer_count, 'best': summary.best_stockrecord_id,
+            'partner': summary.cheapest_partner_id, 'warehouse': summary.cheapest_warehouse_id,
+        }
+
+    def test_summary_follows_stockrecords(self):
+        cheap = self.add_offer(0, '10.00', 0)
+        in_stock = self.add_offer(1, '12.00', 5)
+        # Pigiausias turimas sandėlyje pasiūlymas laimi prieš pigesnį be likučio; jo kaina rodoma su jo partneriu,
+        # o min_price lieka tik kainų intervalo filtrui
+        self.assertEqual(self.summary(), {
+            'min_price': Decimal('10.00'), 'max_price': Decimal('12.00'), 'price': Decimal('12.00'),
+            'total_stock': 5, 'offer_count': 2,
+            'best': in_stock.pk, 'partner': self.partners[1].pk, 'warehouse': self.warehouses[1].pk,
+        })
+        self.assertEqual(
+            ProductOfferSummarySerializer(ProductOfferSummary.objects.get(product=self.product)).data['price'], 12.0
+        )
+
+        cheap.num_in_stock = 3
+        with self.captureOnCommitCallbacks(execute=True):
+            cheap.save()
+        summary = self.summary()
+        self.assertEqual(
+            (summary['best'], summary['price'], summary['warehouse'], summary['total_stock']),
+            (cheap.pk, Decimal('10.00'), self.warehouses[0].pk, 8),
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            cheap.delete()
+        self.assertEqual(self.summary(), {
+            'min_price': Decimal('12.00'), 'max_price': Decimal('12.00'), 'price': Decimal('12.00'),
+            'total_stock': 5, 'offer_count': 1,
+            'best': in_stock.pk, 'partner': self.partners[1].pk, 'warehouse': self.warehouses[1].pk,
+        })
+
+        with self.captureOnCommitCallbacks(execute=True):
+            in_stock.delete()
+        self.assertEqual(self.summary(), {
+            'min_price': None, 'max_price': None, 'price': None, 'total_stock': 0, 'offer_count': 0,
+            'best': None, 'partner': None, 'warehouse': None,
+        })
+
+
+class GeoParamsTest(TestCase):
+    """ Netinkami lat/lon/radius grąžina 400, o ne Elasticsearch klaidą. """
+
+    def geo_params(self, **params):
+        return get_geo_params(Request(APIRequestFactory().get('/', params)))
+
+    def test_valid_params(self):
+        self.assertEqual(self.geo_params(lat='54.9', lon='23.9', radius='15'), ({'lat': 54.9, 'lon': 23.9}, 15.0))
+        self.assertEqual(self.geo_params(), (None, None))
+
+    def test_invalid_params_are_rejected(self):
+        for params in (
+            {'radius': '-5'}, {'radius': '0'}, {'radius': 'nan'}, {'radius': 'inf'},
+            {'radius': str(MAX_RADIUS_KM + 1)}, {'radius': 'toli'},
+            {'lat': '91'}, {'lon': '-181'}, {'lat': 'nan'}, {'lon': 'inf'}, {'lat': None},
+        ):
+            query = {'lat': '54.9', 'lon': '23.9', **params}
+            with self.subTest(params=params), self.assertRaises(ValidationError):
+                self.geo_params(**{key: value for key, value in query.items() if value is not None})
+
+
+def base64_json(payload):
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip('=')
+
+
+class DocumentCursorTest(TestCase):
+    """ Kursorius nepermatomas, susietas su rikiavimu, sugadintas atmetamas. """
+
+    sort = [{'offer_summary.min_price': {'order': 'asc'}}, {'id': {'order': 'asc'}}]
+
+    def paginator(self, sort=None):
+        paginator = DocumentCursorPagination()
+        paginator.sort_fingerprint = paginator._fingerprint(sort or self.sort)
+        return paginator
+
+    def test_round_trip(self):
+        cursor = self.paginator().encode_cursor([12.5, 'ąžuolas', 42])
+        self.assertNotIn('=', cursor)
+        self.assertEqual(self.paginator().decode_cursor(cursor), [12.5, 'ąžuolas', 42])
+
+    def test_cursor_of_other_sort_is_rejected(self):
+        cursor = self.paginator().encode_cursor([12.5, 42])
+        other = self.paginator([{'_score': {'order': 'desc'}}, {'id': {'order': 'asc'}}])
+        with self.assertRaises(NotFound):
+            other.decode_cursor(cursor)
+
+    def test_tampered_cursor_is_rejected(self):
+        paginator = self.paginator()
+        cursor = paginator.encode_cursor([12.5, 42])
+        for tampered in (cursor[:-3], base64_json([1]), 'bm90LWpzb24', base64_json({'a': [1]}), base64_json({'s': 'x', 'a': 1})):
+            with self.subTest(cursor=tampered), self.assertRaises(NotFound):
+                paginator.decode_cursor(tampered)
+        # Teisingas parašas, bet a - ne sąrašas
+        with self.assertRaises(NotFound):
+            paginator.decode_cursor(base64_json({'s': paginator.sort_fingerprint, 'a': 'x'}))
+
+
+class CountingListViewSet(viewsets.ViewSet):
+    authentication_classes = ()
+    permission_classes = ()
+    calls = 0
+
+    def list(self, request):
+        type(self).calls += 1
+        return Response({'calls': type(self).calls})
+
+
+class CachedListViewSet(SearchCacheMixin, CountingListViewSet):
+    pass
+
+
+SEARCH_TEST_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'search': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'search-tests'},
+}
+
+
+@override_settings(CACHES=SEARCH_TEST_CACHES)
+class SearchCacheTest(TestCase):
+    """ Vienodos užklausos (bet kokia parametrų tvarka) dalijasi įrašu, kartos pakeitimas jį panaikina. """
+
+    def setUp(self):
+        flush_search_cache_stats()
+        caches['search'].clear()
+        CountingListViewSet.calls = 0
+        self.view = CachedListViewSet.as_view({'get': 'list'}, basename='cached')
+
+    def get(self, query):
+        return self.view(APIRequestFactory().get('/search/?' + query))
+
+    def test_normalize_query_params(self):
+        normalize = lambda query: normalize_query_params(QueryDict(query))
+        self.assertEqual(normalize('b=2&a=1'), normalize('a=1&b=2'))
+        self.assertEqual(normalize('tag=y&tag=x'), normalize('tag=x&tag=y'))
+        self.assertEqual(normalize('a=1&q=&page=1'), normalize('a=1'))
+        self.assertNotEqual(normalize('a=1&page=2'), normalize('a=1'))
+        self.assertNotEqual(normalize('a=1'), normalize('a=2'))
+
+    def test_hit_after_miss(self):
+        first = self.get('b=2&a=1&q=')
+        second = self.get('a=1&b=2')
+        self.assertEqual((first['X-Search-Cache'], second['X-Search-Cache']), ('MISS', 'HIT'))
+        self.assertEqual(second.data, {'calls': 1})
+
+        bump_index_generation()
+        self.assertEqual(self.get('a=1&b=2')['X-Search-Cache'], 'MISS')
+        self.assertEqual(CountingListViewSet.calls, 2)
+
+    def test_evicted_generation_does_not_restart_from_one(self):
+        generation = get_index_generation()
+        caches['search'].delete(INDEX_GENERATION_KEY)
+        self.assertGreater(get_index_generation(), generation)
+
+    def test_price_update_invalidates_cached_responses(self):
+        user = CustomUser.objects.create_user(email='kesas@example.com', password='slaptas-123')
+        partner = Partner.objects.create(name='Kešas', user=user, verification_status=Partner.STATUS_VERIFIED)
+        product = Product.objects.create(product_class=ProductClass.objects.create(name='Glaistai'), title='Glaistas')
+        stockrecord = StockRecord.objects.create(
+            product=product, partner=partner, partner_sku='glaistas', price=Decimal('3.00'), num_in_stock=1,
+        )
+        ProductIndexQueue.objects.all().delete()
+        self.get('q=glaistas')
+        self.assertEqual(self.get('q=glaistas')['X-Search-Cache'], 'HIT')
+
+        stockrecord.price = Decimal('2.50')
+        with self.captureOnCommitCallbacks(execute=True):
+            stockrecord.save()
+        with mock.patch('apps.catalogue.search_sync.bulk', return_value=(1, [])):
+            self.assertEqual(sync_queued_products(), 1)
+        self.assertEqual(self.get('q=glaistas')['X-Search-Cache'], 'MISS')
+
+    def test_stats_are_counted_in_process(self):
+        # Tarp nuleidimų bendri skaitikliai neliečiami
+        with mock.patch('api.cache._incr') as incr:
+            for _ in range(3):
+                self.get('a=1')
+        incr.assert_not_called()
+        stats = get_search_cache_stats()
+        self.assertEqual((stats['hits'], stats['misses']), (2, 1))
+
+
+class PartnerProductFilterTest(TestCase):
+    """ Kainų filtrai per offer_summary ir ?count=approx. """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(email='filtrai@example.com', password='slaptas-123')
+        cls.partner = Partner.objects.create(name='Filtrai', user=cls.user, verification_status=Partner.STATUS_VERIFIED)
+        product_class = ProductClass.objects.create(name='Plytelės')
+        cls.products = {}
+        for title, prices in (('pigi-ir-brangi', ['5.00', '20.00']), ('brangi', ['30.00']), ('pigi', ['8.00'])):
+            product = Product.objects.create(product_class=product_class, title=title)
+            for index, price in enumerate(prices):
+                StockRecord.objects.create(
+                    product=product, partner=cls.partner, partner_sku=f'{title}-{index}',
+                    price=Decimal(price), num_in_stock=1,
+                )
+            cls.products[title] = product
+        refresh_offer_summaries([product.pk for product in cls.products.values()])
+        cls.url = reverse('partner-product-list')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def titles(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], len(response.data['results']))
+        return sorted(product['title'] for product in response.data['results'])
+
+    def test_price_range_matches_any_offer(self):
+        # min_price: bent vienas pasiūlymas >= min_price (max_price >= min_price)
+        self.assertEqual(self.titles(min_price='10'), ['brangi', 'pigi-ir-brangi'])
+        # max_price: bent vienas pasiūlymas <= max_price (min_price <= max_price)
+        self.assertEqual(self.titles(max_price='10'), ['pigi', 'pigi-ir-brangi'])
+        self.assertEqual(self.titles(min_price='10', max_price='25'), ['pigi-ir-brangi'])
+        self.assertEqual(self.titles(min_price='40'), [])
+
+    def test_exact_count_by_default(self):
+        with mock.patch('api.pagination.estimate_count', return_value=5000) as estimate:
+            response = self.client.get(self.url)
+        estimate.assert_not_called()
+        self.assertEqual((response.data['count'], response['X-Total-Count']), (3, '3'))
+        self.assertFalse(response.has_header('X-Total-Count-Approximate'))
+
+    def test_approximate_count(self):
+        above = ApproximateCountPaginator.exact_count_threshold + 1
+        with mock.patch('api.pagination.estimate_count', return_value=above):
+            response = self.client.get(self.url, {'count': 'approx'})
+        self.assertEqual((response.data['count'], response['X-Total-Count-Approximate']), (above, 'true'))
+        self.assertEqual(len(response.data['results']), 3)
+
+        # Mažas įvertinimas - skaičiuojama tiksliai
+        with mock.patch('api.pagination.estimate_count', return_value=2):
+            response = self.client.get(self.url, {'count': 'approx'})
+        self.assertEqual(response.data['count'], 3)
+        self.assertFalse(response.has_header('X-Total-Count-Approximate'))
+
+    def test_estimate_count_uses_the_planner(self):
+        self.assertGreaterEqual(estimate_count(Product.objects.filter(title__startswith='pigi')), 0)
+
+
+class ProductDocumentPrepareTest(TestCase):
+    """ Dokumento laukai, skaičiuojami iš DB be Elasticsearch. """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.product_class = ProductClass.objects.create(name='Apdaila')
+        cls.product = Product.objects.create(product_class=cls.product_class, title='Plytelės')
+
+    def test_category_paths_roll_up_to_ancestors(self):
+        root = Category.add_root(name='Statybinės medžiagos')
+        child = root.add_child(name='Apdaila')
+        leaf = child.add_child(name='Plytelės')
+        other = Category.add_root(name='Įrankiai')
+        orphan = other.add_child(name='Pjūklai')
+        for category in (leaf, child, orphan):
+            ProductCategory.objects.create(product=self.product, category=category)
+        # Protėvio kelio nebėra (pvz., medis pertvarkomas) - tokia kategorija praleidžiama
+        Category.objects.filter(pk=other.pk).update(path='9999')
+
+        self.assertEqual(ProductDocument().prepare_category_paths(self.product), [
+            root.slug, f'{root.slug}/{child.slug}', f'{root.slug}/{child.slug}/{leaf.slug}',
+        ])
+
+    def test_attributes_by_type(self):
+        group = AttributeOptionGroup.objects.create(name='Spalvos')
+        red, white = (AttributeOption.objects.create(group=group, option=option) for option in ('raudona', 'balta'))
+        values = {
+            ProductAttribute.TEXT: {'value_text': 'keramika'},
+            ProductAttribute.INTEGER: {'value_integer': 0},
+            ProductAttribute.FLOAT: {'value_float': 1.5},
+            ProductAttribute.BOOLEAN: {'value_boolean': False},
+            ProductAttribute.OPTION: {'value_option': red},
+            ProductAttribute.MULTI_OPTION: {},
+            # Neindeksuojamas tipas
+            ProductAttribute.DATE: {'value_date': timezone.now().date()},
+        }
+        for type_, columns in values.items():
+            attribute = ProductAttribute.objects.create(
+                product_class=self.product_class, name=type_, code=type_, type=type_,
+                option_group=group if type_ in (ProductAttribute.OPTION, ProductAttribute.MULTI_OPTION) else None,
+            )
+            value = ProductAttributeValue.objects.create(product=self.product, attribute=attribute, **columns)
+            if type_ == ProductAttribute.MULTI_OPTION:
+                value.value_multi_option.set([red, white])
+
+        attributes = sorted(ProductDocument().prepare_attributes(self.product), key=lambda entry: entry['code'])
+        attributes[3]['value_keyword'].sort()
+        self.assertEqual(attributes, [
+            {'code': 'boolean', 'type': 'boolean', 'value_keyword': 'false'},
+            {'code': 'float', 'type': 'float', 'value_float': 1.5},
+            {'code': 'integer', 'type': 'integer', 'value_integer': 0},
+            {'code': 'multi_option', 'type': 'multi_option', 'value_keyword': ['balta', 'raudona']},
+            {'code': 'option', 'type': 'option', 'value_keyword': 'raudona'},
+            {'code': 'text', 'type': 'text', 'value_keyword': 'keramika', 'value_text': 'keramika'},
+        ])
+
+
+class ProductIndexingQueryCountTest(TestCase):
+    """ Dokumentų paruošimas indeksavimui: užklausų skaičius partijai nepriklauso nuo produktų skaičiaus. """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.partners, cls.warehouses = [], []
+        for i in range(2):
+            user = CustomUser.objects.create_user(email=f'indeksas{i}@example.com', password='slaptas-123')
+            partner = Partner.objects.create(
+                name=f'Indeksas {i}', user=user, verification_status=Partner.STATUS_VERIFIED
+            )
+            cls.partners.append(partner)
+            cls.warehouses.append(Warehouse.objects.create(
+                partner=partner, name=f'Sandėlis {i}', address_line='Gatvė 1', city='Šiauliai',
+                country='Lietuva', location=Point(23.3 + i / 100, 55.9, srid=4326),
+            ))
+        root = Category.add_root(name='Santechnika')
+        cls.categories = [root, root.add_child(name='Vamzdžiai')]
+        cls.product_class = ProductClass.objects.create(name='Vamzdžiai')
+        group = AttributeOptionGroup.objects.create(name='Medžiagos')
+        cls.options = [AttributeOption.objects.create(group=group, option=option) for option in ('PVC', 'varis')]
+        types = (ProductAttribute.TEXT, ProductAttribute.INTEGER, ProductAttribute.OPTION, ProductAttribute.MULTI_OPTION)
+        cls.attributes = [
+            ProductAttribute.objects.create(
+                product_class=cls.product_class, name=type_, code=type_, type=type_,
+                option_group=group if type_ in (ProductAttribute.OPTION, ProductAttribute.MULTI_OPTION) else None,
+            )
+            for type_ in types
+        ]
+
+    def create_product(self, index):
+        product = Product.objects.create(product_class=self.product_class, title=f'Vamzdis {index}')
+        for offer, (partner, warehouse) in enumerate(zip(self.partners, self.warehouses)):
+            StockRecord.objects.create(
+                product=product, partner=partner, partner_sku=f'vamzdis-{index}', warehouse=warehouse,
+                price=Decimal('4.00') + offer, num_in_stock=offer,
+            )
+        for image in range(2):
+            ProductImage.objects.create(
+                product=product, original=f'images/products/v{index}-{image}.jpg', display_order=image
+            )
+        for category in self.categories:
+            ProductCategory.objects.create(product=product, category=category)
+        text, integer, option, multi_option = self.attributes
+        ProductAttributeValue.objects.create(product=product, attribute=text, value_text='plonas')
+        ProductAttributeValue.objects.create(product=product, attribute=integer, value_integer=index)
+        ProductAttributeValue.objects.create(product=product, attribute=option, value_option=self.options[0])
+        multi_value = ProductAttributeValue.objects.create(product=product, attribute=multi_option)
+        multi_value.value_multi_option.set(self.options)
+        refresh_offer_summaries([product.pk])
+        return product
+
+    def chunk_queries(self, products):
+        stats = IndexingStats()
+        actions = list(iter_index_actions(Product.objects.filter(pk__in=[p.pk for p in products]), stats=stats))
+        self.assertEqual(len(actions), len(products))
+        self.assertEqual(stats.chunks, 1)
+        return stats.chunk_queries[0], actions
+
+    def test_queries_per_chunk_are_constant(self):
+        single, _ = self.chunk_queries([self.create_product(0)])
+        products = [self.create_product(index) for index in range(1, 8)]
+        many, actions = self.chunk_queries(products)
+        self.assertEqual(many, single)
+
+        source = actions[0]['_source']
+        self.assertEqual((len(source['offers']), len(source['attributes'])), (2, 4))
+        self.assertEqual(source['partner_id'], self.partners[1].pk)
@@ -0,0 +1,223 @@
+import fcntl
+import hashlib
+import io
+import logging
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.http import UnreadablePostError
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from apps.catalogue.blobs import acquire, get_blob_for_source, hash_file, release, store_blob
+
+from .models import ImageUpload
+
+logger = logging.getLogger(__name__)
+
+# Request body is copied to disk in pieces of this size, whatever the chunk size
+COPY_BUFFER_SIZE = 64 * 1024
+# Accepted source formats -> stored format and extension
+IMAGE_FORMATS = {
+    'JPEG': ('JPEG', 'jpg'),
+    'PNG': ('PNG', 'png'),
+    'WEBP': ('WEBP', 'webp'),
+}
+ALLOWED_CONTENT_TYPES = ('image/jpeg', 'image/png', 'image/webp')
+
+
+def get_temp_path(upload):
+    return Path(settings.IMAGE_UPLOAD_TEMP_DIR) / f'{upload.pk.hex}.part'
+
+
+def write_chunk(upload, stream, length):
+    """
+    Appends up to `length` bytes of `stream` at upload.offset, copying
+    COPY_BUFFER_SIZE bytes at a time, and returns the number of bytes
+    written. Bytes past the offset left by an interrupted chunk are
+    dropped first; a client disconnect keeps what was received, so the
+    upload resumes from there. The caller saves the new offset (see
+    append_chunk()).
+    """
+    path = get_temp_path(upload)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    written = 0
+    with open(path, 'r+b' if path.exists() else 'wb') as file:
+        file.seek(upload.offset)
+        file.truncate()
+        while written < length and stream is not None:
+            try:
+                data = stream.read(min(COPY_BUFFER_SIZE, length - written))
+            except UnreadablePostError:
+                break
+            if not data:
+                break
+            file.write(data)
+            written += len(data)
+    return written
+
+
+def append_chunk(upload, stream, offset, length):
+    """
+    Writes one chunk at `offset` without holding a database transaction
+    while the body is read: an exclusive non-blocking lock on the temporary
+    file keeps concurrent PATCHes of the same upload apart, and the new
+    offset is committed with a conditional UPDATE (offset still `offset`,
+    still uploading). Returns the refreshed upload, or None if another
+    request got there first (the caller answers 409).
+    """
+    path = get_temp_path(upload)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'ab') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return None
+        try:
+            # The offset may have moved while waiting for the request to reach here
+            current = ImageUpload.objects.filter(pk=upload.pk).values_list('offset', 'status').first()
+            if current != (offset, ImageUpload.STATUS_UPLOADING):
+                return None
+            upload.offset = offset
+            new_offset = offset + write_chunk(upload, stream, length)
+            new_status = ImageUpload.STATUS_UPLOADED if new_offset >= upload.size else ImageUpload.STATUS_UPLOADING
+            updated = ImageUpload.objects.filter(
+                pk=upload.pk, offset=offset, status=ImageUpload.STATUS_UPLOADING
+            ).update(offset=new_offset, status=new_status, date_updated=timezone.now())
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+    if not updated:
+        return None
+    upload.refresh_from_db()
+    return upload
+
+
+def _encode(image, image_format):
+    """Re-encodes a decoded image without EXIF and other metadata (ICC profile is kept for colours)."""
+    options = {'icc_profile': image.info.get('icc_profile')} if image.info.get('icc_profile') else {}
+    if image_format == 'JPEG':
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        options.update(quality=90, optimize=True, progressive=True)
+    elif image_format == 'WEBP':
+        options.update(quality=90)
+    else:
+        options.update(optimize=True)
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format, **options)
+    return buffer.getvalue()
+
+
+def sanitize_image(file):
+    """
+    Decodes and validates an image file (format, pixel limit, verify()),
+    applies the EXIF orientation and re-encodes it without metadata.
+    Returns (content, extension, width, height); files that are not an
+    acceptable image raise OSError, ValueError, SyntaxError or
+    DecompressionBombError.
+    """
+    file.seek(0)
+    with Image.open(file) as image:
+        if image.format not in IMAGE_FORMATS:
+            raise ValueError(f"Unsupported image format: {image.format}")
+        if image.width * image.height > settings.IMAGE_UPLOAD_MAX_PIXELS:
+            raise ValueError(f"Image is too large: {image.width}x{image.height}")
+        image_format, extension = IMAGE_FORMATS[image.format]
+        image.verify()
+    # verify() leaves the image unusable, decode it again
+    file.seek(0)
+    with Image.open(file) as image:
+        image = ImageOps.exif_transpose(image)
+        return _encode(image, image_format), extension, image.width, image.height
+
+
+def store_image(file):
+    """
+    Blob for an uploaded image file, used by both the chunked uploads and
+    multipart ProductImage.original. Only sanitized bytes are stored, keyed
+    by their own digest; the digest of the uploaded bytes lets the same
+    upload reuse its blob without being decoded again.
+    """
+    source_digest = hash_file(file)
+    blob = get_blob_for_source(source_digest)
+    if blob is not None:
+        return blob
+    content, extension, width, height = sanitize_image(file)
+    return store_blob(
+        hashlib.sha256(content).hexdigest(), ContentFile(content), extension, width, height,
+        source_digest=source_digest,
+    )
+
+
+def process_upload(upload):
+    """
+    Stores a complete upload as a sanitized content-addressed blob
+    (store_image()). The upload holds a blob reference until it is attached
+    to a product. Invalid files mark the upload as failed. The temporary
+    file is removed either way.
+    """
+    path = get_temp_path(upload)
+    try:
+        if path.stat().st_size != upload.size:
+            raise ValueError(f"Expected {upload.size} bytes, got {path.stat().st_size}")
+        with open(path, 'rb') as file:
+            blob = store_image(file)
+    except (OSError, ValueError, SyntaxError, Image.DecompressionBombError) as exc:
+        upload.status = ImageUpload.STATUS_FAILED
+        upload.error = str(exc)
+        upload.save(update_fields=['status', 'error', 'date_updated'])
+        logger.info(f"Image upload {upload.pk} rejected: {exc}")
+    else:
+        acquire([blob.file.name])
+        upload.image = blob.file.name
+        upload.width, upload.height = blob.width, blob.height
+        upload.status = ImageUpload.STATUS_READY
+        upload.error = ''
+        upload.save(update_fields=['image', 'width', 'height', 'status', 'error', 'date_updated'])
+    path.unlink(missing_ok=True)
+    return upload
+
+
+def process_pending_uploads(batch_size=20):
+    """Processes one batch of complete uploads. Returns the number processed."""
+    with transaction.atomic():
+        uploads = list(
+            ImageUpload.objects.select_for_update(skip_locked=True)
+            .filter(status=ImageUpload.STATUS_UPLOADED)
+            .order_by('date_updated')[:batch_size]
+        )
+        for upload in uploads:
+            process_upload(upload)
+    return len(uploads)
+
+
+def delete_expired_uploads():
+    """
+    Removes uploads that were abandoned (never completed, failed, or
+    processed but never attached to a product), their temporary files and
+    their blob references. A READY upload's blob is released only if this
+    sweep is the one that moves it out of READY, so an upload attached to a
+    product at the same time is left alone.
+    """
+    cutoff = timezone.now() - timedelta(hours=settings.IMAGE_UPLOAD_EXPIRY_HOURS)
+    expired = ImageUpload.objects.filter(
+        date_updated__lt=cutoff,
+        status__in=[ImageUpload.STATUS_UPLOADING, ImageUpload.STATUS_FAILED, ImageUpload.STATUS_READY],
+    )
+    count = 0
+    for upload in expired.iterator():
+        get_temp_path(upload).unlink(missing_ok=True)
+        with transaction.atomic():
+            if upload.status == ImageUpload.STATUS_READY:
+                expired_ready = ImageUpload.objects.filter(pk=upload.pk, status=ImageUpload.STATUS_READY) \
+                    .update(status=ImageUpload.STATUS_FAILED)
+                if not expired_ready:
+                    continue
+                # The blob file is deleted once no product image uses it either
+                release([upload.image.name])
+            upload.delete()
+        count += 1
+    return count
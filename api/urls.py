@@ -8,6 +8,8 @@ from .views import CustomTokenObtainPairView, PublicProductDocumentViewSet, User
 router = DefaultRouter()
 # Registruojame VendorProductViewSet su 'vendor/products' maršrutu
 router.register(r'partner/products', views.PartnerProductViewSet, basename='partner-product')
+# Dalinis (resumable) paveikslėlių įkėlimas; token'as naudojamas produkto images[].upload_token
+router.register(r'partner/uploads/images', views.ImageUploadViewSet, basename='image-upload')
 
 router.register(
     r'products/search',
@@ -1,7 +1,7 @@
 from django.contrib.gis.db import models as gis_models
 from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework.permissions import AllowAny
-from rest_framework import viewsets, status, serializers, generics # Pridedam status ir serializers
+from rest_framework import viewsets, status, serializers, generics, mixins # Pridedam status ir serializers
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
@@ -13,12 +13,14 @@ from .permissions import IsVerifiedPartnerPermission
 from django.core.exceptions import PermissionDenied
 # Importuojam mūsų serializer'ius
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.parsers import JSONParser
 from rest_framework.decorators import action
 from rest_framework import permissions, filters, viewsets
-from .serializers import ProductWriteSerializer, ProductReadOnlySerializer, CustomTokenObtainPairSerializer, UserRegistrationSerializer, ProductDocumentSerializer # Importuojam abu
+from .serializers import ImageUploadSerializer, ProductWriteSerializer, ProductReadOnlySerializer, CustomTokenObtainPairSerializer, UserRegistrationSerializer, ProductDocumentSerializer, NearbyProductSerializer, ProductHitSerializer, ProductListSerializer # Importuojam abu
         # Importuojam reikalingas GIS funkcijas ir modelius
+from django.conf import settings
 from django.db import models
-from django.db.models import Q, Min
+from django.db.models import Q, Min, Exists, OuterRef, Prefetch
 from django.contrib.gis.db.models.functions import Distance
 from django.contrib.gis.measure import D as GisDistance
 from django.db.models.functions import Coalesce
@@ -38,6 +40,18 @@ from django_elasticsearch_dsl_drf.filter_backends import (
     FacetedSearchFilterBackend,
 )
 from apps.catalogue.documents import ProductDocument  # Add this import
+from .backends import (
+    AttributeFilterBackend, OfferFilterBackend, OptionalFacetedSearchFilterBackend, SourceFilterBackend, get_geo_params,
+    get_source_fields,
+)
+from .pagination import DocumentResultsSetPagination, DocumentCursorPagination, ApproximateCountPagination
+from .cache import SearchCacheMixin, get_search_cache_stats
+from .instrumentation import InstrumentedViewMixin
+from .parsers import JSONLinesParser, CSVParser
+from .bulk_import import ProductImporter
+from .models import ImageUpload
+from .uploads import append_chunk
+from locations.queries import nearby_in_stock_products
 
 # logging
 import logging
@@ -47,8 +61,12 @@ logger = logging.getLogger(__name__)
 Product = get_model('catalogue', 'Product')
 StockRecord = get_model('partner', 'StockRecord')
 Partner = get_model('partner', 'Partner')
+ProductAttributeValue = get_model('catalogue', 'ProductAttributeValue')
+
+# Didžiausias eilučių skaičius vienam masiniam importui (vienas HTTP request'as)
+BULK_IMPORT_MAX_ROWS = 10000
 
-class CustomTokenObtainPairView(TokenObtainPairView):
+class CustomTokenObtainPairView(InstrumentedViewMixin, TokenObtainPairView):
     permission_classes = (AllowAny,)
     serializer_class = CustomTokenObtainPairSerializer
 
@@ -150,7 +168,7 @@ class StandardResultsSetPagination(PageNumberPagination):
 # ... (PartnerProductViewSet ir CustomTokenObtainPairView lieka kaip anksčiau) ...
 
 
-class PartnerProductViewSet(viewsets.ModelViewSet):
+class PartnerProductViewSet(InstrumentedViewMixin, viewsets.ModelViewSet):
     """
     API ViewSet for verified vendors to manage their products.
     Allows listing, creating, retrieving, updating, and deleting products
@@ -161,6 +179,10 @@ class PartnerProductViewSet(viewsets.ModelViewSet):
 
     # Leidimai: tik prisijungęs IR patvirtintas partneris
     permission_classes = [IsAuthenticated, IsVerifiedPartnerPermission]
+    # ?count=approx - greitas (EXPLAIN) count dideliems sąrašams
+    pagination_class = ApproximateCountPagination
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = ProductFilter
 
     def get_serializer_class(self):
         """ Grąžina skaitymo arba rašymo serializerį pagal veiksmą. """
@@ -171,26 +193,36 @@ class PartnerProductViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         """
         Grąžina TIK produktų queryset'ą, susietą su prisijungusiu
-        ir patvirtintu tiekėju per StockRecord.
+        ir patvirtintu tiekėju per StockRecord (EXISTS subquery, viena užklausa).
+        Sąrašui prefetch'inam tik tai, ką rodo ProductListSerializer;
+        gilų atributų medį - tik retrieve/rašymo veiksmams.
         """
         user = self.request.user
         try:
             # Naudojam related_name 'partner_profile'
             partner = user.partner_profile
-            # Randame produktų ID, kurie turi stockrecord su šiuo partneriu
-            product_ids = StockRecord.objects.filter(partner=partner).values_list('product_id', flat=True).distinct()
-            # Grąžiname tuos produktus
-            return Product.objects.filter(id__in=product_ids).prefetch_related(
-                'stockrecords__partner', 'stockrecords__warehouse', # Optimizacija
-                'attribute_values__attribute__option_group__options', # Pilnesni atributai
-                'images', 'categories'
-            )
-        except Partner.DoesNotExist:
+        except (Partner.DoesNotExist, AttributeError):
             # Turėtų neįvykti dėl permission_classes, bet apsidraudžiam
             return Product.objects.none()
-        except AttributeError:
-             # Jei user neturi partner_profile
-             return Product.objects.none()
+
+        queryset = Product.objects.filter(
+            Exists(StockRecord.objects.filter(product=OuterRef('pk'), partner=partner))
+        ).select_related(
+            'product_class', 'offer_summary__cheapest_partner', 'offer_summary__cheapest_warehouse',
+        ).prefetch_related(
+            Prefetch('stockrecords', queryset=StockRecord.objects.select_related('partner', 'warehouse')),
+            'images__renditions', 'categories',
+        ).order_by('-date_created', '-pk')
+        if self.action != 'list':
+            queryset = queryset.prefetch_related(
+                Prefetch(
+                    'attribute_values',
+                    # Atributų aprašai (option grupės) imami iš schemos cache
+                    queryset=ProductAttributeValue.objects.select_related('attribute', 'value_option')
+                    .prefetch_related('value_multi_option'),
+                ),
+            )
+        return queryset
 
 
     def get_serializer_context(self):
@@ -208,7 +240,9 @@ class PartnerProductViewSet(viewsets.ModelViewSet):
         # Naudojam rašymo serializerį create/update veiksmams
         if self.action in ['create', 'update', 'partial_update']:
             return ProductWriteSerializer
-        # Visiems kitiems (list, retrieve) naudojam skaitymo serializerį
+        if self.action == 'list':
+            return ProductListSerializer
+        # Visiems kitiems (retrieve) naudojam pilną skaitymo serializerį
         return ProductReadOnlySerializer
 
     def perform_create(self, serializer):
@@ -252,7 +286,86 @@ class PartnerProductViewSet(viewsets.ModelViewSet):
         except AttributeError:
              raise PermissionDenied("User does not have a partner profile.")
 
-class UserRegistrationView(generics.CreateAPIView):
+    @action(
+        detail=False, methods=['post'], url_path='bulk-import',
+        parser_classes=[JSONLinesParser, CSVParser, JSONParser],
+    )
+    def bulk_import(self, request):
+        """
+        Masinis importas: JSON Lines (application/x-ndjson), CSV (text/csv)
+        arba JSON masyvas. Grąžina kiekvienos eilutės rezultatą
+        (created / updated / linked / failed) su klaidomis.
+        """
+        rows = request.data
+        if not isinstance(rows, list):
+            return Response({'detail': 'Expected a list of rows.'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(rows) > BULK_IMPORT_MAX_ROWS:
+            return Response(
+                {'detail': f'At most {BULK_IMPORT_MAX_ROWS} rows per import.'}, status=status.HTTP_400_BAD_REQUEST
+            )
+        report = ProductImporter(request.user.partner_profile).run(rows)
+        return Response(report, status=status.HTTP_200_OK)
+
+class ImageUploadViewSet(InstrumentedViewMixin, mixins.CreateModelMixin, mixins.RetrieveModelMixin,
+                         viewsets.GenericViewSet):
+    """
+    Dalinis (resumable) produktų paveikslėlių įkėlimas.
+
+    POST {filename, size, content_type} -> token; PATCH <token>/ su
+    'Upload-Offset' antrašte ir žaliais baitais kūne (iki IMAGE_UPLOAD_CHUNK_SIZE)
+    prideda dalį; GET/HEAD <token>/ grąžina gautų baitų skaičių (Upload-Offset),
+    kad nutrūkęs įkėlimas būtų tęsiamas. Kūnas rašomas į diską dalimis,
+    neskaitant jo viso į atmintį. Pilną failą apdoroja `process_image_uploads`,
+    o paruoštas (status=ready) tokenas naudojamas produkto images[].upload_token.
+    """
+    serializer_class = ImageUploadSerializer
+    permission_classes = [IsAuthenticated, IsVerifiedPartnerPermission]
+
+    def get_queryset(self):
+        return ImageUpload.objects.filter(partner=self.request.user.partner_profile)
+
+    def perform_create(self, serializer):
+        serializer.save(partner=self.request.user.partner_profile)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if isinstance(response.data, dict) and 'offset' in response.data:
+            response['Upload-Offset'] = str(response.data['offset'])
+        return response
+
+    def partial_update(self, request, pk=None):
+        try:
+            offset = int(request.headers['Upload-Offset'])
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except (KeyError, ValueError):
+            return Response(
+                {'detail': "'Upload-Offset' and 'Content-Length' headers are required."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if length > settings.IMAGE_UPLOAD_CHUNK_SIZE:
+            return Response(
+                {'detail': f'Chunks are limited to {settings.IMAGE_UPLOAD_CHUNK_SIZE} bytes.'},
+                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+            )
+
+        upload = get_object_or_404(self.get_queryset(), pk=pk)
+        if upload.status != ImageUpload.STATUS_UPLOADING or offset != upload.offset:
+            # Klientas tęsia nuo serverio offset'o (jis grąžinamas Upload-Offset antraštėje)
+            return Response(self.get_serializer(upload).data, status=status.HTTP_409_CONFLICT)
+        if offset + length > upload.size:
+            return Response(
+                {'detail': 'Chunk exceeds the declared upload size.'}, status=status.HTTP_400_BAD_REQUEST
+            )
+        # Be DB transakcijos, kol skaitomas kūnas: failo užraktas + sąlyginis UPDATE (uploads.append_chunk).
+        # request.stream - Django request'as be DRF parserių: skaitoma tik tiek, kiek rašoma
+        updated = append_chunk(upload, request.stream, offset, length)
+        if updated is None:
+            # Lygiagretus PATCH jau rašo ar pakeitė offset'ą
+            upload.refresh_from_db()
+            return Response(self.get_serializer(upload).data, status=status.HTTP_409_CONFLICT)
+        return Response(self.get_serializer(updated).data)
+
+class UserRegistrationView(InstrumentedViewMixin, generics.CreateAPIView):
     """
     API endpoint for user registration.
     """
@@ -304,29 +417,47 @@ class UserRegistrationView(generics.CreateAPIView):
 
 
 
-class PublicProductDocumentViewSet(DocumentViewSet):
+class PublicProductDocumentViewSet(InstrumentedViewMixin, SearchCacheMixin, DocumentViewSet):
     """
     Public API endpoint that allows products to be viewed, using Elasticsearch.
+    Anonymous list/suggest responses are cached until the index changes (SearchCacheMixin).
     """
     document = ProductDocument 
     serializer_class = ProductDocumentSerializer
-    pagination_class = StandardResultsSetPagination
+    pagination_class = DocumentResultsSetPagination # Grąžina ir facets (agregacijas)
     permission_classes = [permissions.AllowAny]
 
     filter_backends = [
         FilteringFilterBackend,
         CompoundSearchFilterBackend,  # Updated from SearchFilterBackend
         OrderingFilterBackend,
-        FacetedSearchFilterBackend,
+        # Nested offers filtrai (kaina, tiekėjas, miestas, lat/lon/radius) su inner_hits;
+        # po OrderingFilterBackend, nes ordering=distance pakeičia rikiavimą
+        OfferFilterBackend,
+        # ?product_class=slug: attr_<kodas> filtrai ir facetai pagal ProductAttribute apibrėžimus
+        AttributeFilterBackend,
+        OptionalFacetedSearchFilterBackend,  # ?facets=false - be agregacijų (puslapiams 2..N)
+        SourceFilterBackend,  # ?view=compact / ?fields=id,title - tik nurodyti _source laukai
     ]
 
+    # Laukai, kuriuos galima prašyti per ?fields=
+    source_fields = (
+        'id', 'title', 'description', 'upc', 'condition', 'is_public', 'date_created',
+        'price', 'price_currency', 'num_in_stock', 'partner_name', 'partner_id',
+        'location_city', 'location_point', 'thumbnail', 'offers', 'attributes',
+        'categories', 'category_paths', 'product_class',
+    )
+    # Sąrašo puslapiui užtenka šių (?view=compact)
+    compact_source_fields = ('id', 'title', 'price', 'price_currency', 'thumbnail', 'location_city')
+
     # Updated faceted search fields configuration
     faceted_search_fields = {
+        # Kategorijų medis: kiekvienas produktas skaičiuojamas visose protėvių kategorijose
         'categories': {
-            'field': 'categories.slug.raw',
+            'field': 'category_paths',
             'enabled': True,
             'options': {
-                'size': 20,
+                'size': 200,
                 'min_doc_count': 1
             }
         },
@@ -381,8 +512,9 @@ class PublicProductDocumentViewSet(DocumentViewSet):
             'field': 'price',
             'lookups': ['exact', 'gte', 'lte', 'gt', 'lt', 'range'],
         },
+        # ?categories=statybines-medziagos apima ir visas subkategorijas (pilnas slug kelias)
         'categories': {
-            'field': 'categories.slug.raw',
+            'field': 'category_paths',
             'lookups': ['exact', 'in'],
         },
         'condition': {
@@ -412,4 +544,103 @@ class PublicProductDocumentViewSet(DocumentViewSet):
         'price': 'price',
         'date_created': 'date_created',
     }
-    ordering = ('-date_created',)
\ No newline at end of file
+    ordering = ('-date_created',)
+    cached_actions = ('list', 'suggest', 'facets')
+
+    def get_serializer_class(self):
+        if self.action == 'list' and get_source_fields(self.request, self) is not None:
+            return ProductHitSerializer
+        return super().get_serializer_class()
+
+    @property
+    def paginator(self):
+        """
+        ?cursor= (tuščias pirmam puslapiui) įjungia search_after puslapiavimą
+        gilioms užklausoms ir begaliniam slinkimui, kitaip - puslapiai pagal numerį.
+        """
+        if not hasattr(self, '_paginator'):
+            if DocumentCursorPagination.cursor_query_param in self.request.query_params:
+                self._paginator = DocumentCursorPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+
+    @action(detail=False, methods=['get'])
+    def nearby(self, request):
+        """
+        DB (PostGIS) fallback, kai Elasticsearch nepasiekiamas ar atsilieka:
+        artimiausi N produktų, turimų sandėlyje spindulyje (?lat=&lon=&radius=km&limit=).
+        """
+        # Tos pačios ribos kaip ES paieškoje (400, jei lat/lon/radius netinkami)
+        point, radius = get_geo_params(request)
+        if point is None:
+            return Response({"error": "Parameters 'lat' and 'lon' are required."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = min(int(request.query_params.get('limit', 24)), 100)
+        except (TypeError, ValueError):
+            return Response({"error": "Invalid parameters."}, status=status.HTTP_400_BAD_REQUEST)
+        if limit <= 0:
+            return Response({"error": "Invalid parameters."}, status=status.HTTP_400_BAD_REQUEST)
+
+        products = nearby_in_stock_products(point['lon'], point['lat'], radius or 20, limit=limit).prefetch_related(
+            'product_class', 'offer_summary__cheapest_partner', 'offer_summary__cheapest_warehouse',
+            'stockrecords__partner', 'stockrecords__warehouse',
+            'attribute_values__attribute', 'attribute_values__value_option', 'attribute_values__value_multi_option',
+            'images__renditions', 'categories',
+        )
+        serializer = self.instrument_serializer(
+            NearbyProductSerializer(products, many=True, context=self.get_serializer_context())
+        )
+        return Response(serializer.data)
+
+    @action(detail=False, methods=['get'])
+    def suggest(self, request):
+        """
+        Paieškos laukelio pasiūlymai kiekvienam klavišo paspaudimui (?q=&size=).
+        Tik completion suggester: be filtrų, facetų ir _source, kad atsakymas būtų pigus.
+        """
+        return self.handle_cached(request, self._suggest)
+
+    def _suggest(self, request):
+        prefix = request.query_params.get('q', '').strip()
+        if not prefix:
+            return Response([])
+        try:
+            size = min(max(int(request.query_params.get('size', 8)), 1), 20)
+        except ValueError:
+            return Response({"error": "Invalid 'size' parameter."}, status=status.HTTP_400_BAD_REQUEST)
+
+        completion = {'field': 'title_suggest', 'size': size, 'skip_duplicates': True}
+        if len(prefix) > 3:
+            # Trumpam prefiksui fuzzy tik triukšmauja ir lėtina
+            completion['fuzzy'] = {'fuzziness': 'AUTO', 'prefix_length': 1}
+        search = self.document.search().extra(size=0, _source=False).suggest(
+            'title_suggest', prefix[:100], completion=completion
+        )
+        response = search.execute()
+        suggestions = [
+            {'text': option.text, 'id': int(option._id)}
+            for option in response.suggest.title_suggest[0].options
+        ]
+        return Response(suggestions)
+
+    @action(detail=False, methods=['get'], url_path='cache-stats', permission_classes=[permissions.IsAdminUser])
+    def cache_stats(self, request):
+        """ Paieškos atsakymų cache hit/miss statistika ir dabartinė indekso karta. """
+        return Response(get_search_cache_stats())
+
+    @action(detail=False, methods=['get'])
+    def facets(self, request):
+        """
+        Tik agregacijos (size=0) tiems patiems filtrams kaip sąraše, be rezultatų.
+        Frontend'as gali jas cache'inti pagal filtrų rinkinį, o sąrašą kviesti su ?facets=false.
+        """
+        return self.handle_cached(request, self._facets)
+
+    def _facets(self, request):
+        queryset = self.filter_queryset(self.get_queryset()).extra(size=0, track_total_hits=True)
+        response = queryset.execute()
+        return Response({
+            'count': response.hits.total.value,
+            'facets': response.aggregations.to_dict(),
+        })
@@ -5,4 +5,5 @@ class CatalogueConfig(BaseCatalogueConfig):
 
     def ready(self):
         from . import models
+        from . import receivers  # noqa
         super().ready()
\ No newline at end of file
@@ -0,0 +1,181 @@
+import time
+
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Prefetch
+from oscar.core.loading import get_model
+
+ProductClass = get_model('catalogue', 'ProductClass')
+ProductAttribute = get_model('catalogue', 'ProductAttribute')
+AttributeOption = get_model('catalogue', 'AttributeOption')
+
+SCHEMA_VERSION_KEY = 'catalogue:attribute-schema-version'
+# Shared by web processes and workers, like the search index generation
+CACHE_ALIAS = 'search'
+
+# The shared version is re-read at most this often (seconds) per process: every attribute
+# value serialized asks for its schema, and each read is a file access on FileBasedCache.
+# Other processes therefore see a change up to this late; the changing process at once.
+VERSION_TTL = 1.0
+
+# Process-local layer: {cache key: schema}, dropped whenever the shared version changes
+_local = {}
+_local_version = None
+_version = None
+_version_read_at = 0.0
+
+
+class AttributeSpec:
+    """Cached definition of one ProductAttribute with its allowed options."""
+
+    def __init__(self, pk, code, name, type, required, option_group=None):
+        self.pk = pk
+        self.code = code
+        self.name = name
+        self.type = type
+        self.required = required
+        # {'id', 'name', 'options': [{'id', 'option'}]} or None
+        self.option_group = option_group
+        self.options = {option['option']: option['id'] for option in (option_group or {}).get('options', [])}
+
+    @classmethod
+    def from_attribute(cls, attribute):
+        group = attribute.option_group
+        option_group = {
+            'id': group.pk,
+            'name': group.name,
+            'options': [{'id': option.pk, 'option': option.option} for option in group.options.all()],
+        } if group else None
+        return cls(attribute.pk, attribute.code, attribute.name, attribute.type, attribute.required, option_group)
+
+    def get_option(self, text):
+        """Unsaved-but-keyed AttributeOption for `text`, usable as an FK value; None if not allowed."""
+        pk = self.options.get(text)
+        if pk is None:
+            return None
+        return AttributeOption(pk=pk, group_id=self.option_group['id'], option=text)
+
+    def as_dict(self):
+        """Same shape as api.serializers.ProductAttributeSerializer output."""
+        option_group = {
+            'id': self.option_group['id'],
+            'name': self.option_group['name'],
+            'options': [{'option': option['option']} for option in self.option_group['options']],
+        } if self.option_group else None
+        return {'id': self.pk, 'name': self.name, 'code': self.code, 'type': self.type, 'option_group': option_group}
+
+
+class ProductClassSchema:
+    """Attribute definitions of one ProductClass, by code and by id."""
+
+    def __init__(self, pk, slug, attributes):
+        self.pk = pk
+        self.slug = slug
+        self.attributes = {spec.code: spec for spec in attributes}
+        self.by_id = {spec.pk: spec for spec in attributes}
+
+    def get(self, code):
+        return self.attributes.get(code)
+
+    def __iter__(self):
+        return iter(self.attributes.values())
+
+
+def _remember_version(version):
+    global _version, _version_read_at
+    _version, _version_read_at = version, time.monotonic()
+    return version
+
+
+def get_schema_version():
+    if _version is not None and time.monotonic() - _version_read_at < VERSION_TTL:
+        return _version
+    cache = caches[CACHE_ALIAS]
+    # Time based start value: schemas cached under an evicted counter are never reused
+    return _remember_version(cache.get_or_set(SCHEMA_VERSION_KEY, time.time_ns, timeout=None))
+
+
+def bump_schema_version():
+    cache = caches[CACHE_ALIAS]
+    try:
+        version = cache.incr(SCHEMA_VERSION_KEY)
+    except ValueError:
+        version = time.time_ns()
+        cache.set(SCHEMA_VERSION_KEY, version, timeout=None)
+    return _remember_version(version)
+
+
+def invalidate_schemas():
+    """
+    Bumps the version now and again after commit: a process rebuilding a
+    schema before the change is committed would cache the old definitions
+    under the new version.
+    """
+    bump_schema_version()
+    transaction.on_commit(bump_schema_version)
+
+
+def build_schemas(product_class_ids):
+    """{product_class_id: ProductClassSchema} from the database (three queries)."""
+    attributes = ProductAttribute.objects.select_related('option_group').prefetch_related(
+        Prefetch('option_group__options', queryset=AttributeOption.objects.order_by('pk'))
+    )
+    classes = ProductClass.objects.filter(pk__in=set(product_class_ids)) \
+        .prefetch_related(Prefetch('attributes', queryset=attributes))
+    return {
+        product_class.pk: ProductClassSchema(
+            product_class.pk, product_class.slug,
+            [AttributeSpec.from_attribute(attribute) for attribute in product_class.attributes.all()],
+        )
+        for product_class in classes
+    }
+
+
+def _get_local(version):
+    global _local, _local_version
+    if version != _local_version:
+        _local, _local_version = {}, version
+    return _local
+
+
+def get_schemas(product_class_ids):
+    """
+    {product_class_id: ProductClassSchema}, from the process-local cache,
+    then the shared cache, then the database. Missing classes are left out.
+    """
+    version = get_schema_version()
+    local = _get_local(version)
+    keys = {f'catalogue:attribute-schema:{version}:{pk}': pk for pk in set(product_class_ids) if pk is not None}
+
+    missing = [key for key in keys if key not in local]
+    if missing:
+        cache = caches[CACHE_ALIAS]
+        local.update(cache.get_many(missing))
+        unknown = {keys[key] for key in missing if key not in local}
+        if unknown:
+            schemas = build_schemas(unknown)
+            built = {key: schemas[pk] for key, pk in keys.items() if pk in unknown and pk in schemas}
+            cache.set_many(built, timeout=None)
+            local.update(built)
+    return {pk: local[key] for key, pk in keys.items() if key in local}
+
+
+def get_schema(product_class_id):
+    """ProductClassSchema of one class, or None if it does not exist."""
+    return get_schemas([product_class_id]).get(product_class_id)
+
+
+def get_schema_for_slug(slug):
+    """ProductClassSchema of the class with `slug`, or None."""
+    version = get_schema_version()
+    local = _get_local(version)
+    key = f'catalogue:product-class-ids:{version}'
+    if key not in local:
+        cache = caches[CACHE_ALIAS]
+        class_ids = cache.get(key)
+        if class_ids is None:
+            class_ids = dict(ProductClass.objects.values_list('slug', 'pk'))
+            cache.set(key, class_ids, timeout=None)
+        local[key] = class_ids
+    pk = local[key].get(slug)
+    return get_schema(pk) if pk is not None else None
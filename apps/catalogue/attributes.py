@@ -0,0 +1,175 @@
+from datetime import date, datetime
+
+from django.core.exceptions import ValidationError
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.translation import gettext_lazy as _
+from oscar.core.loading import get_model
+
+from .attribute_schema import get_schemas
+
+ProductAttribute = get_model('catalogue', 'ProductAttribute')
+ProductAttributeValue = get_model('catalogue', 'ProductAttributeValue')
+
+# ProductAttributeValue columns holding a single value, cleared/set together on write
+VALUE_COLUMNS = (
+    'value_text', 'value_integer', 'value_boolean', 'value_float', 'value_richtext',
+    'value_date', 'value_datetime', 'value_option',
+)
+# Same columns by attname, to compare values without loading the option FK
+SNAPSHOT_ATTRS = tuple('value_option_id' if column == 'value_option' else column for column in VALUE_COLUMNS)
+TRUE_VALUES = ('true', '1', 'yes', 'taip')
+FALSE_VALUES = ('false', '0', 'no', 'ne')
+
+
+def _get_option(attribute, value):
+    option = attribute.get_option(str(value).strip())
+    if option is None:
+        raise ValidationError(
+            _("'%(value)s' is not a valid choice for %(attribute)s"),
+            params={'value': value, 'attribute': attribute.code},
+        )
+    return option
+
+
+def coerce_attribute_value(attribute, value):
+    """
+    Converts a raw JSON/CSV value to what the value column of `attribute`
+    (an AttributeSpec) stores: numbers and booleans may come as strings,
+    dates as ISO strings, options as their text and multi-options as a list
+    or comma separated string. Raises ValidationError for values of the
+    wrong type.
+    """
+    type_ = attribute.type
+    try:
+        if type_ in (ProductAttribute.TEXT, ProductAttribute.RICHTEXT):
+            if isinstance(value, (dict, list, bool)):
+                raise ValueError
+            return str(value)
+        if type_ == ProductAttribute.INTEGER:
+            if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+                raise ValueError
+            return int(value)
+        if type_ == ProductAttribute.FLOAT:
+            if isinstance(value, bool):
+                raise ValueError
+            return float(value)
+        if type_ == ProductAttribute.BOOLEAN:
+            if isinstance(value, bool):
+                return value
+            if str(value).strip().lower() in TRUE_VALUES:
+                return True
+            if str(value).strip().lower() in FALSE_VALUES:
+                return False
+            raise ValueError
+        if type_ == ProductAttribute.DATE:
+            parsed = value if isinstance(value, date) else parse_date(str(value))
+            if parsed is None:
+                raise ValueError
+            return parsed
+        if type_ == ProductAttribute.DATETIME:
+            parsed = value if isinstance(value, datetime) else parse_datetime(str(value))
+            if parsed is None:
+                raise ValueError
+            return parsed
+    except (TypeError, ValueError):
+        raise ValidationError(
+            _("Invalid %(type)s value for %(attribute)s"), params={'type': type_, 'attribute': attribute.code}
+        )
+    if type_ == ProductAttribute.OPTION:
+        return _get_option(attribute, value)
+    if type_ == ProductAttribute.MULTI_OPTION:
+        values = value.split(',') if isinstance(value, str) else value
+        if not isinstance(values, (list, tuple)):
+            raise ValidationError(_("%(attribute)s expects a list of options"), params={'attribute': attribute.code})
+        return [_get_option(attribute, item) for item in values if str(item).strip()]
+    raise ValidationError(
+        _("%(type)s attributes can't be set through the API"), params={'type': type_}
+    )
+
+
+def _value_column(attribute):
+    return 'value_option' if attribute.type == ProductAttribute.OPTION else f'value_{attribute.type}'
+
+
+def write_attribute_values(products_values, replace=True):
+    """
+    Saves attribute values of many products with set-based queries.
+
+    products_values: iterable of (product, {code: raw value}). Values are
+    coerced with coerce_attribute_value() and diffed in memory against the
+    stored ones, then applied with one bulk_create, one bulk_update and one
+    delete (plus a delete/bulk_create of multi-option links), whatever the
+    number of products or attributes. Empty values delete the stored one;
+    with `replace`, so do codes missing from a product's dict. Invalid
+    values keep the stored one. Definitions come from the attribute schema
+    cache, so only the stored values are queried.
+
+    Returns {product_pk: {code: [messages]}} for unknown codes and invalid
+    values. Bulk writes send no model signals: callers queue the products
+    for search indexing themselves.
+    """
+    products_values = [(product, values or {}) for product, values in products_values]
+    if not products_values:
+        return {}
+    schemas = get_schemas({product.product_class_id for product, _ in products_values})
+
+    stored = {
+        (value.product_id, value.attribute_id): value
+        for value in ProductAttributeValue.objects.filter(
+            product_id__in=[product.pk for product, _ in products_values]
+        )
+    }
+    errors = {}
+    keep, cleared, to_create, to_update, multi_options = set(), set(), [], [], []
+
+    for product, values in products_values:
+        schema = schemas.get(product.product_class_id)
+        for code, raw in values.items():
+            attribute = schema.get(code) if schema else None
+            if attribute is None:
+                errors.setdefault(product.pk, {})[code] = [str(_("Unknown attribute for this product class"))]
+                continue
+            value_obj = stored.get((product.pk, attribute.pk))
+            if raw is None or raw == '':
+                # An explicitly empty value removes the stored one
+                if value_obj is not None:
+                    cleared.add(value_obj.pk)
+                continue
+            if value_obj is not None:
+                keep.add(value_obj.pk)
+            try:
+                value = coerce_attribute_value(attribute, raw)
+            except ValidationError as error:
+                errors.setdefault(product.pk, {})[code] = error.messages
+                continue
+
+            created = value_obj is None
+            if created:
+                value_obj = ProductAttributeValue(product=product, attribute_id=attribute.pk)
+                to_create.append(value_obj)
+            if attribute.type == ProductAttribute.MULTI_OPTION:
+                multi_options.append((value_obj, value))
+                continue
+            before = tuple(getattr(value_obj, attr) for attr in SNAPSHOT_ATTRS)
+            for column in VALUE_COLUMNS:
+                setattr(value_obj, column, None)
+            setattr(value_obj, _value_column(attribute), value)
+            if not created and before != tuple(getattr(value_obj, attr) for attr in SNAPSHOT_ATTRS):
+                to_update.append(value_obj)
+
+    to_delete = cleared | ({value.pk for value in stored.values()} - keep if replace else set())
+    if to_delete:
+        ProductAttributeValue.objects.filter(pk__in=to_delete).delete()
+    if to_create:
+        ProductAttributeValue.objects.bulk_create(to_create)
+    if to_update:
+        ProductAttributeValue.objects.bulk_update(to_update, VALUE_COLUMNS)
+    if multi_options:
+        Through = ProductAttributeValue.value_multi_option.through
+        Through.objects.filter(productattributevalue_id__in=[obj.pk for obj, _ in multi_options]).delete()
+        Through.objects.bulk_create([
+            Through(productattributevalue_id=obj.pk, attributeoption_id=option.pk)
+            for obj, options in multi_options
+            for option in {option.pk: option for option in options}.values()
+        ])
+    return errors
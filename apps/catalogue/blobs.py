@@ -0,0 +1,150 @@
+import hashlib
+import os
+from collections import Counter
+from datetime import timedelta
+from functools import partial
+
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from oscar.core.loading import get_model
+
+ImageBlob = get_model('catalogue', 'ImageBlob')
+
+BLOB_PREFIX = 'images/blobs/'
+RENDITION_PREFIX = 'images/renditions/blobs/'
+HASH_CHUNK_SIZE = 64 * 1024
+
+
+def hash_file(file):
+    """SHA-256 hex digest of a file object, read in chunks."""
+    digest = hashlib.sha256()
+    file.seek(0)
+    for chunk in iter(partial(file.read, HASH_CHUNK_SIZE), b''):
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def blob_name(digest, extension):
+    return f'{BLOB_PREFIX}{digest[:2]}/{digest[2:4]}/{digest}.{extension}'
+
+
+def blob_digest(name):
+    """Digest of a blob file name, None for files outside blob storage."""
+    if not name or not name.startswith(BLOB_PREFIX):
+        return None
+    return os.path.splitext(os.path.basename(name))[0]
+
+
+def rendition_dir(digest):
+    """Directory holding the renditions shared by every image of a blob."""
+    return f'{RENDITION_PREFIX}{digest[:2]}/{digest}'
+
+
+def _reuse(queryset):
+    """
+    First blob of `queryset`, locked and touched: collect_unreferenced_blobs()
+    re-checks date_updated under the same lock, so the caller has the whole
+    grace period to commit its reference.
+    """
+    with transaction.atomic():
+        blob = queryset.select_for_update().first()
+        if blob is not None:
+            blob.save(update_fields=['date_updated'])
+    return blob
+
+
+def get_blob(digest):
+    """Blob whose stored bytes have `digest`, or None."""
+    return _reuse(ImageBlob.objects.filter(pk=digest))
+
+
+def get_blob_for_source(source_digest):
+    """Blob stored from an upload whose original bytes had `source_digest`, or None."""
+    return _reuse(ImageBlob.objects.filter(source_sha256=source_digest))
+
+
+def store_blob(digest, content, extension, width, height, source_digest=''):
+    """
+    Blob for `digest` (the SHA-256 of `content`, a File), writing `content`
+    only if no blob has these bytes yet. The returned blob is not
+    referenced: callers acquire() it in the transaction that saves the
+    referencing row.
+    """
+    blob = get_blob(digest)
+    if blob is not None:
+        return blob
+    name = blob_name(digest, extension)
+    # A collected blob's file may still be on its way out: write our own copy (same bytes)
+    default_storage.delete(name)
+    saved = default_storage.save(name, content)
+    if saved != name:
+        # Another process wrote the same bytes meanwhile
+        default_storage.delete(saved)
+    try:
+        with transaction.atomic():
+            return ImageBlob.objects.create(
+                sha256=digest, source_sha256=source_digest, file=name, size=default_storage.size(name),
+                width=width, height=height,
+            )
+    except IntegrityError:
+        return get_blob(digest)
+
+
+def _change_references(names, delta):
+    counts = Counter(digest for digest in map(blob_digest, names) if digest)
+    by_count = {}
+    for digest, count in counts.items():
+        by_count.setdefault(count, []).append(digest)
+    for count, digests in by_count.items():
+        ImageBlob.objects.filter(pk__in=digests).update(
+            ref_count=Greatest(F('ref_count') + delta * count, Value(0)),
+            date_updated=timezone.now(),
+        )
+
+
+def acquire(names):
+    """Adds one reference per file name; names outside blob storage are ignored."""
+    _change_references(names, 1)
+
+
+def release(names):
+    """Drops one reference per file name; unreferenced blobs are collected later."""
+    _change_references(names, -1)
+
+
+def _delete_blob_files(name, digest):
+    default_storage.delete(name)
+    directory = rendition_dir(digest)
+    try:
+        _, files = default_storage.listdir(directory)
+    except FileNotFoundError:
+        return
+    for file_name in files:
+        default_storage.delete(f'{directory}/{file_name}')
+
+
+def collect_unreferenced_blobs(grace_hours=24):
+    """
+    Deletes blobs unreferenced for `grace_hours` together with their files
+    and renditions. The grace period covers blobs stored by a request that
+    has not committed its reference yet. Returns the number deleted.
+    """
+    cutoff = timezone.now() - timedelta(hours=grace_hours)
+    deleted = 0
+    digests = list(ImageBlob.objects.filter(ref_count=0, date_updated__lt=cutoff).values_list('pk', flat=True))
+    for digest in digests:
+        with transaction.atomic():
+            # Re-checked under the lock: a blob reused meanwhile was touched by get_blob()
+            blob = ImageBlob.objects.select_for_update().filter(
+                pk=digest, ref_count=0, date_updated__lt=cutoff
+            ).first()
+            if blob is None:
+                continue
+            blob.delete()
+            transaction.on_commit(partial(_delete_blob_files, blob.file.name, digest))
+        deleted += 1
+    return deleted
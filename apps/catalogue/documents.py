@@ -1,16 +1,48 @@
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
 from django_elasticsearch_dsl import Document, fields
 from django_elasticsearch_dsl.registries import registry
 from oscar.core.loading import get_model
 from elasticsearch_dsl import analyzer
 
+from .indexing import prefetch_for_indexing
+from .renditions import get_thumbnail
+
 # Get the models
 Product = get_model('catalogue', 'Product')
 StockRecord = get_model('partner', 'StockRecord')
+Partner = get_model('partner', 'Partner')
+Warehouse = get_model('locations', 'Warehouse')
+ProductImage = get_model('catalogue', 'ProductImage')
+ProductAttribute = get_model('catalogue', 'ProductAttribute')
+ProductAttributeValue = get_model('catalogue', 'ProductAttributeValue')
+Category = get_model('catalogue', 'Category')
+ProductCategory = get_model('catalogue', 'ProductCategory')
+
+# Attribute types that are indexed, and the nested `attributes` field holding their value
+ATTRIBUTE_VALUE_FIELDS = {
+    ProductAttribute.TEXT: 'value_keyword',
+    ProductAttribute.OPTION: 'value_keyword',
+    ProductAttribute.MULTI_OPTION: 'value_keyword',
+    ProductAttribute.BOOLEAN: 'value_keyword',
+    ProductAttribute.INTEGER: 'value_integer',
+    ProductAttribute.FLOAT: 'value_float',
+}
+
+# Completion inputs are matched case- and accent-insensitively ("sviest" -> "Sviestas", "Šviestas")
+suggest_analyzer = analyzer(
+    'suggest_analyzer',
+    tokenizer='standard',
+    filter=['lowercase', 'asciifolding'],
+)
 
 @registry.register_document
 class ProductDocument(Document):
     """Product Elasticsearch document."""
 
+    # Product pk; also the search_after tie-breaker of cursor pagination
+    id = fields.IntegerField(attr='id')
+
     # Existing fields
     title = fields.TextField(
         fields={'raw': fields.KeywordField()}
@@ -21,6 +53,9 @@ class ProductDocument(Document):
     is_public = fields.BooleanField()
     date_created = fields.DateField()
 
+    # Search-as-you-type inputs: title, category names and partner names
+    title_suggest = fields.CompletionField(analyzer=suggest_analyzer)
+
     # Price fields from StockRecord
     price = fields.FloatField()
     price_currency = fields.KeywordField()
@@ -30,10 +65,42 @@ class ProductDocument(Document):
     partner_name = fields.KeywordField()
     partner_id = fields.IntegerField()
 
+    # Primary image URL, for listing pages
+    thumbnail = fields.KeywordField(index=False)
+
     # Location information
     location_city = fields.KeywordField()
     location_point = fields.GeoPointField()
 
+    # Every vendor's offer, for nested price/stock/distance filtering
+    offers = fields.NestedField(
+        properties={
+            'id': fields.IntegerField(),
+            'partner_id': fields.IntegerField(),
+            'partner_name': fields.KeywordField(),
+            'price': fields.FloatField(),
+            'price_currency': fields.KeywordField(),
+            'num_in_stock': fields.IntegerField(),
+            'warehouse_id': fields.IntegerField(),
+            'city': fields.KeywordField(),
+            'location': fields.GeoPointField(),
+        }
+    )
+
+    # Typed attribute values (one entry per attribute), for dynamic attribute filters/facets
+    attributes = fields.NestedField(
+        properties={
+            'code': fields.KeywordField(),
+            'type': fields.KeywordField(),
+            # Long TEXT values stay full-text searchable (value_text) but are not filter/facet terms;
+            # unbounded keywords over Lucene's 32766-byte term limit fail the whole document
+            'value_keyword': fields.KeywordField(ignore_above=256),
+            'value_integer': fields.LongField(),
+            'value_float': fields.DoubleField(),
+            'value_text': fields.TextField(),
+        }
+    )
+
     # Categories and product class
     categories = fields.NestedField(
         properties={
@@ -42,6 +109,9 @@ class ProductDocument(Document):
             'slug': fields.KeywordField(),
         }
     )
+    # Full slug path of every category and its ancestors ("statybines-medziagos",
+    # "statybines-medziagos/gipso-plokstes"): rolled-up facet counts, parent filters
+    category_paths = fields.KeywordField()
     product_class = fields.ObjectField(
         properties={
             'name': fields.TextField(),
@@ -50,7 +120,8 @@ class ProductDocument(Document):
     )
 
     class Index:
-        name = 'marketplace_products'
+        # An alias pointing at a versioned index, see `manage.py rebuild_product_index`
+        name = settings.ELASTICSEARCH_INDEX_NAMES[f'{__name__}.ProductDocument']
         settings = {
             'number_of_shards': 1,
             'number_of_replicas': 0,
@@ -59,51 +130,202 @@ class ProductDocument(Document):
     class Django:
         model = Product
 
-        # Define related fields to fetch
-        related_models = [StockRecord]
+        # Related models whose changes re-index the affected products
+        related_models = [
+            StockRecord, Warehouse, Partner, ProductImage, ProductAttributeValue, Category, ProductCategory,
+        ]
+        # Chunk size used by `search_index --rebuild`; prefetches are done per chunk
+        queryset_pagination = 500
+
+    def get_queryset(self):
+        """Product queryset with stock records, partners, warehouses and categories prefetched."""
+        return prefetch_for_indexing(super().get_queryset())
+
+    def _get_summary(self, instance):
+        """The product's ProductOfferSummary, or None if it has not been built yet."""
+        try:
+            return instance.offer_summary
+        except ObjectDoesNotExist:
+            return None
+
+    def _get_stockrecords(self, instance):
+        """
+        Stock records of the product, ordered by pk. Served from the prefetch
+        cache during bulk indexing; otherwise loaded once per instance.
+        """
+        prefetched = getattr(instance, '_prefetched_objects_cache', {})
+        if 'stockrecords' in prefetched:
+            stockrecords = list(prefetched['stockrecords'])
+        else:
+            if not hasattr(instance, '_index_stockrecords'):
+                instance._index_stockrecords = list(
+                    instance.stockrecords.select_related('partner', 'warehouse').order_by('pk')
+                )
+            stockrecords = instance._index_stockrecords
+        # A stock record being deleted is still in the DB during pre_delete
+        ignored = getattr(self, '_related_instance_to_ignore', None)
+        if isinstance(ignored, StockRecord):
+            stockrecords = [sr for sr in stockrecords if sr.pk != ignored.pk]
+        return stockrecords
+
+    def prepare_offers(self, instance):
+        """One nested entry per stock record."""
+        offers = []
+        for stockrecord in self._get_stockrecords(instance):
+            warehouse = stockrecord.warehouse
+            offers.append({
+                'id': stockrecord.pk,
+                'partner_id': stockrecord.partner_id,
+                'partner_name': stockrecord.partner.name,
+                'price': float(stockrecord.price) if stockrecord.price is not None else None,
+                'price_currency': stockrecord.price_currency,
+                'num_in_stock': stockrecord.num_in_stock or 0,
+                'warehouse_id': stockrecord.warehouse_id,
+                'city': warehouse.city if warehouse else None,
+                'location': (
+                    {'lat': warehouse.location.y, 'lon': warehouse.location.x}
+                    if warehouse and warehouse.location else None
+                ),
+            })
+        return offers
+
+    def prepare_title_suggest(self, instance):
+        """
+        Completion inputs, weighted by the number of offers. Hidden products
+        get no inputs so they never show up as suggestions.
+        """
+        if not instance.is_public:
+            return None
+        inputs = [instance.title] if instance.title else []
+        inputs += [category.name for category in instance.categories.all()]
+        inputs += [stockrecord.partner.name for stockrecord in self._get_stockrecords(instance)]
+        inputs = list(dict.fromkeys(value for value in inputs if value))
+        if not inputs:
+            return None
+        summary = self._get_summary(instance)
+        return {'input': inputs, 'weight': max(summary.offer_count if summary else 0, 1)}
+
+    def prepare_attributes(self, instance):
+        """
+        One nested entry per attribute value of an indexed type: text, option,
+        multi-option and boolean values as keywords (text also full-text),
+        integer and float values as numbers.
+        """
+        attributes = []
+        for value in instance.attribute_values.all():
+            attribute = value.attribute
+            field = ATTRIBUTE_VALUE_FIELDS.get(attribute.type)
+            if field is None:
+                continue
+            if attribute.type == ProductAttribute.OPTION:
+                indexed = value.value_option.option if value.value_option else None
+            elif attribute.type == ProductAttribute.MULTI_OPTION:
+                indexed = [option.option for option in value.value_multi_option.all()] or None
+            elif attribute.type == ProductAttribute.BOOLEAN:
+                indexed = None if value.value_boolean is None else str(value.value_boolean).lower()
+            else:
+                indexed = value.value
+            if indexed in (None, ''):
+                continue
+            entry = {'code': attribute.code, 'type': attribute.type, field: indexed}
+            if attribute.type == ProductAttribute.TEXT:
+                entry['value_text'] = indexed
+            attributes.append(entry)
+        return attributes
+
+    def _get_category_slugs(self):
+        """treebeard path -> slug of every category, loaded once per document instance."""
+        if not hasattr(self, '_category_slugs'):
+            self._category_slugs = dict(Category.objects.values_list('path', 'slug'))
+        return self._category_slugs
+
+    def prepare_category_paths(self, instance):
+        """Slug paths of the product's categories and all their ancestors, from the materialized path."""
+        slugs = self._get_category_slugs()
+        steplen = Category.steplen
+        paths = set()
+        for category in instance.categories.all():
+            ancestors = [
+                slugs.get(category.path[:end]) for end in range(steplen, len(category.path) + 1, steplen)
+            ]
+            if None in ancestors:
+                continue
+            paths.update('/'.join(ancestors[:depth]) for depth in range(1, len(ancestors) + 1))
+        return sorted(paths)
+
+    def prepare_thumbnail(self, instance):
+        """URL of the first image by display order: its thumbnail rendition, else the original."""
+        ignored = getattr(self, '_related_instance_to_ignore', None)
+        for image in instance.images.all():
+            if isinstance(ignored, ProductImage) and image.pk == ignored.pk:
+                continue
+            thumbnail = get_thumbnail(image)
+            if thumbnail is not None:
+                return thumbnail.file.url
+            return image.original.url if image.original else None
+        return None
 
     def prepare_price(self, instance):
-        """Get the lowest price for the product."""
-        stockrecord = instance.stockrecords.order_by('price').first()
-        return float(stockrecord.price) if stockrecord else None
+        """Get the price of the best offer, the one partner_* and location_* describe."""
+        summary = self._get_summary(instance)
+        return float(summary.best_price) if summary and summary.best_price is not None else None
 
     def prepare_price_currency(self, instance):
-        """Get the currency from the first stockrecord."""
-        stockrecord = instance.stockrecords.first()
-        return stockrecord.price_currency if stockrecord else None
+        """Get the currency of the best offer."""
+        summary = self._get_summary(instance)
+        return (summary.price_currency or None) if summary else None
 
     def prepare_num_in_stock(self, instance):
-        """Get the stock count from the first stockrecord."""
-        stockrecord = instance.stockrecords.first()
-        return stockrecord.num_in_stock if stockrecord else 0
+        """Get the stock count summed over all offers."""
+        summary = self._get_summary(instance)
+        return summary.total_stock if summary else 0
 
     def prepare_partner_name(self, instance):
-        """Get the partner name from the first stockrecord."""
-        stockrecord = instance.stockrecords.select_related('partner').first()
-        return stockrecord.partner.name if stockrecord else None
+        """Get the partner name of the best offer."""
+        summary = self._get_summary(instance)
+        return summary.cheapest_partner.name if summary and summary.cheapest_partner else None
 
     def prepare_partner_id(self, instance):
-        """Get the partner ID from the first stockrecord."""
-        stockrecord = instance.stockrecords.select_related('partner').first()
-        return stockrecord.partner.id if stockrecord else None
+        """Get the partner ID of the best offer."""
+        summary = self._get_summary(instance)
+        return summary.cheapest_partner_id if summary else None
 
     def prepare_location_city(self, instance):
-        """Get the warehouse city from the first stockrecord."""
-        stockrecord = instance.stockrecords.select_related('warehouse').first()
-        return stockrecord.warehouse.city if stockrecord and stockrecord.warehouse else None
+        """Get the warehouse city of the best offer."""
+        summary = self._get_summary(instance)
+        return summary.cheapest_warehouse.city if summary and summary.cheapest_warehouse else None
 
     def prepare_location_point(self, instance):
-        """Get the warehouse location from the first stockrecord."""
-        stockrecord = instance.stockrecords.select_related('warehouse').first()
-        if stockrecord and stockrecord.warehouse and stockrecord.warehouse.location:
+        """Get the warehouse location of the best offer."""
+        summary = self._get_summary(instance)
+        warehouse = summary.cheapest_warehouse if summary else None
+        if warehouse and warehouse.location:
             return {
-                'lat': stockrecord.warehouse.location.y,
-                'lon': stockrecord.warehouse.location.x
+                'lat': warehouse.location.y,
+                'lon': warehouse.location.x
             }
         return None
 
-    def get_instances_from_related(self, related_model):
-        """If related model is StockRecord, get all products with stockrecords."""
-        if related_model == StockRecord:
-            return Product.objects.filter(stockrecords__isnull=False).distinct()
-
+    def get_instances_from_related(self, related_instance):
+        """
+        Resolve a changed related object to the products it affects: the
+        own product of a stock record, image, attribute value or category
+        link, the products in a category's subtree, or the products stocked
+        at a warehouse or by a partner.
+        """
+        if isinstance(related_instance, (StockRecord, ProductImage, ProductAttributeValue, ProductCategory)):
+            return related_instance.product
+        if isinstance(related_instance, Category):
+            # A renamed or moved category changes the paths of its whole subtree
+            return prefetch_for_indexing(
+                Product.objects.filter(categories__path__startswith=related_instance.path).distinct()
+            )
+        if isinstance(related_instance, Warehouse):
+            return prefetch_for_indexing(
+                Product.objects.filter(stockrecords__warehouse=related_instance).distinct()
+            )
+        if isinstance(related_instance, Partner):
+            return prefetch_for_indexing(
+                Product.objects.filter(stockrecords__partner=related_instance).distinct()
+            )
+        return None
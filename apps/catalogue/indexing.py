@@ -0,0 +1,257 @@
+import os
+import time
+import logging
+import multiprocessing
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, connections
+from django.db.models import Max, Min, Prefetch
+from django.test.utils import CaptureQueriesContext
+from elasticsearch.helpers import parallel_bulk, streaming_bulk
+from elasticsearch_dsl.connections import connections as es_connections
+from oscar.core.loading import get_model
+
+logger = logging.getLogger(__name__)
+
+Product = get_model('catalogue', 'Product')
+StockRecord = get_model('partner', 'StockRecord')
+ProductAttributeValue = get_model('catalogue', 'ProductAttributeValue')
+
+
+INDEX_GENERATION_KEY = 'search:index-generation'
+
+
+def get_index_generation():
+    """
+    Counter bumped whenever the product index changes; cached search
+    responses are keyed on it, so a bump invalidates all of them at once.
+    Seeded with the current time like bump_index_generation(): if the key
+    is culled, restarting from a small number would revive cached responses
+    of an earlier generation.
+    """
+    return caches['search'].get_or_set(INDEX_GENERATION_KEY, time.time_ns, timeout=None)
+
+
+def bump_index_generation():
+    cache = caches['search']
+    try:
+        return cache.incr(INDEX_GENERATION_KEY)
+    except ValueError:
+        # Key evicted or never set: any new value differs from the cached keys' one
+        generation = time.time_ns()
+        cache.set(INDEX_GENERATION_KEY, generation, timeout=None)
+        return generation
+
+
+def prefetch_for_indexing(queryset):
+    """
+    Loads everything ProductDocument.prepare() needs for a whole chunk of
+    products in a fixed number of queries (products joined with their
+    product class and best-offer summary, stock records with partners and
+    warehouses, attribute values with their attributes and options,
+    categories, images with their renditions).
+    """
+    return queryset.select_related(
+        'product_class',
+        'offer_summary__cheapest_partner',
+        'offer_summary__cheapest_warehouse',
+    ).prefetch_related(
+        Prefetch(
+            'stockrecords',
+            queryset=StockRecord.objects.select_related('partner', 'warehouse').order_by('pk'),
+        ),
+        Prefetch(
+            'attribute_values',
+            queryset=ProductAttributeValue.objects.select_related('attribute', 'value_option')
+            .prefetch_related('value_multi_option'),
+        ),
+        'categories',
+        'images__renditions',
+    )
+
+
+def iter_product_chunks(queryset, chunk_size=500):
+    """
+    Yields lists of products ordered by pk, using keyset pagination
+    (pk > last_pk) so deep chunks cost the same as the first one.
+    """
+    queryset = queryset.order_by('pk')
+    last_pk = 0
+    while True:
+        chunk = list(queryset.filter(pk__gt=last_pk)[:chunk_size])
+        if not chunk:
+            return
+        yield chunk
+        last_pk = chunk[-1].pk
+
+
+def product_actions(document, products, index=None):
+    """Builds bulk 'index' actions for already loaded products."""
+    index = index or document._index._name
+    for product in products:
+        yield {
+            '_op_type': 'index',
+            '_index': index,
+            '_id': product.pk,
+            '_source': document.prepare(product),
+        }
+
+
+class IndexingStats:
+    """Throughput and query-count counters collected while indexing."""
+
+    def __init__(self, label=''):
+        self.label = label
+        self.docs = 0
+        self.errors = 0
+        self.chunk_queries = []
+        self.started = time.monotonic()
+        self.finished = None
+
+    def add_chunk(self, docs, queries):
+        self.docs += docs
+        self.chunk_queries.append(queries)
+
+    def add_error(self, item):
+        if not self.errors:
+            logger.warning(f"Product failed to index: {item}")
+        self.errors += 1
+
+    def finish(self):
+        self.finished = time.monotonic()
+        return self
+
+    def merge(self, other):
+        self.docs += other.docs
+        self.errors += other.errors
+        self.chunk_queries.extend(other.chunk_queries)
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.monotonic()) - self.started
+
+    @property
+    def indexed(self):
+        return self.docs - self.errors
+
+    @property
+    def docs_per_sec(self):
+        return self.indexed / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def chunks(self):
+        return len(self.chunk_queries)
+
+    @property
+    def avg_queries_per_chunk(self):
+        return sum(self.chunk_queries) / self.chunks if self.chunks else 0.0
+
+    @property
+    def max_queries_per_chunk(self):
+        return max(self.chunk_queries, default=0)
+
+    def summary(self):
+        return (
+            f"{self.indexed} docs in {self.elapsed:.1f}s "
+            f"({self.docs_per_sec:.1f} docs/sec), {self.errors} errors, "
+            f"{self.chunks} chunks, queries per chunk avg {self.avg_queries_per_chunk:.1f} "
+            f"/ max {self.max_queries_per_chunk}"
+        )
+
+
+def iter_index_actions(queryset, chunk_size=500, index=None, stats=None):
+    """
+    Yields bulk actions for the given products. Each chunk is loaded with
+    prefetch_for_indexing() and prepared from memory; its SQL query count is
+    recorded in `stats`.
+    """
+    from .documents import ProductDocument
+
+    document = ProductDocument()
+    chunks = iter_product_chunks(prefetch_for_indexing(queryset), chunk_size)
+    while True:
+        with CaptureQueriesContext(connection) as ctx:
+            products = next(chunks, None)
+            if products is None:
+                return
+            actions = list(product_actions(document, products, index=index))
+        if stats is not None:
+            stats.add_chunk(len(actions), len(ctx.captured_queries))
+        yield from actions
+
+
+def index_products(queryset, chunk_size=500, index=None, stats=None, thread_count=1):
+    """
+    Indexes the given products into `index` (the ProductDocument index by
+    default). With thread_count > 1 bulk requests are sent by parallel_bulk
+    worker threads while the next chunks are being prepared.
+    """
+    from .documents import ProductDocument
+
+    client = ProductDocument._get_connection()
+    stats = stats or IndexingStats()
+    actions = iter_index_actions(queryset, chunk_size=chunk_size, index=index, stats=stats)
+    if thread_count > 1:
+        results = parallel_bulk(
+            client, actions, thread_count=thread_count, chunk_size=chunk_size, raise_on_error=False
+        )
+    else:
+        results = streaming_bulk(client, actions, chunk_size=chunk_size, raise_on_error=False)
+    for ok, item in results:
+        if not ok:
+            stats.add_error(item)
+    return stats.finish()
+
+
+def split_pk_range(queryset, shards):
+    """Splits the pk range of `queryset` into `shards` half-open [lo, hi) ranges."""
+    bounds = queryset.aggregate(lo=Min('pk'), hi=Max('pk'))
+    if bounds['lo'] is None:
+        return []
+    lo, hi = bounds['lo'], bounds['hi'] + 1
+    step = max(1, -(-(hi - lo) // shards))
+    return [(start, min(start + step, hi)) for start in range(lo, hi, step)]
+
+
+def reset_es_connections():
+    """Drops Elasticsearch clients inherited from the parent process."""
+    for alias, kwargs in settings.ELASTICSEARCH_DSL.items():
+        try:
+            es_connections.remove_connection(alias)
+        except KeyError:
+            pass
+        es_connections.create_connection(alias, **kwargs)
+
+
+def _index_shard(args):
+    lo, hi, chunk_size, index = args
+    connections.close_all()
+    reset_es_connections()
+    stats = IndexingStats(label=f"pid {os.getpid()} pk [{lo}, {hi})")
+    index_products(
+        Product.objects.filter(pk__gte=lo, pk__lt=hi), chunk_size=chunk_size, index=index, stats=stats
+    )
+    connections.close_all()
+    return stats
+
+
+def index_products_parallel(workers, chunk_size=500, index=None, shards=None, on_shard_done=None, queryset=None):
+    """
+    Indexes the whole catalogue (or the pk range of `queryset`) with a pool
+    of `workers` processes. The pk range is split into `shards` ranges (one
+    per worker by default); each worker does its own batched DB reads and
+    streaming_bulk writes. `on_shard_done` is called with each shard's
+    IndexingStats as it finishes.
+    """
+    ranges = split_pk_range(queryset if queryset is not None else Product.objects.all(), shards or workers)
+    total = IndexingStats()
+    # Children must open their own DB connections, not share the parent's socket
+    connections.close_all()
+    with multiprocessing.get_context('fork').Pool(processes=workers) as pool:
+        tasks = [(lo, hi, chunk_size, index) for lo, hi in ranges]
+        for shard_stats in pool.imap_unordered(_index_shard, tasks):
+            total.merge(shard_stats)
+            if on_shard_done:
+                on_shard_done(shard_stats)
+    return total.finish()
@@ -0,0 +1,52 @@
+import time
+import logging
+
+from django.core.management.base import BaseCommand
+
+from apps.catalogue.renditions import generate_pending_renditions
+from apps.catalogue.search_sync import enqueue_products
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate the responsive renditions (RENDITION_WIDTHS x WebP/JPEG, or WebP/PNG with transparency) of "
+        "product images that have none for their current original. Runs "
+        "forever unless --once is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=20,
+            help="Number of images loaded per query.",
+        )
+        parser.add_argument(
+            '--interval', type=float, default=5,
+            help="Seconds to wait when no image is pending.",
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help="Process the pending images once and exit.",
+        )
+
+    def handle(self, *args, **options):
+        # Unreadable originals are retried only when the worker restarts
+        failed = set()
+        while True:
+            generated = 0
+            while True:
+                processed, batch_failed = generate_pending_renditions(
+                    batch_size=options['batch_size'], exclude=failed
+                )
+                failed.update(batch_failed)
+                # Search documents get the new thumbnail URL
+                enqueue_products(image.product_id for image in processed)
+                generated += len(processed)
+                if not processed and not batch_failed:
+                    break
+            if generated:
+                self.stdout.write(f"Generated renditions for {generated} images.")
+            if options['once']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,135 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max
+from django.utils import timezone
+from oscar.core.loading import get_model
+
+from apps.catalogue.documents import ProductDocument
+from apps.catalogue.indexing import bump_index_generation, index_products, index_products_parallel
+from apps.catalogue.search_sync import enqueue_products, get_queue_high_water, queued_product_ids_since
+
+Product = get_model('catalogue', 'Product')
+
+# Queue rows inserted shortly before the start can commit after it, with an id below the high-water mark
+CATCH_UP_MARGIN = timedelta(minutes=5)
+
+
+class Command(BaseCommand):
+    help = (
+        "Build a new versioned product index in the background, validate its "
+        "document count against the DB and atomically point the "
+        "ProductDocument alias at it. Use this instead of `search_index --rebuild`, "
+        "which deletes the live index."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=500,
+            help="Number of products loaded, prepared and sent per bulk request.",
+        )
+        parser.add_argument(
+            '--threads', type=int, default=4,
+            help="Number of parallel bulk worker threads (single process).",
+        )
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help="Number of worker processes sharding the product pk range; overrides --threads.",
+        )
+        parser.add_argument(
+            '--max-missing', type=int, default=0,
+            help="Allowed difference between DB products and indexed documents.",
+        )
+        parser.add_argument(
+            '--keep', type=int, default=1,
+            help="Number of previous versioned indices to keep for rollback.",
+        )
+
+    def handle(self, *args, **options):
+        client = ProductDocument._get_connection()
+        alias = ProductDocument._index._name
+        started = timezone.now()
+        high_water = get_queue_high_water()
+        new_index = f"{alias}_{started:%Y%m%d%H%M%S}"
+
+        # Same settings and mappings as the document, refresh disabled while loading
+        ProductDocument._index.clone(name=new_index).create()
+        client.indices.put_settings(index=new_index, body={'index': {'refresh_interval': '-1'}})
+
+        # Products created during the build are left to the queue replay, so the count check has a fixed range
+        max_pk = Product.objects.aggregate(max_pk=Max('pk'))['max_pk'] or 0
+        queryset = Product.objects.filter(pk__lte=max_pk)
+        self.stdout.write(f"Building {new_index} with products up to id {max_pk}...")
+        if options['workers'] > 1:
+            stats = index_products_parallel(
+                options['workers'], chunk_size=options['chunk_size'], index=new_index, queryset=queryset,
+                on_shard_done=lambda shard: self.stdout.write(f"  {shard.label}: {shard.summary()}"),
+            )
+        else:
+            stats = index_products(
+                queryset, chunk_size=options['chunk_size'], index=new_index, thread_count=options['threads']
+            )
+        self.stdout.write(f"Indexed {stats.summary()}")
+
+        client.indices.put_settings(index=new_index, body={'index': {'refresh_interval': None}})
+        client.indices.refresh(index=new_index)
+        indexed = client.count(index=new_index)['count']
+        expected = queryset.count()
+        # Products deleted after being indexed keep their document until the catch-up removes it
+        deleted = self._deleted_since(high_water, started, max_pk)
+        if not expected - options['max_missing'] <= indexed <= expected + deleted + options['max_missing']:
+            client.indices.delete(index=new_index)
+            raise CommandError(
+                f"{new_index} has {indexed} documents but the DB has {expected} products up to id {max_pk} "
+                f"({deleted} deleted during the build); index deleted and alias '{alias}' left unchanged."
+            )
+
+        self._swap_alias(client, alias, new_index)
+        bump_index_generation()
+        self.stdout.write(self.style.SUCCESS(f"Alias '{alias}' now points at {new_index}."))
+
+        caught_up = self._catch_up(high_water, started)
+        if caught_up:
+            self.stdout.write(f"Queued {caught_up} products changed or deleted during the rebuild.")
+        self._delete_old_indices(client, alias, new_index, options['keep'])
+
+    def _swap_alias(self, client, alias, new_index):
+        actions = [{'add': {'index': new_index, 'alias': alias}}]
+        if client.indices.exists_alias(name=alias):
+            actions = [
+                {'remove': {'index': index, 'alias': alias}}
+                for index in client.indices.get_alias(name=alias)
+            ] + actions
+        elif client.indices.exists(index=alias):
+            # Concrete index created before aliases were used; dropped in the same atomic call
+            actions.insert(0, {'remove_index': {'index': alias}})
+        client.indices.update_aliases(body={'actions': actions})
+
+    def _deleted_since(self, high_water, started, max_pk):
+        """Number of products up to `max_pk` queued since the start that no longer exist."""
+        queued = {
+            pk for pk in queued_product_ids_since(high_water, started - CATCH_UP_MARGIN) if pk <= max_pk
+        }
+        return len(queued - set(Product.objects.filter(pk__in=queued).values_list('pk', flat=True)))
+
+    def _catch_up(self, high_water, started):
+        """
+        The sync worker wrote to the old index while this one was being built.
+        Re-queue every product queued since the start (synced rows are kept
+        for SEARCH_SYNC_RETENTION_HOURS), so the worker replays them on the
+        new index. If the build outlived the retention, replay everything.
+        """
+        if timezone.now() - started >= timedelta(hours=settings.SEARCH_SYNC_RETENTION_HOURS):
+            self.stderr.write("Rebuild took longer than the queue retention, queueing every product.")
+            return enqueue_products(Product.objects.values_list('pk', flat=True))
+        return enqueue_products(queued_product_ids_since(high_water, started - CATCH_UP_MARGIN))
+
+    def _delete_old_indices(self, client, alias, current, keep):
+        versions = sorted(
+            (name for name in client.indices.get(index=f"{alias}_*") if name != current),
+            reverse=True,
+        )
+        for name in versions[keep:]:
+            client.indices.delete(index=name)
+            self.stdout.write(f"Deleted old index {name}.")
@@ -0,0 +1,63 @@
+import time
+import logging
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from elasticsearch.exceptions import ConnectionError as ESConnectionError, TransportError
+
+from apps.catalogue.search_sync import purge_synced_entries, sync_queued_products
+
+logger = logging.getLogger(__name__)
+
+# Longest wait between flushes while Elasticsearch keeps failing, in seconds
+MAX_BACKOFF = 60
+
+
+class Command(BaseCommand):
+    help = (
+        "Drain the product index queue into Elasticsearch in deduplicated bulk "
+        "batches and purge old synced entries. Runs forever unless --once is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=settings.SEARCH_SYNC_BATCH_SIZE,
+            help="Maximum number of queue rows synced per bulk request.",
+        )
+        parser.add_argument(
+            '--interval', type=float, default=settings.SEARCH_SYNC_FLUSH_INTERVAL,
+            help="Seconds to wait between flushes; changes within the interval are merged.",
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help="Drain the queue once and exit.",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        delay = options['interval']
+        last_purge = None
+        while True:
+            synced = 0
+            try:
+                while True:
+                    count = sync_queued_products(batch_size=batch_size)
+                    synced += count
+                    if count == 0:
+                        break
+            except (ESConnectionError, TransportError) as e:
+                # Queue rows stay in place; back off while the cluster is down or rejecting requests (429, 5xx)
+                delay = min(max(delay * 2, options['interval']), MAX_BACKOFF)
+                logger.error(f"Elasticsearch unavailable, retrying in {delay}s: {e}")
+            else:
+                delay = options['interval']
+            if synced:
+                self.stdout.write(f"Synced {synced} products.")
+            if last_purge is None or time.monotonic() - last_purge > 3600:
+                purged = purge_synced_entries()
+                if purged:
+                    logger.info(f"Purged {purged} synced queue entries.")
+                last_purge = time.monotonic()
+            if options['once']:
+                break
+            time.sleep(delay)
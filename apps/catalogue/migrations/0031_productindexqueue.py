@@ -0,0 +1,26 @@
+# Generated by Django 4.2.20 on 2026-10-18 09:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalogue', '0030_alter_product_options_product_condition'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductIndexQueue',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('product_id', models.BigIntegerField(db_index=True, verbose_name='Product ID')),
+                ('date_queued', models.DateTimeField(auto_now_add=True, verbose_name='Date queued')),
+            ],
+            options={
+                'verbose_name': 'Product index queue entry',
+                'verbose_name_plural': 'Product index queue',
+                'ordering': ['id'],
+            },
+        ),
+    ]
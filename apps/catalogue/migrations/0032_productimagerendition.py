@@ -0,0 +1,32 @@
+# Generated by Django 4.2.20 on 2026-10-18 16:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalogue', '0031_productindexqueue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductImageRendition',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=255, verbose_name='Source file')),
+                ('format', models.CharField(choices=[('webp', 'WebP'), ('jpeg', 'JPEG')], max_length=10, verbose_name='Format')),
+                ('width', models.PositiveIntegerField(verbose_name='Width')),
+                ('height', models.PositiveIntegerField(verbose_name='Height')),
+                ('file', models.ImageField(max_length=255, upload_to='images/renditions/%Y/%m/', verbose_name='File')),
+                ('image', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='renditions', to='catalogue.productimage', verbose_name='Product image')),
+            ],
+            options={
+                'verbose_name': 'Product image rendition',
+                'verbose_name_plural': 'Product image renditions',
+                'ordering': ['image', 'format', 'width'],
+                'unique_together': {('image', 'format', 'width')},
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.20 on 2026-10-18 17:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalogue', '0032_productimagerendition'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageBlob',
+            fields=[
+                ('sha256', models.CharField(max_length=64, primary_key=True, serialize=False, verbose_name='SHA-256')),
+                ('file', models.ImageField(max_length=255, unique=True, upload_to='', verbose_name='File')),
+                ('size', models.PositiveBigIntegerField(verbose_name='Size in bytes')),
+                ('width', models.PositiveIntegerField(blank=True, null=True, verbose_name='Width')),
+                ('height', models.PositiveIntegerField(blank=True, null=True, verbose_name='Height')),
+                ('ref_count', models.PositiveIntegerField(db_index=True, default=0, verbose_name='References')),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+                ('date_updated', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Image blob',
+                'verbose_name_plural': 'Image blobs',
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.20 on 2026-10-18 18:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalogue', '0033_imageblob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productindexqueue',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='Failed attempts'),
+        ),
+        migrations.AddField(
+            model_name='productindexqueue',
+            name='last_error',
+            field=models.TextField(blank=True, verbose_name='Last error'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.20 on 2026-10-18 19:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalogue', '0034_productindexqueue_attempts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productindexqueue',
+            name='date_synced',
+            field=models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='Date synced'),
+        ),
+    ]
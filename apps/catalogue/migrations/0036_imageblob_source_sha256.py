@@ -0,0 +1,19 @@
+# Generated by Django 4.2.20 on 2026-10-18 20:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalogue', '0035_productindexqueue_date_synced'),
+    ]
+
+    operations = [
+        # Existing blobs keep an empty source: only blobs stored from sanitized content are reused by upload digest
+        migrations.AddField(
+            model_name='imageblob',
+            name='source_sha256',
+            field=models.CharField(blank=True, db_index=True, max_length=64, verbose_name='Uploaded file SHA-256'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.20 on 2026-10-18 21:00
+
+from django.db import migrations, models
+from django.db.models import Q
+
+
+def delete_renditions_of_transparent_formats(apps, schema_editor):
+    # Originals that may have transparency got white-backed JPEG renditions; the worker regenerates them
+    ProductImageRendition = apps.get_model('catalogue', 'ProductImageRendition')
+    ProductImageRendition.objects.filter(Q(source__iendswith='.png') | Q(source__iendswith='.webp')).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalogue', '0036_imageblob_source_sha256'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='productimagerendition',
+            name='format',
+            field=models.CharField(choices=[('webp', 'WebP'), ('jpeg', 'JPEG'), ('png', 'PNG')], max_length=10, verbose_name='Format'),
+        ),
+        migrations.RunPython(delete_renditions_of_transparent_formats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.20 on 2026-10-18 22:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalogue', '0037_alter_productimagerendition_format'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productindexqueue',
+            name='next_attempt_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='Next attempt at'),
+        ),
+    ]
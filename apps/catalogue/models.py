@@ -50,5 +50,104 @@ class AttributeOptionGroup(AbstractAttributeOptionGroup):
 class Option(AbstractOption):
     pass
 
+class ProductIndexQueue(models.Model):
+    """
+    Products waiting to be synced to Elasticsearch. Rows are written by
+    QueuedSignalProcessor in the same transaction as the change and drained
+    in deduplicated batches by `manage.py sync_search_index`, which marks
+    them synced and purges them later.
+    """
+    id = models.BigAutoField(primary_key=True)
+    # Not a ForeignKey: deleted products must stay queued so they get removed from the index
+    product_id = models.BigIntegerField(_('Product ID'), db_index=True)
+    # Failed syncs are re-queued with attempts + 1; rows at SEARCH_SYNC_MAX_ATTEMPTS are kept but skipped
+    attempts = models.PositiveSmallIntegerField(_('Failed attempts'), default=0)
+    last_error = models.TextField(_('Last error'), blank=True)
+    # Re-queued rows wait until then, backing off exponentially with attempts
+    next_attempt_at = models.DateTimeField(_('Next attempt at'), null=True, blank=True, db_index=True)
+    date_queued = models.DateTimeField(_('Date queued'), auto_now_add=True)
+    # Synced rows are kept for SEARCH_SYNC_RETENTION_HOURS so rebuild_product_index can replay them
+    date_synced = models.DateTimeField(_('Date synced'), null=True, blank=True, db_index=True)
+
+    class Meta:
+        app_label = 'catalogue'
+        ordering = ['id']
+        verbose_name = _('Product index queue entry')
+        verbose_name_plural = _('Product index queue')
+
+    def __str__(self):
+        return f"Product {self.product_id} queued at {self.date_queued}"
+
+
+class ImageBlob(models.Model):
+    """
+    Content-addressed image file shared by every ProductImage (and ready
+    ImageUpload) whose file has the same bytes. Only decoded, EXIF-stripped
+    re-encodings are stored (api.uploads.store_image), keyed by the SHA-256
+    of the stored bytes; `source_sha256` is the digest of the upload they
+    were made from, so the same upload is not decoded twice. `ref_count`
+    counts the referencing rows, unreferenced blobs are deleted with their
+    renditions by apps.catalogue.blobs.
+    """
+    sha256 = models.CharField(_('SHA-256'), max_length=64, primary_key=True)
+    source_sha256 = models.CharField(_('Uploaded file SHA-256'), max_length=64, blank=True, db_index=True)
+    file = models.ImageField(_('File'), max_length=255, unique=True)
+    size = models.PositiveBigIntegerField(_('Size in bytes'))
+    width = models.PositiveIntegerField(_('Width'), null=True, blank=True)
+    height = models.PositiveIntegerField(_('Height'), null=True, blank=True)
+    ref_count = models.PositiveIntegerField(_('References'), default=0, db_index=True)
+    date_created = models.DateTimeField(auto_now_add=True)
+    date_updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        app_label = 'catalogue'
+        verbose_name = _('Image blob')
+        verbose_name_plural = _('Image blobs')
+
+    def __str__(self):
+        return f"{self.sha256[:12]} ({self.ref_count} refs)"
+
+
+class ProductImageRendition(models.Model):
+    """
+    Resized copy of a ProductImage in one width and format, generated by
+    `manage.py generate_image_renditions` so API responses can list a
+    srcset without opening image files. `source` is the original's file
+    name at generation time: renditions of a replaced original are stale.
+    Renditions of an ImageBlob original are stored once per blob and
+    shared by all images with the same source.
+    """
+    FORMAT_WEBP = 'webp'
+    FORMAT_JPEG = 'jpeg'
+    # Instead of JPEG for originals with transparency
+    FORMAT_PNG = 'png'
+    FORMAT_CHOICES = [
+        (FORMAT_WEBP, 'WebP'),
+        (FORMAT_JPEG, 'JPEG'),
+        (FORMAT_PNG, 'PNG'),
+    ]
+
+    image = models.ForeignKey(
+        'catalogue.ProductImage',
+        on_delete=models.CASCADE,
+        related_name='renditions',
+        verbose_name=_('Product image')
+    )
+    source = models.CharField(_('Source file'), max_length=255)
+    format = models.CharField(_('Format'), max_length=10, choices=FORMAT_CHOICES)
+    width = models.PositiveIntegerField(_('Width'))
+    height = models.PositiveIntegerField(_('Height'))
+    file = models.ImageField(_('File'), upload_to='images/renditions/%Y/%m/', max_length=255)
+
+    class Meta:
+        app_label = 'catalogue'
+        ordering = ['image', 'format', 'width']
+        unique_together = [('image', 'format', 'width')]
+        verbose_name = _('Product image rendition')
+        verbose_name_plural = _('Product image renditions')
+
+    def __str__(self):
+        return f"{self.image_id} {self.width}px {self.format}"
+
 # Must come after model definitions
 from oscar.apps.catalogue.models import *  # noqa isort:skip
\ No newline at end of file
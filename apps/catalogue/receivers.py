@@ -0,0 +1,62 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+from oscar.core.loading import get_model
+
+from .attribute_schema import invalidate_schemas
+from .blobs import RENDITION_PREFIX, acquire, release
+
+ProductClass = get_model('catalogue', 'ProductClass')
+ProductAttribute = get_model('catalogue', 'ProductAttribute')
+AttributeOption = get_model('catalogue', 'AttributeOption')
+AttributeOptionGroup = get_model('catalogue', 'AttributeOptionGroup')
+ProductImage = get_model('catalogue', 'ProductImage')
+ProductImageRendition = get_model('catalogue', 'ProductImageRendition')
+
+
+@receiver(post_save, sender=ProductClass)
+@receiver(post_delete, sender=ProductClass)
+@receiver(post_save, sender=ProductAttribute)
+@receiver(post_delete, sender=ProductAttribute)
+@receiver(post_save, sender=AttributeOption)
+@receiver(post_delete, sender=AttributeOption)
+@receiver(post_save, sender=AttributeOptionGroup)
+@receiver(post_delete, sender=AttributeOptionGroup)
+def invalidate_attribute_schemas(sender, instance, **kwargs):
+    invalidate_schemas()
+
+
+@receiver(post_delete, sender=ProductImageRendition)
+def delete_rendition_file(sender, instance, **kwargs):
+    # Blob renditions are shared and deleted with their blob (blobs.collect_unreferenced_blobs)
+    if instance.file and not instance.file.name.startswith(RENDITION_PREFIX):
+        # After commit: a rolled back delete must not lose the file
+        name, storage = instance.file.name, instance.file.storage
+        transaction.on_commit(lambda: storage.delete(name))
+
+
+def _original_name(value):
+    return getattr(value, 'name', value) or ''
+
+
+@receiver(post_init, sender=ProductImage)
+def remember_original(sender, instance, **kwargs):
+    # Deferred 'original' is unknown: such saves don't move blob references
+    instance._saved_original = _original_name(instance.__dict__['original']) \
+        if 'original' in instance.__dict__ else None
+
+
+@receiver(post_save, sender=ProductImage)
+def update_blob_references(sender, instance, created, raw=False, **kwargs):
+    name = _original_name(instance.original)
+    if raw or (not created and instance._saved_original in (None, name)):
+        return
+    acquire([name])
+    if not created:
+        release([instance._saved_original])
+    instance._saved_original = name
+
+
+@receiver(post_delete, sender=ProductImage)
+def release_blob_reference(sender, instance, **kwargs):
+    release([_original_name(instance.original)])
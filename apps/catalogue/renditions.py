@@ -0,0 +1,169 @@
+import io
+import logging
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from oscar.core.loading import get_model
+from PIL import Image, ImageOps
+
+from .blobs import blob_digest, rendition_dir
+
+logger = logging.getLogger(__name__)
+
+ProductImage = get_model('catalogue', 'ProductImage')
+ProductImageRendition = get_model('catalogue', 'ProductImageRendition')
+
+RENDITION_WIDTHS = (160, 320, 640, 1280)
+RENDITION_FORMATS = {
+    ProductImageRendition.FORMAT_WEBP: ('WEBP', 'webp', {'quality': 80, 'method': 4}),
+    ProductImageRendition.FORMAT_JPEG: ('JPEG', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+    ProductImageRendition.FORMAT_PNG: ('PNG', 'png', {'optimize': True}),
+}
+# WebP (keeps alpha) plus a fallback format for browsers without WebP support
+OPAQUE_FORMATS = (ProductImageRendition.FORMAT_WEBP, ProductImageRendition.FORMAT_JPEG)
+TRANSPARENT_FORMATS = (ProductImageRendition.FORMAT_WEBP, ProductImageRendition.FORMAT_PNG)
+# Used for the serializer's thumbnail_url and the search document's thumbnail, in this order of preference
+THUMBNAIL_WIDTH = 320
+THUMBNAIL_FORMATS = (ProductImageRendition.FORMAT_JPEG, ProductImageRendition.FORMAT_PNG)
+
+
+def pending_images():
+    """Images without renditions of their current original file."""
+    return ProductImage.objects.exclude(original='').filter(
+        ~Exists(ProductImageRendition.objects.filter(image=OuterRef('pk'), source=OuterRef('original')))
+    )
+
+
+def _has_alpha(image):
+    return image.mode in ('RGBA', 'LA', 'PA') or (image.mode == 'P' and 'transparency' in image.info)
+
+
+def _convert(image, pil_format):
+    """Copy in a mode the format can encode: RGB for JPEG, RGB(A) for WebP and PNG."""
+    if pil_format == 'JPEG':
+        return image.convert('RGB') if image.mode != 'RGB' else image
+    if image.mode in ('RGB', 'RGBA'):
+        return image
+    return image.convert('RGBA' if _has_alpha(image) else 'RGB')
+
+
+def _shared_renditions(product_image):
+    """Copies of the renditions another image already has for the same blob original, without decoding."""
+    return [
+        ProductImageRendition(
+            image=product_image, source=rendition.source, format=rendition.format,
+            width=rendition.width, height=rendition.height, file=rendition.file.name,
+        )
+        for rendition in ProductImageRendition.objects.filter(source=product_image.original.name)
+        .exclude(image=product_image).distinct('format', 'width').order_by('format', 'width')
+    ]
+
+
+def _save_file(rendition, digest, content, extension):
+    if digest is None:
+        rendition.file.save(f'{rendition.image.pk}-{rendition.width}.{extension}', content, save=False)
+        return
+    # Blob renditions have fixed names; existing files hold the same bytes
+    name = f'{rendition_dir(digest)}/{rendition.width}.{extension}'
+    if not default_storage.exists(name):
+        saved = default_storage.save(name, content)
+        if saved != name:
+            default_storage.delete(saved)
+    rendition.file.name = name
+
+
+def build_renditions(product_image):
+    """
+    Returns unsaved renditions for every RENDITION_WIDTHS width (capped at
+    the original width, never upscaled) in WebP and JPEG, or in WebP and
+    PNG if the original has transparency. Originals in blob storage are decoded once per blob: other images of
+    the same blob reuse its rendition files.
+    """
+    digest = blob_digest(product_image.original.name)
+    if digest is not None:
+        shared = _shared_renditions(product_image)
+        if shared:
+            return shared
+
+    with product_image.original.open('rb') as file, Image.open(file) as original:
+        source = ImageOps.exif_transpose(original)
+        source.load()
+    widths = sorted({min(width, source.width) for width in RENDITION_WIDTHS})
+    formats = TRANSPARENT_FORMATS if _has_alpha(source) else OPAQUE_FORMATS
+
+    renditions = []
+    for width in widths:
+        height = max(1, round(source.height * width / source.width))
+        resized = source.resize((width, height), Image.Resampling.LANCZOS) if width != source.width else source
+        for format_ in formats:
+            pil_format, extension, options = RENDITION_FORMATS[format_]
+            buffer = io.BytesIO()
+            _convert(resized, pil_format).save(buffer, format=pil_format, **options)
+            rendition = ProductImageRendition(
+                image=product_image, source=product_image.original.name,
+                format=format_, width=width, height=height,
+            )
+            _save_file(rendition, digest, ContentFile(buffer.getvalue()), extension)
+            renditions.append(rendition)
+    return renditions
+
+
+def generate_renditions(product_image):
+    """
+    Replaces the image's renditions with fresh ones. The search document's
+    thumbnail points at a rendition: callers queue the product for indexing.
+    """
+    renditions = build_renditions(product_image)
+    with transaction.atomic():
+        product_image.renditions.all().delete()
+        ProductImageRendition.objects.bulk_create(renditions)
+    return renditions
+
+
+def generate_pending_renditions(batch_size=20, exclude=()):
+    """
+    Generates renditions for one batch of pending images, skipping the
+    ids in `exclude`. Returns (processed images, failed ids).
+    """
+    images = list(pending_images().exclude(pk__in=exclude).order_by('pk')[:batch_size])
+    processed, failed = [], []
+    for product_image in images:
+        try:
+            generate_renditions(product_image)
+        except (OSError, ValueError, SyntaxError, Image.DecompressionBombError) as exc:
+            logger.warning(f"Could not generate renditions for product image {product_image.pk}: {exc}")
+            failed.append(product_image.pk)
+        else:
+            processed.append(product_image)
+    return processed, failed
+
+
+def get_srcset(product_image):
+    """
+    {format: {width: url}} from the image's (prefetched) renditions, without
+    touching the files.
+    """
+    srcset = {}
+    for rendition in product_image.renditions.all():
+        if rendition.source == product_image.original.name:
+            srcset.setdefault(rendition.format, {})[rendition.width] = rendition.file.url
+    return srcset
+
+
+def get_thumbnail(product_image):
+    """
+    Rendition used as a thumbnail: THUMBNAIL_WIDTH, or the closest smaller
+    one, in the first of THUMBNAIL_FORMATS the image has. None if not
+    generated yet.
+    """
+    by_format = {}
+    for rendition in product_image.renditions.all():
+        if rendition.format in THUMBNAIL_FORMATS and rendition.source == product_image.original.name:
+            by_format.setdefault(rendition.format, []).append(rendition)
+    candidates = next((by_format[format_] for format_ in THUMBNAIL_FORMATS if format_ in by_format), None)
+    if not candidates:
+        return None
+    smaller = [rendition for rendition in candidates if rendition.width <= THUMBNAIL_WIDTH]
+    return max(smaller, key=lambda r: r.width) if smaller else min(candidates, key=lambda r: r.width)
@@ -0,0 +1,202 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+from django_elasticsearch_dsl.apps import DEDConfig
+from django_elasticsearch_dsl.signals import BaseSignalProcessor
+from elasticsearch.helpers import bulk
+from oscar.core.loading import get_model
+
+from .documents import ProductDocument
+from .indexing import bump_index_generation, prefetch_for_indexing, product_actions
+
+logger = logging.getLogger(__name__)
+
+Product = get_model('catalogue', 'Product')
+StockRecord = get_model('partner', 'StockRecord')
+ProductImage = get_model('catalogue', 'ProductImage')
+ProductAttributeValue = get_model('catalogue', 'ProductAttributeValue')
+ProductCategory = get_model('catalogue', 'ProductCategory')
+ProductIndexQueue = get_model('catalogue', 'ProductIndexQueue')
+
+# Item status of a bulk action rejected because the cluster is overloaded (es_rejected_execution)
+REJECTED_STATUS = 429
+# Longest wait before retrying a failed product, in seconds
+MAX_RETRY_DELAY = 3600
+
+
+def get_affected_product_ids(instance):
+    """IDs of the products whose search document depends on `instance`."""
+    if isinstance(instance, Product):
+        return [instance.pk]
+    if isinstance(instance, (StockRecord, ProductImage, ProductAttributeValue, ProductCategory)):
+        return [instance.product_id]
+    if instance.__class__ not in ProductDocument.django.related_models:
+        return []
+    related = ProductDocument().get_instances_from_related(instance)
+    if related is None:
+        return []
+    if isinstance(related, Product):
+        return [related.pk]
+    return list(related.prefetch_related(None).values_list('pk', flat=True))
+
+
+def enqueue_products(product_ids):
+    """Queue products for the sync worker. Runs inside the caller's transaction."""
+    product_ids = {pk for pk in product_ids if pk is not None}
+    if product_ids:
+        ProductIndexQueue.objects.bulk_create(
+            [ProductIndexQueue(product_id=pk) for pk in product_ids]
+        )
+    return len(product_ids)
+
+
+def _failed_product_ids(errors):
+    """
+    {product_id: (status, error)} from bulk item errors, ignoring deletes of
+    documents that were never indexed.
+    """
+    failed = {}
+    for error in errors:
+        op_type, item = next(iter(error.items()))
+        if op_type == 'delete' and item.get('status') == 404:
+            continue
+        failed[int(item['_id'])] = (item.get('status'), str(item.get('error') or item.get('status')))
+    return failed
+
+
+def _retry_at(now, attempts):
+    delay = settings.SEARCH_SYNC_RETRY_DELAY * 2 ** max(attempts - 1, 0)
+    return now + timedelta(seconds=min(delay, MAX_RETRY_DELAY))
+
+
+def sync_queued_products(batch_size=500):
+    """
+    Drains one batch of the queue: products that still exist are re-indexed,
+    missing ones are deleted from the index. Queue rows are marked synced
+    only if the bulk request went through, so an Elasticsearch outage just
+    leaves them queued. Products whose bulk item failed are re-queued at the
+    end with attempts + 1 and picked up again after an exponential backoff
+    (SEARCH_SYNC_RETRY_DELAY, doubled per attempt); after
+    SEARCH_SYNC_MAX_ATTEMPTS their row is kept with the last error but no
+    longer picked up. Items rejected with 429 (cluster overloaded) wait for
+    the backoff without counting an attempt. The index generation is bumped
+    afterwards to invalidate cached search responses. Returns the number of
+    distinct products processed.
+    """
+    max_attempts = settings.SEARCH_SYNC_MAX_ATTEMPTS
+    document = ProductDocument()
+    now = timezone.now()
+    with transaction.atomic():
+        rows = list(
+            ProductIndexQueue.objects.select_for_update(skip_locked=True)
+            .filter(date_synced__isnull=True, attempts__lt=max_attempts)
+            .filter(Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=now))
+            .order_by('pk')
+            .values_list('pk', 'product_id', 'attempts')[:batch_size]
+        )
+        if not rows:
+            return 0
+
+        product_ids = {product_id for _, product_id, _ in rows}
+        products = list(prefetch_for_indexing(Product.objects.filter(pk__in=product_ids)))
+        actions = list(product_actions(document, products))
+        for product_id in product_ids - {product.pk for product in products}:
+            actions.append({'_op_type': 'delete', '_index': document._index._name, '_id': product_id})
+
+        # wait_for: the changes are searchable before cached search responses are invalidated
+        _, errors = bulk(document._get_connection(), actions, raise_on_error=False, refresh='wait_for')
+        failed = _failed_product_ids(errors)
+        if failed:
+            logger.warning(f"{len(failed)} queued products failed to sync, first error: {next(iter(failed.values()))[1]}")
+
+        synced = [pk for pk, product_id, _ in rows if product_id not in failed]
+        ProductIndexQueue.objects.filter(pk__in=synced).update(date_synced=timezone.now())
+        if failed:
+            ProductIndexQueue.objects.filter(pk__in=[pk for pk, product_id, _ in rows if product_id in failed]).delete()
+            attempts = {}
+            for _, product_id, row_attempts in rows:
+                if product_id in failed:
+                    attempts[product_id] = max(attempts.get(product_id, 0), row_attempts)
+            for product_id, (status, _) in failed.items():
+                # Overload rejections say nothing about the document, they only delay it
+                if status != REJECTED_STATUS:
+                    attempts[product_id] += 1
+            ProductIndexQueue.objects.bulk_create([
+                ProductIndexQueue(
+                    product_id=product_id, attempts=attempts[product_id], last_error=error,
+                    next_attempt_at=_retry_at(now, max(attempts[product_id], 1)),
+                )
+                for product_id, (_, error) in failed.items()
+            ])
+            for product_id, (_, error) in failed.items():
+                if attempts[product_id] >= max_attempts:
+                    logger.error(f"Product {product_id} not synced after {max_attempts} attempts: {error}")
+    bump_index_generation()
+    return len(product_ids)
+
+
+def purge_synced_entries():
+    """Deletes queue rows synced more than SEARCH_SYNC_RETENTION_HOURS ago. Returns the number deleted."""
+    cutoff = timezone.now() - timedelta(hours=settings.SEARCH_SYNC_RETENTION_HOURS)
+    deleted, _ = ProductIndexQueue.objects.filter(date_synced__lt=cutoff).delete()
+    return deleted
+
+
+def queued_product_ids_since(high_water, queued_since):
+    """
+    Products queued after the queue row `high_water` or at `queued_since`
+    and later, synced or not. Used by rebuild_product_index to replay the
+    changes the worker wrote to the old index while the new one was built.
+    """
+    return set(
+        ProductIndexQueue.objects.filter(Q(pk__gt=high_water) | Q(date_queued__gte=queued_since))
+        .values_list('product_id', flat=True)
+    )
+
+
+def get_queue_high_water():
+    """Id of the latest queue row, 0 if the queue is empty."""
+    return ProductIndexQueue.objects.aggregate(high_water=Max('pk'))['high_water'] or 0
+
+
+class QueuedSignalProcessor(BaseSignalProcessor):
+    """
+    Signal processor that only records changed product IDs in
+    ProductIndexQueue, so model saves never wait on Elasticsearch.
+    """
+
+    def setup(self):
+        models.signals.post_save.connect(self.handle_save)
+        models.signals.pre_delete.connect(self.handle_pre_delete)
+        models.signals.post_delete.connect(self.handle_delete)
+        models.signals.m2m_changed.connect(self.handle_m2m_changed)
+
+    def teardown(self):
+        models.signals.post_save.disconnect(self.handle_save)
+        models.signals.pre_delete.disconnect(self.handle_pre_delete)
+        models.signals.post_delete.disconnect(self.handle_delete)
+        models.signals.m2m_changed.disconnect(self.handle_m2m_changed)
+
+    def _enqueue_for(self, instance):
+        if DEDConfig.autosync_enabled():
+            enqueue_products(get_affected_product_ids(instance))
+
+    def handle_save(self, sender, instance, **kwargs):
+        self._enqueue_for(instance)
+
+    def handle_pre_delete(self, sender, instance, **kwargs):
+        # Warehouse/Partner links are gone after the delete, resolve them now
+        if not isinstance(instance, Product):
+            self._enqueue_for(instance)
+
+    def handle_delete(self, sender, instance, **kwargs):
+        if isinstance(instance, Product):
+            self._enqueue_for(instance)
+
+    def handle_m2m_changed(self, sender, instance, action, **kwargs):
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            self._enqueue_for(instance)
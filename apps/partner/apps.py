@@ -6,4 +6,5 @@ class PartnerConfig(apps.PartnerConfig):
 
     def ready(self):
         from . import models
+        from . import receivers  # noqa
         super().ready()
@@ -0,0 +1,51 @@
+# Generated by Django 4.2.20 on 2026-10-18 10:00
+
+import django.contrib.gis.db.models.fields
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def build_summaries(apps, schema_editor):
+    from apps.partner.summaries import build_offer_summaries
+
+    Product = apps.get_model('catalogue', 'Product')
+    StockRecord = apps.get_model('partner', 'StockRecord')
+    ProductOfferSummary = apps.get_model('partner', 'ProductOfferSummary')
+    product_ids = list(Product.objects.values_list('pk', flat=True))
+    for start in range(0, len(product_ids), 1000):
+        chunk = product_ids[start:start + 1000]
+        ProductOfferSummary.objects.bulk_create(
+            build_offer_summaries(chunk, StockRecord, ProductOfferSummary)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('locations', '0001_initial'),
+        ('catalogue', '0031_productindexqueue'),
+        ('partner', '0009_rename_default_locattion_partner_default_location'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductOfferSummary',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='offer_summary', serialize=False, to='catalogue.product', verbose_name='Product')),
+                ('min_price', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True, verbose_name='Minimum price')),
+                ('price_currency', models.CharField(blank=True, max_length=12, verbose_name='Currency')),
+                ('total_stock', models.PositiveIntegerField(default=0, verbose_name='Total stock')),
+                ('offer_count', models.PositiveIntegerField(default=0, verbose_name='Number of offers')),
+                ('warehouse_locations', django.contrib.gis.db.models.fields.MultiPointField(blank=True, null=True, srid=4326, verbose_name='Warehouse locations')),
+                ('date_updated', models.DateTimeField(auto_now=True)),
+                ('best_stockrecord', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='partner.stockrecord', verbose_name='Best stock record')),
+                ('cheapest_partner', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='partner.partner', verbose_name='Cheapest partner')),
+                ('cheapest_warehouse', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='locations.warehouse', verbose_name='Cheapest offer warehouse')),
+            ],
+            options={
+                'verbose_name': 'Product offer summary',
+                'verbose_name_plural': 'Product offer summaries',
+            },
+        ),
+        migrations.RunPython(build_summaries, migrations.RunPython.noop),
+    ]
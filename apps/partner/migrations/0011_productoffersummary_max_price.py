@@ -0,0 +1,32 @@
+# Generated by Django 4.2.20 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('partner', '0010_productoffersummary'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='productoffersummary',
+            name='min_price',
+            field=models.DecimalField(blank=True, db_index=True, decimal_places=2, max_digits=12, null=True, verbose_name='Minimum price'),
+        ),
+        migrations.AddField(
+            model_name='productoffersummary',
+            name='max_price',
+            field=models.DecimalField(blank=True, db_index=True, decimal_places=2, max_digits=12, null=True, verbose_name='Maximum price'),
+        ),
+        migrations.RunSQL(
+            sql="""
+                UPDATE partner_productoffersummary AS summary
+                SET max_price = (
+                    SELECT MAX(price) FROM partner_stockrecord WHERE product_id = summary.product_id
+                );
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.20 on 2026-10-18 14:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('partner', '0011_productoffersummary_max_price'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productoffersummary',
+            name='best_price',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True, verbose_name='Best offer price'),
+        ),
+        migrations.RunSQL(
+            sql="""
+                UPDATE partner_productoffersummary AS summary
+                SET best_price = stockrecord.price
+                FROM partner_stockrecord AS stockrecord
+                WHERE stockrecord.id = summary.best_stockrecord_id;
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
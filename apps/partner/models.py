@@ -124,5 +124,74 @@ class StockRecord(AbstractStockRecord):
         verbose_name = _('Partner Stock Record')
         verbose_name_plural = _('Partner Stock Records')
 
+class ProductOfferSummary(models.Model):
+    """
+    Denormalized "best offer" of a product across all vendors' stock records.
+    Kept up to date by the StockRecord/Warehouse receivers, read by
+    ProductDocument and the product API instead of aggregating stock records.
+    """
+    product = models.OneToOneField(
+        'catalogue.Product',
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='offer_summary',
+        verbose_name=_('Product')
+    )
+    # Indexed for the price range filters of the product API (api.filters.ProductFilter);
+    # the displayed price is best_price, min_price may come from an offer out of stock
+    min_price = models.DecimalField(
+        _('Minimum price'), max_digits=12, decimal_places=2, null=True, blank=True, db_index=True
+    )
+    max_price = models.DecimalField(
+        _('Maximum price'), max_digits=12, decimal_places=2, null=True, blank=True, db_index=True
+    )
+    # Price and currency of best_stockrecord, shown with cheapest_partner/cheapest_warehouse
+    best_price = models.DecimalField(_('Best offer price'), max_digits=12, decimal_places=2, null=True, blank=True)
+    price_currency = models.CharField(_('Currency'), max_length=12, blank=True)
+    total_stock = models.PositiveIntegerField(_('Total stock'), default=0)
+    offer_count = models.PositiveIntegerField(_('Number of offers'), default=0)
+    # Cheapest in-stock offer, or the cheapest offer if none is in stock
+    best_stockrecord = models.ForeignKey(
+        'partner.StockRecord',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+        verbose_name=_('Best stock record')
+    )
+    cheapest_partner = models.ForeignKey(
+        'partner.Partner',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+        verbose_name=_('Cheapest partner')
+    )
+    cheapest_warehouse = models.ForeignKey(
+        'locations.Warehouse',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+        verbose_name=_('Cheapest offer warehouse')
+    )
+    # All warehouses stocking the product; the distance to a MultiPoint is the distance to the nearest one
+    warehouse_locations = models.MultiPointField(
+        _('Warehouse locations'),
+        srid=4326,
+        null=True,
+        blank=True
+    )
+    date_updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        app_label = 'partner'
+        verbose_name = _('Product offer summary')
+        verbose_name_plural = _('Product offer summaries')
+
+    def __str__(self):
+        return f"{self.product_id}: {self.offer_count} offers from {self.min_price}"
+
+
 # Import all the models from Oscar's partner app - THIS MUST COME LAST
 from oscar.apps.partner.models import *  # noqa isort:skip
\ No newline at end of file
@@ -0,0 +1,48 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from oscar.core.loading import get_model
+
+from apps.catalogue.search_sync import enqueue_products
+
+from .summaries import refresh_offer_summaries
+
+StockRecord = get_model('partner', 'StockRecord')
+Warehouse = get_model('locations', 'Warehouse')
+
+
+def _refresh_on_commit(product_ids):
+    """
+    Refresh after commit: a cascading product delete removes stock records
+    first, and re-creating the summary inside that transaction would break
+    the product delete. The refreshed products are queued for re-indexing
+    because the sync worker may have read the old summary meanwhile.
+    """
+    product_ids = set(product_ids)
+
+    def refresh():
+        enqueue_products(refresh_offer_summaries(product_ids))
+
+    transaction.on_commit(refresh)
+
+
+@receiver(post_save, sender=StockRecord)
+@receiver(post_delete, sender=StockRecord)
+def update_offer_summary(sender, instance, **kwargs):
+    _refresh_on_commit([instance.product_id])
+
+
+@receiver(post_save, sender=Warehouse)
+def update_warehouse_offer_summaries(sender, instance, created, **kwargs):
+    if not created:
+        _refresh_on_commit(
+            StockRecord.objects.filter(warehouse=instance).values_list('product_id', flat=True)
+        )
+
+
+@receiver(pre_delete, sender=Warehouse)
+def update_deleted_warehouse_offer_summaries(sender, instance, **kwargs):
+    # Stock records are detached with SET_NULL, which sends no signals
+    _refresh_on_commit(
+        StockRecord.objects.filter(warehouse=instance).values_list('product_id', flat=True)
+    )
@@ -0,0 +1,72 @@
+from itertools import groupby
+
+from django.contrib.gis.geos import MultiPoint
+from oscar.core.loading import get_model
+
+
+def build_offer_summaries(product_ids, stockrecord_model, summary_model):
+    """
+    Builds (unsaved) offer summaries for the given products from a single
+    stock record query. Models are passed in so data migrations can use it.
+    """
+    stockrecords = (
+        stockrecord_model.objects.filter(product_id__in=product_ids)
+        .select_related('warehouse')
+        .order_by('product_id', 'pk')
+    )
+    by_product = {
+        product_id: list(records)
+        for product_id, records in groupby(stockrecords, key=lambda sr: sr.product_id)
+    }
+    return [
+        _build_summary(summary_model, product_id, by_product.get(product_id, []))
+        for product_id in product_ids
+    ]
+
+
+def _build_summary(summary_model, product_id, stockrecords):
+    priced = [sr for sr in stockrecords if sr.price is not None]
+    in_stock = [sr for sr in priced if (sr.num_in_stock or 0) > 0]
+    best = min(in_stock or priced, key=lambda sr: (sr.price, sr.pk), default=None)
+    points = [
+        sr.warehouse.location for sr in stockrecords
+        if sr.warehouse_id and sr.warehouse.location
+    ]
+    values = dict(
+        product_id=product_id,
+        min_price=min((sr.price for sr in priced), default=None),
+        max_price=max((sr.price for sr in priced), default=None),
+        best_price=best.price if best else None,
+        price_currency=best.price_currency if best else '',
+        total_stock=sum(sr.num_in_stock or 0 for sr in stockrecords),
+        offer_count=len(stockrecords),
+        best_stockrecord_id=best.pk if best else None,
+        cheapest_partner_id=best.partner_id if best else None,
+        cheapest_warehouse_id=best.warehouse_id if best else None,
+        warehouse_locations=MultiPoint(points, srid=4326) if points else None,
+    )
+    # Historical models in older migrations may lack fields added later
+    field_names = {field.attname for field in summary_model._meta.concrete_fields}
+    return summary_model(**{name: value for name, value in values.items() if name in field_names})
+
+
+def refresh_offer_summaries(product_ids):
+    """Recomputes and upserts the offer summaries of existing products."""
+    Product = get_model('catalogue', 'Product')
+    StockRecord = get_model('partner', 'StockRecord')
+    ProductOfferSummary = get_model('partner', 'ProductOfferSummary')
+
+    product_ids = list(Product.objects.filter(pk__in=set(product_ids)).values_list('pk', flat=True))
+    if not product_ids:
+        return []
+    summaries = build_offer_summaries(product_ids, StockRecord, ProductOfferSummary)
+    ProductOfferSummary.objects.bulk_create(
+        summaries,
+        update_conflicts=True,
+        unique_fields=['product'],
+        update_fields=[
+            'min_price', 'max_price', 'best_price', 'price_currency', 'total_stock', 'offer_count', 'best_stockrecord',
+            'cheapest_partner', 'cheapest_warehouse', 'warehouse_locations', 'date_updated',
+        ],
+    )
+    return product_ids
@@ -106,6 +106,8 @@ AUTHENTICATION_BACKENDS = (
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
+    # SQL/ES/serialization metrics per request: Server-Timing in DEBUG, 'api.metrics' log otherwise
+    'api.instrumentation.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -195,7 +197,34 @@ ELASTICSEARCH_INDEX_NAMES = {
 }
 
 ELASTICSEARCH_DSL_AUTOSYNC = True
-ELASTICSEARCH_DSL_AUTO_REFRESH = True
+# Saves don't wait for an index refresh; documents become visible after ES refresh_interval
+ELASTICSEARCH_DSL_AUTO_REFRESH = False
+# Product changes are queued in the DB and synced by `manage.py sync_search_index`
+ELASTICSEARCH_DSL_SIGNAL_PROCESSOR = 'apps.catalogue.search_sync.QueuedSignalProcessor'
+SEARCH_SYNC_BATCH_SIZE = int(os.environ.get('SEARCH_SYNC_BATCH_SIZE', 500))
+SEARCH_SYNC_FLUSH_INTERVAL = float(os.environ.get('SEARCH_SYNC_FLUSH_INTERVAL', 2))
+# Bulk item failures (mapping errors, conflicts) are retried this many times
+SEARCH_SYNC_MAX_ATTEMPTS = int(os.environ.get('SEARCH_SYNC_MAX_ATTEMPTS', 5))
+# Seconds before the first retry of a failed item, doubled with every attempt
+SEARCH_SYNC_RETRY_DELAY = float(os.environ.get('SEARCH_SYNC_RETRY_DELAY', 30))
+# Synced queue rows are kept this long for rebuild_product_index to replay
+SEARCH_SYNC_RETENTION_HOURS = int(os.environ.get('SEARCH_SYNC_RETENTION_HOURS', 24))
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Anonymous search responses, the index generation counter and the attribute schemas
+    # (apps.catalogue.attribute_schema). Must be shared by the web processes and the sync
+    # worker (file/redis) for invalidation to reach every process.
+    'search': {
+        'BACKEND': os.environ.get('SEARCH_CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.environ.get('SEARCH_CACHE_LOCATION', str(BASE_DIR / 'var' / 'search_cache')),
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+}
+SEARCH_CACHE_TIMEOUT = int(os.environ.get('SEARCH_CACHE_TIMEOUT', 300))
+
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
     {'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator'},
@@ -238,6 +267,14 @@ STATIC_URL = 'static/'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Chunked product image uploads (api.uploads): chunks are streamed to the temp dir and the
+# `process_image_uploads` worker re-encodes complete files into MEDIA_ROOT
+IMAGE_UPLOAD_TEMP_DIR = os.environ.get('IMAGE_UPLOAD_TEMP_DIR', str(BASE_DIR / 'var' / 'uploads'))
+IMAGE_UPLOAD_MAX_SIZE = int(os.environ.get('IMAGE_UPLOAD_MAX_SIZE', 25 * 1024 * 1024))
+IMAGE_UPLOAD_CHUNK_SIZE = int(os.environ.get('IMAGE_UPLOAD_CHUNK_SIZE', 5 * 1024 * 1024))
+IMAGE_UPLOAD_MAX_PIXELS = int(os.environ.get('IMAGE_UPLOAD_MAX_PIXELS', 50_000_000))
+IMAGE_UPLOAD_EXPIRY_HOURS = int(os.environ.get('IMAGE_UPLOAD_EXPIRY_HOURS', 24))
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 OSCAR_SHOP_NAME = 'Statulab Clean'
@@ -261,6 +298,10 @@ LOGGING = {
         'console': {
             'class': 'logging.StreamHandler',
         },
+        # Skaičiuoja ES užklausas/laiką request'o metrikoms (api.instrumentation)
+        'es_timing': {
+            'class': 'api.instrumentation.ElasticsearchTimingHandler',
+        },
     },
     'root': {
         'handlers': ['console'],
@@ -277,5 +318,10 @@ LOGGING = {
             'level': os.getenv('DJANGO_LOG_LEVEL', 'INFO'),
             'propagate': False,
         },
+        'elasticsearch': {
+            'handlers': ['es_timing'],
+            'level': 'INFO', # Kiekviena ES užklausa logginama INFO lygiu
+            'propagate': True,
+        },
     },
 }
\ No newline at end of file
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.20 on 2026-10-18 11:00
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('locations', '0001_initial'),
+    ]
+
+    operations = [
+        # ST_DWithin(location::geography, ...) can't use the geometry index on location
+        migrations.RunSQL(
+            sql='CREATE INDEX locations_warehouse_location_geog_idx '
+                'ON locations_warehouse USING GIST ((location::geography));',
+            reverse_sql='DROP INDEX IF EXISTS locations_warehouse_location_geog_idx;',
+        ),
+    ]
@@ -0,0 +1,53 @@
+from oscar.core.loading import get_model
+
+Product = get_model('catalogue', 'Product')
+StockRecord = get_model('partner', 'StockRecord')
+Warehouse = get_model('locations', 'Warehouse')
+
+# Upper bound of warehouses considered per request, nearest first
+NEARBY_MAX_WAREHOUSES = 1000
+
+
+def nearby_in_stock_products(lon, lat, radius_km, limit=24):
+    """
+    Nearest `limit` public products that are in stock at an active warehouse
+    within `radius_km`, in one query. Each product gets `min_distance` (km)
+    to its nearest such warehouse.
+
+    ST_DWithin on location::geography uses the geography GiST index
+    (locations 0002) for an exact metric radius; the candidate warehouses
+    are then taken nearest first with the KNN `<->` operator on the plain
+    geometry GiST index.
+    """
+    sql = f"""
+        WITH origin AS (
+            SELECT ST_SetSRID(ST_MakePoint(%(lon)s, %(lat)s), 4326) AS geom
+        ), warehouses AS MATERIALIZED (
+            SELECT w.id, ST_Distance(w.location::geography, origin.geom::geography) AS distance
+            FROM {Warehouse._meta.db_table} w, origin
+            WHERE w.is_active
+              AND w.location IS NOT NULL
+              AND ST_DWithin(w.location::geography, origin.geom::geography, %(radius_m)s)
+            ORDER BY w.location <-> origin.geom
+            LIMIT %(max_warehouses)s
+        ), nearest AS (
+            SELECT s.product_id, MIN(warehouses.distance) AS distance
+            FROM warehouses
+            JOIN {StockRecord._meta.db_table} s ON s.warehouse_id = warehouses.id
+            WHERE s.num_in_stock > 0
+            GROUP BY s.product_id
+        )
+        SELECT p.*, nearest.distance / 1000.0 AS min_distance
+        FROM nearest
+        JOIN {Product._meta.db_table} p ON p.id = nearest.product_id
+        WHERE p.is_public
+        ORDER BY nearest.distance, p.id
+        LIMIT %(limit)s
+    """
+    return Product.objects.raw(sql, {
+        'lon': lon,
+        'lat': lat,
+        'radius_m': radius_km * 1000,
+        'max_warehouses': NEARBY_MAX_WAREHOUSES,
+        'limit': limit,
+    })
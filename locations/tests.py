@@ -1,3 +1,74 @@
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.gis.geos import Point
 from django.test import TestCase
+from oscar.core.loading import get_model
+
+from .models import Warehouse
+from .queries import nearby_in_stock_products
+
+Product = get_model('catalogue', 'Product')
+ProductClass = get_model('catalogue', 'ProductClass')
+Partner = get_model('partner', 'Partner')
+StockRecord = get_model('partner', 'StockRecord')
+
+# Vilniaus centras (lon, lat)
+ORIGIN = (25.28, 54.69)
+
+
+class NearbyInStockProductsTest(TestCase):
+    """ PostGIS užklausa: tik turimi sandėliuose spindulyje, artimiausi pirmi. """
+
+    @classmethod
+    def setUpTestData(cls):
+        user = get_user_model().objects.create_user(email='artimi@example.com', password='slaptas-123')
+        cls.partner = Partner.objects.create(name='Artimas', user=user)
+        cls.product_class = ProductClass.objects.create(name='Įrankiai')
+        # ~0.6 km, ~7.7 km ir ~100 km (Kaunas) nuo ORIGIN
+        cls.near = cls.create_warehouse('Centras', 25.29, 54.69)
+        cls.mid = cls.create_warehouse('Pašilaičiai', 25.40, 54.69)
+        cls.far = cls.create_warehouse('Kaunas', 23.90, 54.90)
+        cls.inactive = cls.create_warehouse('Uždarytas', 25.28, 54.69, is_active=False)
+
+    @classmethod
+    def create_warehouse(cls, name, lon, lat, is_active=True):
+        return Warehouse.objects.create(
+            partner=cls.partner, name=name, address_line='Gatvė 1', city=name, country='Lietuva',
+            location=Point(lon, lat, srid=4326), is_active=is_active,
+        )
+
+    def create_product(self, title, *stock):
+        product = Product.objects.create(product_class=self.product_class, title=title)
+        for index, (warehouse, num_in_stock) in enumerate(stock):
+            StockRecord.objects.create(
+                product=product, partner=self.partner, partner_sku=f'{title}-{index}', warehouse=warehouse,
+                price=Decimal('1.00'), num_in_stock=num_in_stock,
+            )
+        return product
+
+    def test_products_within_radius_nearest_first(self):
+        in_mid = self.create_product('vidutinis', (self.mid, 2))
+        in_near = self.create_product('artimas', (self.near, 1))
+        # Artimiausias turimas sandėlis lemia atstumą
+        in_both = self.create_product('abu', (self.mid, 4), (self.near, 3))
+        self.create_product('toli', (self.far, 5))
+        self.create_product('nėra', (self.near, 0))
+        self.create_product('uždarytas', (self.inactive, 5))
+
+        products = list(nearby_in_stock_products(*ORIGIN, radius_km=20))
+
+        self.assertEqual([product.pk for product in products], [in_near.pk, in_both.pk, in_mid.pk])
+        distances = [product.min_distance for product in products]
+        self.assertEqual(distances, sorted(distances))
+        self.assertAlmostEqual(float(distances[0]), 0.64, delta=0.05)
+        self.assertAlmostEqual(float(distances[2]), 7.7, delta=0.2)
+
+    def test_radius_and_limit(self):
+        in_near = self.create_product('artimas', (self.near, 1))
+        self.create_product('vidutinis', (self.mid, 2))
+        self.create_product('toli', (self.far, 5))
 
-# Create your tests here.
+        self.assertEqual([p.pk for p in nearby_in_stock_products(*ORIGIN, radius_km=5)], [in_near.pk])
+        self.assertEqual(len(list(nearby_in_stock_products(*ORIGIN, radius_km=200))), 3)
+        self.assertEqual([p.pk for p in nearby_in_stock_products(*ORIGIN, radius_km=200, limit=1)], [in_near.pk])